@@ -0,0 +1,542 @@
+#!/usr/bin/env python
+"""Local stand-in for the Sen2Cube JSON:API and OAuth endpoints, used by the benchmarks.
+
+Implements the parts of the API that sen2cli uses:
+  - GET/POST {base}/inference and GET/PATCH/DELETE {base}/inference/<id> with flask-rest-jsonapi style filters, sort,
+    page[size] / page[number] pagination, sparse fieldsets and meta.count
+  - POST {base}/operations (JSON:API atomic operations, only with --atomic)
+  - POST /auth/token (password and refresh_token grant, unsigned JWT access tokens) and GET /auth/userinfo
+  - GET /output/<id>/<file> with deterministic content and Range requests (only with --output-bytes)
+  - GET /_stats and POST /_stats/reset with request / byte counters
+
+Run standalone with `python benchmarks/mock_server.py --count 100000` or use MockApiServer from benchmarks/run.py.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ['ABORTED', 'CREATED', 'FAILED', 'OFFLINE', 'SCHEDULED', 'STARTED', 'SUCCEEDED']
+ATOMIC_EXT = 'https://jsonapi.org/ext/atomic'
+FIELDS = ('owner', 'factbase_id', 'knowledgebase_id', 'status', 'status_message', 'status_progress',
+          'status_timestamp', 'timestamp_created', 'timestamp_started', 'timestamp_finished', 'temp_range_start',
+          'temp_range_end', 'qgis_project_location', 'output', 'favourite', 'comment', 'output_scale_factor',
+          'area_of_interest')
+QUERY_CACHE_SIZE = 16
+OUTPUT_PATH = '/output'
+
+
+def _b64(data: dict) -> str:
+  return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+
+
+def make_access_token(username: str, lifetime: int) -> str:
+  """Unsigned JWT with the claims sen2cli reads (preferred_username, exp)."""
+  claims = {'preferred_username': username, 'exp': int(time.time()) + lifetime}
+  return f"{_b64({'alg': 'none', 'typ': 'JWT'})}.{_b64(claims)}."
+
+
+def _now() -> str:
+  return datetime.now(timezone.utc).isoformat()
+
+
+class Row(object):
+  """One inference. Slots instead of a dict keep a million rows at a few hundred MB."""
+  __slots__ = ('id',) + FIELDS
+
+  def __init__(self, id: int, **attributes):
+    self.id = id
+    for name in FIELDS:
+      setattr(self, name, attributes.get(name))
+
+  def get(self, name: str) -> Any:
+    return getattr(self, name, None)
+
+  def update(self, attributes: dict) -> None:
+    for name, value in attributes.items():
+      if name in FIELDS:
+        setattr(self, name, value)
+
+  def attributes(self, fields: Optional[List[str]] = None) -> dict:
+    return {name: getattr(self, name) for name in FIELDS if fields is None or name in fields}
+
+
+class InferenceStore(object):
+  """Deterministic synthetic inferences. Filtered / sorted id lists are cached until the next modification."""
+
+  def __init__(self, count: int = 0, seed: int = 0, aoi_size: int = 0, owner: str = 'bench.user',
+               output_bytes: int = 0):
+    self.count = count
+    self.seed = seed
+    self.aoi_size = aoi_size
+    self.output_bytes = output_bytes
+    self.owner = owner
+    self.lock = threading.Lock()
+    self.reset()
+
+  def reset(self) -> None:
+    """(Re)creates the synthetic inferences."""
+    with self.lock:
+      self.rows: Dict[int, Row] = {}
+      self.next_id = 1
+      self.version = 0
+      self._queries: Dict[Tuple[str, str], Tuple[int, List[int]]] = {}
+      rnd = random.Random(self.seed)
+      start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+      aoi = json.dumps({'type': 'Polygon', 'coordinates': [
+        [[round(rnd.uniform(9, 17), 15), round(rnd.uniform(46, 49), 15)] for _ in range(self.aoi_size)]
+      ]}) if self.aoi_size else '{}'
+      for _ in range(self.count):
+        created = (start + timedelta(minutes=self.next_id)).isoformat()
+        output = [f'{OUTPUT_PATH}/{self.next_id}/result.tif'] if self.output_bytes else []
+        self._insert(owner=self.owner,
+                     factbase_id=rnd.randint(1, 5),
+                     knowledgebase_id=rnd.randint(100, 300),
+                     status=rnd.choice(STATUSES),
+                     status_message='Synthetic inference',
+                     status_progress=rnd.randint(0, 100),
+                     status_timestamp=created,
+                     timestamp_created=created,
+                     temp_range_start='2020-03-01T00:00:00+00:00',
+                     temp_range_end='2020-08-01T23:59:59.999000+00:00',
+                     output=output,
+                     qgis_project_location=f'{OUTPUT_PATH}/{self.next_id}/project.qgz' if self.output_bytes else None,
+                     favourite=False,
+                     comment='Synthetic',
+                     output_scale_factor=1,
+                     area_of_interest=aoi)
+
+  def _insert(self, **attributes) -> Row:
+    row = Row(self.next_id, **attributes)
+    self.rows[row.id] = row
+    self.next_id += 1
+    return row
+
+  def create(self, attributes: dict) -> Row:
+    with self.lock:
+      row = self._insert(**attributes)
+      row.status_timestamp = row.timestamp_created = _now()
+      self.version += 1
+      return row
+
+  def update(self, id: int, attributes: dict) -> Optional[Row]:
+    with self.lock:
+      row = self.rows.get(id)
+      if row is not None:
+        row.update(attributes)
+        row.status_timestamp = _now()
+        self.version += 1
+      return row
+
+  def delete(self, id: int) -> Optional[Row]:
+    with self.lock:
+      row = self.rows.pop(id, None)
+      self.version += 1
+      return row
+
+  def output_size(self, path: str) -> Optional[int]:
+    """Size of an output file of an existing inference. QGIS projects are a quarter of the output size."""
+    parts = path[len(OUTPUT_PATH):].strip('/').split('/')
+    if not self.output_bytes or len(parts) != 2 or not parts[0].isdigit() or int(parts[0]) not in self.rows:
+      return None
+    return max(1, self.output_bytes // 4) if parts[1].endswith('.qgz') else self.output_bytes
+
+  def query(self, filter_str: str, sort_str: str) -> List[int]:
+    """Ids matching the filter in sort order."""
+    with self.lock:
+      cached = self._queries.get((filter_str, sort_str))
+      if cached is not None and cached[0] == self.version:
+        return cached[1]
+      rows = list(self.rows.values())
+      if filter_str:
+        flt = json.loads(filter_str)
+        rows = [row for row in rows if _match(row, flt)]
+      for column in reversed(sort_str.split(',') if sort_str else []):
+        rows.sort(key=_sort_key(column.lstrip('-')), reverse=column.startswith('-'))
+      ids = [row.id for row in rows]
+      if len(self._queries) >= QUERY_CACHE_SIZE:
+        self._queries.pop(next(iter(self._queries)))
+      self._queries[(filter_str, sort_str)] = (self.version, ids)
+      return ids
+
+
+def _match(row: Row, flt: Any) -> bool:
+  if isinstance(flt, list):
+    return all(_match(row, f) for f in flt)
+  if 'and' in flt:
+    return all(_match(row, f) for f in flt['and'])
+  if 'or' in flt:
+    return any(_match(row, f) for f in flt['or'])
+  if 'not' in flt:
+    return not _match(row, flt['not'])
+  value = row.get(flt['name'])
+  op, val = flt['op'], flt.get('val')
+  if flt['name'] == 'id':
+    val = [int(v) for v in val] if isinstance(val, list) else int(val)
+  if op in ('in', 'in_'):
+    return value in val
+  if op in ('notin_', 'not_in'):
+    return value not in val
+  if op in ('eq', '=='):
+    return value == val
+  if op in ('ne', '!='):
+    return value != val
+  if value is None:
+    return False
+  if op in ('ge', 'gte', '>='):
+    return value >= val
+  if op in ('gt', '>'):
+    return value > val
+  if op in ('le', 'lte', '<='):
+    return value <= val
+  if op in ('lt', '<'):
+    return value < val
+  if op == 'ilike':
+    return val.strip('%').lower() in str(value).lower()
+  raise ValueError(f'Unsupported op {op}')
+
+
+def _sort_key(column: str):
+  def key(row: Row):
+    value = row.get(column)
+    return (value is None, value if value is not None else 0)
+  return key
+
+
+class MockApiHandler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+  server: 'MockApiServer'
+
+  def log_message(self, format, *args):
+    logger.debug(format, *args)
+
+  def _send(self, status: int, body: Optional[dict], content_type: str = 'application/vnd.api+json',
+            headers: Optional[dict] = None) -> None:
+    payload = b'' if body is None else json.dumps(body).encode()
+    self.send_response(status)
+    self.send_header('Content-Type', content_type)
+    self.send_header('Content-Length', str(len(payload)))
+    for name, value in (headers or {}).items():
+      self.send_header(name, value)
+    self.end_headers()
+    self.wfile.write(payload)
+    self.server.count('bytes_sent', len(payload))
+
+  def _not_found(self) -> None:
+    self._send(404, {'errors': [{'status': '404', 'detail': 'Not found'}]})
+
+  def _read_body(self) -> bytes:
+    length = int(self.headers.get('Content-Length') or 0)
+    body = self.rfile.read(length) if length else b''
+    self.server.count('bytes_received', len(body))
+    return body
+
+  def _pre(self) -> bool:
+    """Counts the request, injects latency and failures. False if the request was already answered."""
+    if urlsplit(self.path).path.startswith('/_stats'):
+      self._stats()
+      return False
+    self.server.count('requests')
+    if self.server.latency:
+      time.sleep(self.server.latency)
+    if self.server.fail_rate and random.random() < self.server.fail_rate:
+      self._read_body()
+      self.server.count('injected_failures')
+      self._send(503, {'errors': [{'status': '503', 'detail': 'Injected failure'}]}, headers={'Retry-After': '0'})
+      return False
+    return True
+
+  def _stats(self) -> None:
+    if self.command == 'POST' and self.path.startswith('/_stats/reset'):
+      self.server.reset_stats()
+    self._send(200, self.server.snapshot_stats(), content_type='application/json')
+
+  def _authorized(self) -> bool:
+    if self.headers.get('Authorization', '').startswith('Bearer '):
+      return True
+    self._send(401, {'errors': [{'status': '401', 'detail': 'Unauthorized'}]})
+    return False
+
+  def _resource(self, row: Row, fields: Optional[List[str]] = None) -> dict:
+    return {'type': 'inference', 'id': str(row.id), 'attributes': row.attributes(fields),
+            'links': {'self': f'{self.server.base_path}/inference/{row.id}'}}
+
+  def _row_id(self, path: str) -> Optional[int]:
+    prefix = f'{self.server.base_path}/inference/'
+    if not path.startswith(prefix):
+      return None
+    try:
+      return int(path[len(prefix):])
+    except ValueError:
+      return None
+
+  def _output(self, path: str) -> None:
+    """Serves an output file. The content repeats the SHA-256 of the path, a `Range: bytes=<start>-[<end>]` header is
+    answered with 206 / 416. With --truncate-rate the connection is closed after half of the body."""
+    size = self.server.store.output_size(path)
+    if size is None:
+      self._not_found()
+      return
+    self.server.count('output')
+    start, end, status = 0, size - 1, 200
+    requested = self.headers.get('Range', '')
+    if requested.startswith('bytes='):
+      first, _, last = requested[len('bytes='):].partition('-')
+      start = int(first or 0)
+      end = min(int(last), size - 1) if last else size - 1
+      if start >= size or start > end:
+        self.send_response(416)
+        self.send_header('Content-Range', f'bytes */{size}')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return
+      status = 206
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/octet-stream')
+    self.send_header('Content-Length', str(end - start + 1))
+    self.send_header('Accept-Ranges', 'bytes')
+    if status == 206:
+      self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+    self.end_headers()
+    if self.server.truncate_rate and random.random() < self.server.truncate_rate:
+      end = start + (end - start) // 2
+      self.close_connection = True
+      self.server.count('truncated')
+    block = hashlib.sha256(path.encode()).digest() * 2048
+    position = start
+    while position <= end:
+      offset = position % len(block)
+      chunk = block[offset:offset + end - position + 1]
+      self.wfile.write(chunk)
+      position += len(chunk)
+    self.server.count('bytes_sent', end - start + 1)
+
+  def _token(self, body: bytes) -> None:
+    form = dict(parse_qsl(body.decode()))
+    username = form.get('username', self.server.store.owner)
+    lifetime = self.server.token_lifetime
+    self.server.count('token')
+    self._send(200, {
+      'access_token': make_access_token(username, lifetime),
+      'refresh_token': make_access_token(username, 6 * lifetime),
+      'token_type': 'Bearer',
+      'expires_in': lifetime,
+      'refresh_expires_in': 6 * lifetime,
+      'expires_at': int(time.time()) + lifetime,
+    }, content_type='application/json')
+
+  def do_POST(self):
+    if not self._pre():
+      return
+    path = urlsplit(self.path).path
+    body = self._read_body()
+    if path == self.server.token_path:
+      self._token(body)
+    elif not self._authorized():
+      return
+    elif path == f'{self.server.base_path}/operations' and self.server.atomic:
+      self._atomic(json.loads(body))
+    elif path == f'{self.server.base_path}/inference':
+      data = json.loads(body)['data']
+      attributes = data.get('attributes', {})
+      relationships = data.get('relationships', {})
+      attributes['factbase_id'] = int((relationships.get('factbase', {}).get('data') or {}).get('id') or 0)
+      attributes['knowledgebase_id'] = int((relationships.get('knowledgebase', {}).get('data') or {}).get('id') or 0)
+      attributes['status'] = 'CREATED'
+      row = self.server.store.create(attributes)
+      self.server.count('create')
+      self._send(201, {'data': self._resource(row)}, headers={'Location': self._resource(row)['links']['self']})
+    else:
+      self._not_found()
+
+  def _atomic(self, document: dict) -> None:
+    if ATOMIC_EXT not in self.headers.get('Content-Type', ''):
+      self._send(415, {'errors': [{'status': '415', 'detail': 'Unsupported media type'}]})
+      return
+    store = self.server.store
+    operations = document.get('atomic:operations', [])
+    missing = [op for op in operations
+               if int((op.get('data') or op.get('ref'))['id']) not in store.rows]
+    if len(missing) > 0:
+      self._not_found()
+      return
+    results = []
+    for operation in operations:
+      if operation['op'] == 'update':
+        row = store.update(int(operation['data']['id']), operation['data'].get('attributes', {}))
+        results.append({'data': self._resource(row)})
+      elif operation['op'] == 'remove':
+        store.delete(int(operation['ref']['id']))
+        results.append({})
+    self.server.count('atomic')
+    self.server.count('atomic_operations', len(operations))
+    self._send(200, {'atomic:results': results}, content_type=f'application/vnd.api+json;ext="{ATOMIC_EXT}"')
+
+  def do_GET(self):
+    if not self._pre():
+      return
+    url = urlsplit(self.path)
+    if url.path == self.server.userinfo_path:
+      self.server.count('userinfo')
+      self._send(200, {'preferred_username': self.server.store.owner}, content_type='application/json')
+      return
+    if url.path.startswith(f'{OUTPUT_PATH}/'):
+      self._output(url.path)
+      return
+    if not self._authorized():
+      return
+    params = dict(parse_qsl(url.query))
+    fields = params.get('fields[inference]')
+    fields = fields.split(',') if fields else None
+    base = f'{self.server.base_path}/inference'
+    row_id = self._row_id(url.path)
+    if row_id is not None:
+      row = self.server.store.rows.get(row_id)
+      self.server.count('get')
+      if row is None:
+        self._not_found()
+      else:
+        self._send(200, {'data': self._resource(row, fields)})
+      return
+    if url.path != base:
+      self._not_found()
+      return
+
+    self.server.count('list')
+    ids = self.server.store.query(params.get('filter', ''), params.get('sort', ''))
+    size = int(params.get('page[size]', self.server.default_page_size))
+    number = int(params.get('page[number]', 1))
+    links = {'self': self.path}
+    if size > 0:
+      page_ids = ids[(number - 1) * size:number * size]
+      if number * size < len(ids):
+        links['next'] = f"{base}?{urlencode({**params, 'page[number]': str(number + 1), 'page[size]': str(size)})}"
+    else:
+      page_ids = ids
+    rows = [row for row in (self.server.store.rows.get(i) for i in page_ids) if row is not None]
+    self._send(200, {'data': [self._resource(row, fields) for row in rows], 'links': links,
+                     'meta': {'count': len(ids)}})
+
+  def do_PATCH(self):
+    if not self._pre() or not self._authorized():
+      return
+    data = json.loads(self._read_body())['data']
+    row_id = self._row_id(urlsplit(self.path).path)
+    row = None if row_id is None else self.server.store.update(row_id, data.get('attributes', {}))
+    self.server.count('patch')
+    if row is None:
+      self._not_found()
+    else:
+      self._send(200, {'data': self._resource(row)})
+
+  def do_DELETE(self):
+    if not self._pre() or not self._authorized():
+      return
+    self._read_body()
+    row_id = self._row_id(urlsplit(self.path).path)
+    row = None if row_id is None else self.server.store.delete(row_id)
+    self.server.count('delete')
+    if row is None:
+      self._not_found()
+    else:
+      self._send(200, {'meta': {'message': 'Object successfully deleted'}})
+
+
+class MockApiServer(ThreadingHTTPServer):
+  daemon_threads = True
+
+  def __init__(self, address: Tuple[str, int], store: InferenceStore, latency: float = 0.0, fail_rate: float = 0.0,
+               default_page_size: int = 30, token_lifetime: int = 300, atomic: bool = False,
+               truncate_rate: float = 0.0):
+    super().__init__(address, MockApiHandler)
+    self.store = store
+    self.latency = latency
+    self.fail_rate = fail_rate
+    self.truncate_rate = truncate_rate
+    self.default_page_size = default_page_size
+    self.token_lifetime = token_lifetime
+    self.atomic = atomic
+    self.base_path = '/v1'
+    self.token_path = '/auth/token'
+    self.userinfo_path = '/auth/userinfo'
+    self._stats_lock = threading.Lock()
+    self._stats: Dict[str, int] = {}
+    self.reset_stats()
+
+  def process_request_thread(self, request, client_address):
+    self.count('connections')
+    super().process_request_thread(request, client_address)
+
+  def count(self, name: str, value: int = 1) -> None:
+    with self._stats_lock:
+      self._stats[name] = self._stats.get(name, 0) + value
+
+  def reset_stats(self) -> None:
+    with self._stats_lock:
+      self._stats = {'requests': 0, 'connections': 0, 'bytes_sent': 0, 'bytes_received': 0}
+
+  def snapshot_stats(self) -> Dict[str, int]:
+    with self._stats_lock:
+      return dict(self._stats)
+
+  @property
+  def url(self) -> str:
+    host, port = self.server_address[:2]
+    return f'http://{host}:{port}'
+
+  @property
+  def env(self) -> Dict[str, str]:
+    """Environment variables that point sen2cli to this server."""
+    return {
+      'IQ_API_BASE_URL': f'{self.url}{self.base_path}',
+      'IQ_AUTH_TOKEN_URL': f'{self.url}{self.token_path}',
+      'IQ_AUTH_USER_INFO_URL': f'{self.url}{self.userinfo_path}',
+      'IQ_OUTPUT_BASE_URL': self.url,
+      'OAUTHLIB_INSECURE_TRANSPORT': '1',
+    }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8765)
+  parser.add_argument('--count', type=int, default=10000, help="Number of synthetic inferences.")
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--aoi-size', type=int, default=0, help="Number of vertices of every area of interest.")
+  parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every request.")
+  parser.add_argument('--fail-rate', type=float, default=0.0, help="Share of requests answered with 503.")
+  parser.add_argument('--page-size', type=int, default=30, help="Page size if the client does not send page[size].")
+  parser.add_argument('--token-lifetime', type=int, default=300)
+  parser.add_argument('--atomic', action='store_true', help="Enable the JSON:API atomic operations extension.")
+  parser.add_argument('--output-bytes', type=int, default=0, help="Size of the output file of every inference.")
+  parser.add_argument('--truncate-rate', type=float, default=0.0, help="Share of output downloads cut off halfway.")
+  parser.add_argument('-v', '--verbose', action='store_true')
+  args = parser.parse_args()
+
+  logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+  started = time.perf_counter()
+  store = InferenceStore(args.count, seed=args.seed, aoi_size=args.aoi_size, output_bytes=args.output_bytes)
+  logger.info(f"Seeded {args.count} inferences in {time.perf_counter() - started:.1f}s")
+  server = MockApiServer((args.host, args.port), store, latency=args.latency, fail_rate=args.fail_rate,
+                         default_page_size=args.page_size, token_lifetime=args.token_lifetime, atomic=args.atomic,
+                         truncate_rate=args.truncate_rate)
+  for name, value in server.env.items():
+    print(f"export {name}={value}", flush=True)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""Offline throughput benchmark of the sen2cli commands against benchmarks/mock_server.py.
+
+Starts the mock server in this process, logs in once and runs every scenario as a separate sen2cli process. The
+synthetic inferences are re-seeded before every scenario, so modifying commands always see the same data.
+
+Reported per scenario: wall time, HTTP requests and requests/s, new TCP connections, peak RSS of the sen2cli process
+and bytes transferred (response + request bodies). Use --output to store the results as JSON and --compare to print the
+change against a stored run, e.g. of the previous commit:
+
+  python benchmarks/run.py --count 100000 --latency 0.005 --output before.json
+  git checkout my-branch
+  python benchmarks/run.py --count 100000 --latency 0.005 --compare before.json
+
+Peak RSS is read with os.wait4 and therefore only available on Unix.
+"""
+import argparse
+import csv
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mock_server import InferenceStore, MockApiServer  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUN_CLI = "import sys; from sen2cli import cli; cli(sys.argv[1:])"
+
+
+def scenarios(concurrency: int, manifest: str, download_dir: str) -> Dict[str, List[str]]:
+  """Name -> sen2cli arguments. Modifying scenarios are restricted to one factbase to keep them comparable. download
+  only transfers files with --output-bytes."""
+  return {
+    'ls': ['inference', 'ls'],
+    'ls-filtered': ['inference', 'ls', '--status', 'FAILED', '--factbase_id', '1'],
+    'rerun': ['inference', 'rerun', '--status', 'FAILED', '--factbase_id', '1', '--concurrency', str(concurrency)],
+    'abort': ['inference', 'abort', '--status', 'SCHEDULED', '--factbase_id', '1', '--concurrency', str(concurrency)],
+    'delete': ['inference', 'delete', '--status', 'SUCCEEDED', '--factbase_id', '1', '--concurrency',
+               str(concurrency)],
+    'create': ['inference', 'create-batch', manifest, '--concurrency', str(concurrency)],
+    'download': ['inference', 'download', '--factbase_id', '1', '--output_dir', download_dir, '--concurrency',
+                 str(concurrency)],
+  }
+
+
+def write_manifest(path: str, rows: int) -> None:
+  aoi = json.dumps({'type': 'Polygon', 'coordinates': [[[13.0, 47.8], [13.1, 47.8], [13.1, 47.9], [13.0, 47.8]]]})
+  with open(path, 'w', newline='') as manifest:
+    writer = csv.writer(manifest, delimiter=';')
+    writer.writerow(['knowledgebase_id', 'factbase_id', 'temporal_subset_start', 'temporal_subset_end',
+                     'area_of_interest', 'description'])
+    for row in range(rows):
+      writer.writerow([218, 1, '2020-03-01', '2020-08-01', aoi, f'benchmark {row}'])
+
+
+def run_cli(args: List[str], env: Dict[str, str]) -> Dict[str, float]:
+  """Runs sen2cli in a new process and returns wall time, exit code and peak RSS (MB)."""
+  started = time.perf_counter()
+  process = subprocess.Popen([sys.executable, '-c', RUN_CLI] + args, cwd=ROOT, env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  if hasattr(os, 'wait4'):
+    _, status, rusage = os.wait4(process.pid, 0)
+    ## os.waitstatus_to_exitcode is only available from Python 3.9 on
+    process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    ## ru_maxrss is in KB on Linux and in bytes on macOS
+    peak_rss = rusage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+  else:
+    process.wait()
+    peak_rss = float('nan')
+  return {'wall_s': time.perf_counter() - started, 'exit_code': process.returncode, 'peak_rss_mb': peak_rss}
+
+
+def _fmt_change(value: float, before: Optional[float]) -> str:
+  if before is None or before == 0:
+    return ''
+  return f" ({(value - before) / before * 100:+.0f}%)"
+
+
+def main() -> int:
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--count', type=int, default=10000, help="Number of synthetic inferences.")
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--aoi-size', type=int, default=0, help="Number of vertices of every area of interest.")
+  parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every request.")
+  parser.add_argument('--fail-rate', type=float, default=0.0, help="Share of requests answered with 503.")
+  parser.add_argument('--atomic', action='store_true', help="Enable the JSON:API atomic operations extension.")
+  parser.add_argument('--concurrency', type=int, default=8, help="--concurrency of the modifying commands.")
+  parser.add_argument('--create-rows', type=int, default=100, help="Rows of the create-batch manifest.")
+  parser.add_argument('--output-bytes', type=int, default=0, help="Size of the output file of every inference.")
+  parser.add_argument('--scenario', action='append', help="Only run these scenarios. Can be given multiple times.")
+  parser.add_argument('--global-args', default='', help="Extra global sen2cli options, e.g. '--async'.")
+  parser.add_argument('--output', help="Write the results as JSON to this file.")
+  parser.add_argument('--compare', help="JSON results of an earlier run to compare against.")
+  args = parser.parse_args()
+
+  store = InferenceStore(args.count, seed=args.seed, aoi_size=args.aoi_size, output_bytes=args.output_bytes)
+  server = MockApiServer(('127.0.0.1', 0), store, latency=args.latency, fail_rate=args.fail_rate, atomic=args.atomic)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+
+  before = {}
+  if args.compare:
+    with open(args.compare) as compare_file:
+      before = {result['scenario']: result for result in json.load(compare_file)['results']}
+
+  results = []
+  with tempfile.TemporaryDirectory() as config_path:
+    env = {**os.environ, **server.env, 'IQ_CLI_CONFIG_PATH': config_path,
+           'IQ_CLI_CONFIG_PATH_TOKENFILE': os.path.join(config_path, 'token.json'),
+           'S2C_USERNAME': store.owner, 'S2C_PASSWORD': 'benchmark'}
+    login = run_cli(['session', 'login'], env)
+    if login['exit_code'] != 0:
+      print("Could not log in to the mock server.", file=sys.stderr)
+      return 1
+    manifest = os.path.join(config_path, 'manifest.csv')
+    write_manifest(manifest, args.create_rows)
+
+    global_args = shlex.split(args.global_args)
+    print(f"{'scenario':<12} {'wall s':>14} {'requests':>9} {'req/s':>14} {'conns':>6} {'peak RSS MB':>16} "
+          f"{'KB sent':>16} {'KB recv':>9} {'exit':>5}")
+    download_dir = os.path.join(config_path, 'download')
+    for name, command in scenarios(args.concurrency, manifest, download_dir).items():
+      if args.scenario and name not in args.scenario:
+        continue
+      store.reset()
+      shutil.rmtree(download_dir, ignore_errors=True)
+      server.reset_stats()
+      result = run_cli(global_args + command, env)
+      stats = server.snapshot_stats()
+      result.update({
+        'scenario': name,
+        'command': ' '.join(global_args + command),
+        'requests': stats['requests'],
+        'requests_per_s': stats['requests'] / result['wall_s'] if result['wall_s'] > 0 else 0,
+        'connections': stats['connections'],
+        'kb_sent': stats['bytes_sent'] / 1024,
+        'kb_received': stats['bytes_received'] / 1024,
+      })
+      results.append(result)
+      prev = before.get(name, {})
+      print(f"{name:<12} {result['wall_s']:>8.2f}{_fmt_change(result['wall_s'], prev.get('wall_s')):>6} "
+            f"{result['requests']:>9} {result['requests_per_s']:>8.1f}"
+            f"{_fmt_change(result['requests_per_s'], prev.get('requests_per_s')):>6} {result['connections']:>6} "
+            f"{result['peak_rss_mb']:>10.1f}{_fmt_change(result['peak_rss_mb'], prev.get('peak_rss_mb')):>6} "
+            f"{result['kb_sent']:>10.1f}{_fmt_change(result['kb_sent'], prev.get('kb_sent')):>6} "
+            f"{result['kb_received']:>9.1f} {result['exit_code']:>5}")
+
+  server.shutdown()
+  if args.output:
+    with open(args.output, 'w') as output_file:
+      json.dump({'settings': vars(args), 'results': results}, output_file, indent=2)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# Startup time benchmark for sen2cli.
+#
+# Every command is started --runs times in a fresh interpreter and the median wall time is reported next to the bare
+# interpreter startup. Additionally it is checked that commands which do not talk to the API do not import any of the
+# heavy HTTP / JSON:API / OAuth dependencies. Exits with 1 on a regression, so it can be used as a CI gate:
+#
+#   python benchmarks/startup.py --runs 20 --max-overhead-ms 150
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+## Must never be imported by the commands below
+HEAVY_MODULES = ['aiohttp', 'asyncio', 'jsonapi_client', 'oauthlib', 'requests', 'requests_oauthlib', 'sqlite3']
+
+COMMANDS = [
+  ['version'],
+  ['--help'],
+  ['inference', '--help'],
+  ['inference', 'ls', '--help'],
+  ['session', '--help'],
+]
+
+RUN_CLI = "import sys; from sen2cli import cli; cli(sys.argv[1:])"
+CHECK_MODULES = """
+import json, sys
+from sen2cli import cli
+try:
+  cli(sys.argv[2:], standalone_mode=False)
+except SystemExit:
+  pass
+heavy = json.loads(sys.argv[1])
+sys.stderr.write(json.dumps([m for m in heavy if m in sys.modules]))
+"""
+
+
+def _time_ms(args: List[str], runs: int) -> List[float]:
+  timings = []
+  for _ in range(runs):
+    start = time.perf_counter()
+    subprocess.run(args, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+    timings.append((time.perf_counter() - start) * 1000)
+  return timings
+
+
+def _heavy_imports(command: List[str]) -> List[str]:
+  result = subprocess.run([sys.executable, '-c', CHECK_MODULES, json.dumps(HEAVY_MODULES)] + command, cwd=ROOT,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=False)
+  return json.loads(result.stderr.strip().splitlines()[-1])
+
+
+def main() -> int:
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--runs', type=int, default=10, help="Interpreter starts per command.")
+  parser.add_argument('--max-overhead-ms', type=float, default=None,
+                      help="Fail if the median of a command exceeds the bare interpreter startup by more than this.")
+  args = parser.parse_args()
+
+  baseline = statistics.median(_time_ms([sys.executable, '-c', 'pass'], args.runs))
+  print(f"{'command':<28} {'median ms':>10} {'min ms':>8} {'overhead ms':>12}  heavy imports")
+  print(f"{'(python -c pass)':<28} {baseline:>10.1f}")
+
+  failed = False
+  for command in COMMANDS:
+    timings = _time_ms([sys.executable, '-c', RUN_CLI] + command, args.runs)
+    median = statistics.median(timings)
+    heavy = _heavy_imports(command)
+    overhead = median - baseline
+    print(f"{' '.join(command):<28} {median:>10.1f} {min(timings):>8.1f} {overhead:>12.1f}  {', '.join(heavy) or '-'}")
+    if len(heavy) > 0:
+      failed = True
+    if args.max_overhead_ms is not None and overhead > args.max_overhead_ms:
+      failed = True
+
+  if failed:
+    print("Startup regression: heavy modules imported or overhead above --max-overhead-ms.", file=sys.stderr)
+  return 1 if failed else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,190 @@
+# Sen2CLI HTTP client shared by all commands of one invocation
+# Heavy dependencies (requests, aiohttp, jsonapi_client, oauthlib) are only imported once a request is made, so that
+# commands like `sen2cli version` or `--help` start fast.
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, ContextManager, Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+import click
+
+from .env import API_BASE_URL, AUTH_CLIENT_ID, AUTH_REFRESH_SKEW, AUTH_TOKEN_URL, AUTH_USER_INFO_URL, \
+  DEFAULT_POOL_SIZE, RATE_LIMIT, RETRY_MAX
+from .retry import RetryPolicy, TokenBucket
+from .timings import Timings
+
+if TYPE_CHECKING:
+  import aiohttp
+  import requests
+  from oauthlib.oauth2 import OAuth2Token
+
+  from .pooled_session import AsyncPooledSession, PooledSession
+
+logger = logging.getLogger(__name__)
+
+
+class Sen2CubeClient(object):
+  """Owns the session token and one pooled, keep-alive requests.Session per host.
+
+  One client is created per sen2cli invocation and handed to every inference operation, so connections are reused
+  across all requests of a command. `sen2cli shell` keeps one client for all of its commands.
+  """
+
+  def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, use_async: bool = False, timings: Optional[Timings] = None,
+               rate_limit: float = RATE_LIMIT, max_retries: int = RETRY_MAX):
+    self.pool_size = pool_size
+    self.use_async = use_async
+    self.timings = timings
+    ## shared by all requests of this client, so the limits hold across worker threads / tasks
+    self.rate_limiter = TokenBucket(rate_limit)
+    self.retry_policy = RetryPolicy(max_retries=max_retries, rate_limiter=self.rate_limiter)
+    self.token: Optional['OAuth2Token'] = None
+    self.tokenfile: Optional[str] = None
+    self._tokenfile_mtime: Optional[float] = None
+    ## Whether the API supports JSON:API atomic operations. None until the first batch was sent (see inference.atomic).
+    self.atomic_operations: Optional[bool] = None
+    self._user_info: Optional[dict] = None
+    self._http_sessions: Dict[str, 'requests.Session'] = {}
+    self._aiohttp_session: Optional['aiohttp.ClientSession'] = None
+    self._lock = threading.Lock()
+
+  def _mount_adapter(self, http_session: 'requests.Session') -> None:
+    from .pooled_session import RetryingAdapter
+    adapter = RetryingAdapter(self.rate_limiter, self.retry_policy, pool_connections=1, pool_maxsize=self.pool_size)
+    http_session.mount('http://', adapter)
+    http_session.mount('https://', adapter)
+
+  def http_session(self, url: str) -> 'requests.Session':
+    """Returns the pooled requests.Session for the host of url."""
+    import requests
+    parsed_url = urlparse(url)
+    host = f"{parsed_url.scheme}://{parsed_url.netloc}"
+    with self._lock:
+      http_session = self._http_sessions.get(host)
+      if http_session is None:
+        logger.debug(f"Creating connection pool for {host} with {self.pool_size} connections")
+        http_session = requests.Session()
+        self._mount_adapter(http_session)
+        if not self.timings is None:
+          http_session.hooks['response'].append(self.timings.response_hook)
+        self._http_sessions[host] = http_session
+      return http_session
+
+  def reserve_connections(self, count: int) -> None:
+    """Grows the connection pools so that `count` requests can be in flight at the same time."""
+    with self._lock:
+      if count > self.pool_size:
+        logger.debug(f"Growing connection pools from {self.pool_size} to {count} connections")
+        self.pool_size = count
+        for http_session in self._http_sessions.values():
+          self._mount_adapter(http_session)
+
+  def phase(self, name: str) -> ContextManager:
+    """Times its body as phase `name` if --timings is enabled. See Timings.phase."""
+    return nullcontext() if self.timings is None else self.timings.phase(name)
+
+  def load_token(self, tokenfile: str) -> Optional['OAuth2Token']:
+    """Loads (and refreshes if necessary) the token used for all following requests.
+
+    A loaded token is reused as long as the tokenfile is unchanged and the token does not expire within
+    AUTH_REFRESH_SKEW seconds, so the commands of `sen2cli shell` do not read the tokenfile again.
+    """
+    if not self.token is None and tokenfile == self.tokenfile and _mtime(tokenfile) == self._tokenfile_mtime \
+        and time.time() + AUTH_REFRESH_SKEW < self.token['expires_at']:
+      return self.token
+    from .session.oauth_util import load_or_refresh_token
+    with self.phase('token'):
+      token = load_or_refresh_token(tokenfile, AUTH_TOKEN_URL, AUTH_CLIENT_ID)
+    if token is None or self.token is None or token['access_token'] != self.token['access_token']:
+      self._user_info = None
+    self.token = token
+    self.tokenfile = tokenfile
+    self._tokenfile_mtime = _mtime(tokenfile)
+    return self.token
+
+  def user_info(self) -> Optional[dict]:
+    """User info of the current token. See get_cached_user_info."""
+    if self._user_info is None:
+      from .session.oauth_util import get_cached_user_info
+      with self.phase('userinfo'):
+        self._user_info = get_cached_user_info(self.token, self.tokenfile, self.http_session(AUTH_USER_INFO_URL))
+    return self._user_info
+
+  @property
+  def authorization_header(self) -> dict:
+    return {'Authorization': f"{self.token['token_type']} {self.token['access_token']}"}
+
+  def api_session(self, schema: dict = None) -> 'PooledSession':
+    """Creates a jsonapi_client Session for the Sen2Cube API that uses the pooled connections."""
+    from .pooled_session import PooledSession
+    return PooledSession(self.http_session(API_BASE_URL), API_BASE_URL, schema=schema,
+                         request_kwargs=dict(headers=self.authorization_header))
+
+  def async_api_session(self, schema: dict = None) -> 'AsyncPooledSession':
+    """Creates an asyncio mode jsonapi_client Session for the Sen2Cube API. Needs to be called inside run_async or
+    iterate_async."""
+    import aiohttp
+    from .pooled_session import AsyncPooledSession
+    if self._aiohttp_session is None:
+      self._aiohttp_session = aiohttp.ClientSession(
+          connector=aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size),
+          trace_configs=[] if self.timings is None else [self.timings.trace_config()])
+      ## aiohttp resends idempotent requests once after a dropped connection (from 3.10 on). All retries are left to the
+      ## RetryPolicy, so they count against the retry budget and a retried DELETE is recognised (see RetryPolicy).
+      if hasattr(self._aiohttp_session, '_retry_connection'):
+        self._aiohttp_session._retry_connection = False
+    return AsyncPooledSession(self._aiohttp_session, API_BASE_URL, schema=schema,
+                              request_kwargs=dict(headers=self.authorization_header),
+                              rate_limiter=self.rate_limiter, retry_policy=self.retry_policy)
+
+  async def _close_async(self) -> None:
+    if self._aiohttp_session is not None:
+      await self._aiohttp_session.close()
+      self._aiohttp_session = None
+
+  def run_async(self, awaitable: Awaitable) -> Any:
+    """Runs a coroutine of the async engine to completion and returns its result."""
+    import asyncio
+
+    async def _run():
+      try:
+        return await awaitable
+      finally:
+        await self._close_async()
+
+    return asyncio.run(_run())
+
+  def iterate_async(self, async_iterator: AsyncIterator) -> Iterator:
+    """Drives an async iterator of the async engine from synchronous code, e.g. to stream its items to StdOut."""
+    import asyncio
+
+    loop = asyncio.new_event_loop()
+    try:
+      while True:
+        try:
+          yield loop.run_until_complete(async_iterator.__anext__())
+        except StopAsyncIteration:
+          break
+    finally:
+      loop.run_until_complete(async_iterator.aclose())
+      loop.run_until_complete(self._close_async())
+      loop.close()
+
+  def close(self) -> None:
+    with self._lock:
+      for http_session in self._http_sessions.values():
+        http_session.close()
+      self._http_sessions.clear()
+
+
+def _mtime(path: str) -> Optional[float]:
+  try:
+    return os.path.getmtime(path)
+  except OSError:
+    return None
+
+
+client_config = click.make_pass_decorator(Sen2CubeClient, ensure=True)
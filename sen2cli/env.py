@@ -1,18 +1,49 @@
 ## TODO(SR) make this proper click config objects
 import os
 from typing import Final
+from urllib.parse import urlsplit
 
 HOME_PATH: Final[str] = os.path.expanduser("~")
 CONFIG_PATH: Final[str] = os.environ.get('IQ_CLI_CONFIG_PATH', f"{HOME_PATH}/.sen2cli")
 CONFIG_PATH_TOKENFILE: Final[str] = os.environ.get('IQ_CLI_CONFIG_PATH_TOKENFILE', f"{CONFIG_PATH}/token.json")
+CONFIG_PATH_CACHE: Final[str] = os.environ.get('IQ_CLI_CONFIG_PATH_CACHE', f"{CONFIG_PATH}/inference_cache.sqlite")
+CONFIG_PATH_SHELL_HISTORY: Final[str] = os.environ.get('IQ_CLI_CONFIG_PATH_SHELL_HISTORY',
+                                                     f"{CONFIG_PATH}/shell_history")
 
 LOGGER_CONFIG_FILE: Final[str] = f"{CONFIG_PATH}/logger.ini"
 
 API_BASE_URL: Final[str] = os.environ.get('IQ_API_BASE_URL', "https://api.sen2cube.at/v1")
+## Base URL of relative paths in `output` / `qgis_project_location` of an inference. Defaults to the API host.
+OUTPUT_BASE_URL: Final[str] = os.environ.get('IQ_OUTPUT_BASE_URL',
+                                             "{0.scheme}://{0.netloc}".format(urlsplit(API_BASE_URL)))
 AUTH_CLIENT_ID: Final[str] = os.environ.get('IQ_AUTH_CLIENT_ID', "iq-web-client")
 AUTH_BASE_URL: Final[str] = os.environ.get('IQ_AUTH_BASE_URL',
                                            "https://auth.sen2cube.at/realms/sen2cube-at/protocol/openid-connect")
 AUTH_TOKEN_URL: Final[str] = os.environ.get('IQ_AUTH_TOKEN_URL', f"{AUTH_BASE_URL}/token")
 AUTH_USER_INFO_URL: Final[str] = os.environ.get('IQ_AUTH_USER_INFO_URL', f"{AUTH_BASE_URL}/userinfo")
+## Refresh tokens this many seconds before they expire
+AUTH_REFRESH_SKEW: Final[int] = int(os.environ.get('IQ_AUTH_REFRESH_SKEW', 30))
+## Maximum time in seconds to wait for another process refreshing the token
+AUTH_LOCK_TIMEOUT: Final[int] = int(os.environ.get('IQ_AUTH_LOCK_TIMEOUT', 60))
 
 DEFAULT_DELIMITER: Final[str] = os.environ.get('IQ_DEFAULT_CSV_DELIMITER', ";")
+DEFAULT_PAGE_SIZE: Final[int] = int(os.environ.get('IQ_DEFAULT_PAGE_SIZE', 100))
+DEFAULT_POOL_SIZE: Final[int] = int(os.environ.get('IQ_HTTP_POOL_SIZE', 10))
+## Maximum number of values of one `in` filter per request. Longer id lists are split into several requests.
+FILTER_CHUNK_SIZE: Final[int] = int(os.environ.get('IQ_FILTER_CHUNK_SIZE', 250))
+## Updates / deletes sent per request if the API supports JSON:API atomic operations (1 = one request per inference)
+ATOMIC_BATCH_SIZE: Final[int] = int(os.environ.get('IQ_ATOMIC_BATCH_SIZE', 100))
+## Client side rate limit in requests per second for all requests of one invocation (0 = unlimited) and its burst size
+RATE_LIMIT: Final[float] = float(os.environ.get('IQ_RATE_LIMIT', 0))
+RATE_LIMIT_BURST: Final[int] = int(os.environ.get('IQ_RATE_LIMIT_BURST', 10))
+## Retries per request (429, 502-504, connection errors), exponential backoff in seconds and its maximum, and the
+## maximum number of retries of all requests of one invocation together
+RETRY_MAX: Final[int] = int(os.environ.get('IQ_RETRY_MAX', 5))
+RETRY_BACKOFF: Final[float] = float(os.environ.get('IQ_RETRY_BACKOFF', 0.5))
+RETRY_MAX_BACKOFF: Final[float] = float(os.environ.get('IQ_RETRY_MAX_BACKOFF', 30))
+RETRY_BUDGET: Final[int] = int(os.environ.get('IQ_RETRY_BUDGET', 100))
+## Maximum number of grid cells when an area of interest is split into tiles (`inference create --tile_size`)
+TILE_LIMIT: Final[int] = int(os.environ.get('IQ_TILE_LIMIT', 1000))
+## Poll interval in seconds of `inference watch` / --wait and the maximum it backs off to while nothing changes
+DEFAULT_WATCH_INTERVAL: Final[float] = float(os.environ.get('IQ_WATCH_INTERVAL', 5))
+DEFAULT_WATCH_MAX_INTERVAL: Final[float] = float(os.environ.get('IQ_WATCH_MAX_INTERVAL', 60))
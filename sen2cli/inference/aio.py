@@ -0,0 +1,340 @@
+# Asyncio engine for the inference operations. Mirrors get / update / delete / create on top of the asyncio mode of
+# jsonapi_client, so hundreds of requests can be in flight without a thread per request.
+import asyncio
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Iterable, List, Optional, Tuple, Union
+
+from jsonapi_client import Session
+from jsonapi_client.exceptions import DocumentError
+from jsonapi_client.resourceobject import ResourceObject
+
+from .atomic import apply_results, batches, is_unsupported, operation
+from .create import _build_inference, _format_date
+from .get import inference_urls, resource_sort_key, skipped_count, update_urls
+from .util import DEFAULT_COLUMNS, INFERENCE_SCHEMA, OperationSummary
+from ..client import Sen2CubeClient
+from ..env import ATOMIC_BATCH_SIZE, DEFAULT_PAGE_SIZE
+from ..utils import dict_from_resource, map_concurrent_async, merge_sorted_async
+
+logger = logging.getLogger(__name__)
+
+
+async def iterate_pages_async(session: Session, url: str, prefetch: bool = False,
+                              json_data: Optional[dict] = None) -> AsyncIterator[ResourceObject]:
+  """
+  Async version of iterate_pages.
+
+  :param session: Session in asyncio mode used for fetching the pages.
+  :param url: URL of the first page including all query parameters.
+  :param prefetch: Fetch the next page in the background while the current one is being consumed.
+  :param json_data: The first page, if it was already fetched.
+  :return: Async iterator over all resources of all pages.
+  """
+  json_data = await session._fetch_json_async(url) if json_data is None else json_data
+  page = 1
+  while True:
+    document = session.read(json_data, url, no_cache=True)
+    session.documents_by_link.pop(url, None)
+    logger.info(f"Page {page} loaded: {len(document.resources)} inferences")
+    next_url = document.links.next.url if document.links.next and len(document.resources) > 0 else None
+    next_page: Optional[asyncio.Future] = None
+    if next_url is not None and prefetch:
+      next_page = asyncio.ensure_future(session._fetch_json_async(next_url))
+    try:
+      for resource in document.resources:
+        yield resource
+    except BaseException:
+      if next_page is not None:
+        next_page.cancel()
+      raise
+
+    if next_url is None:
+      break
+    json_data = await next_page if next_page is not None else await session._fetch_json_async(next_url)
+    url = next_url
+    page += 1
+
+
+async def get_inference_async(client: Sen2CubeClient,
+                              id: Union[int, List, tuple, None] = None,
+                              factbase_id: Union[int, List, tuple, None] = None,
+                              knowledgebase_id: Union[int, List, tuple, None] = None,
+                              status: Union[str, List, tuple, None] = None,
+                              sort_by: str = None,
+                              raw_modifier: str = None,
+                              page_size: Optional[int] = DEFAULT_PAGE_SIZE,
+                              prefetch: bool = False,
+                              columns: Optional[List[str]] = None
+                              ) -> AsyncIterator[ResourceObject]:
+  """Async version of get_inference."""
+  async with client.async_api_session() as session:
+    try:
+      urls = inference_urls(session.url_prefix, id, factbase_id, knowledgebase_id, status, sort_by, raw_modifier,
+                            page_size, columns)
+      if len(urls) == 1:
+        chunks = iterate_pages_async(session, urls[0], prefetch=prefetch)
+      else:
+        first_pages = await asyncio.gather(*(session._fetch_json_async(url) for url in urls))
+        iterators = [iterate_pages_async(session, url, prefetch=prefetch, json_data=json_data)
+                     for url, json_data in zip(urls, first_pages)]
+        chunks = _chain_async(iterators) if sort_by is None else \
+          merge_sorted_async(iterators, key=resource_sort_key(sort_by))
+      async for resource in chunks:
+        yield resource
+    except DocumentError as e:
+      logger.error(f"Could not fetch inference. Reason: {e}", exc_info=True)
+    except Exception as e:
+      logger.error(f"Could not fetch inference. Reason: {e}", exc_info=True)
+    finally:
+      await session.close()
+
+
+async def _chain_async(iterators: List[AsyncIterator]) -> AsyncIterator:
+  for iterator in iterators:
+    async for item in iterator:
+      yield item
+
+
+async def get_for_update_async(session: Session,
+                               action: str,
+                               id: Union[int, List, tuple, None] = None,
+                               factbase_id: Union[int, List, tuple, None] = None,
+                               knowledgebase_id: Union[int, List, tuple, None] = None,
+                               status: Union[str, List, tuple, None] = None,
+                               page_size: int = DEFAULT_PAGE_SIZE) -> Tuple[List[ResourceObject], int]:
+  """Async version of get_for_update."""
+  list_urls, count_urls = update_urls(session.url_prefix, action, id, factbase_id, knowledgebase_id, status, page_size)
+
+  async def _load(url: str) -> List[ResourceObject]:
+    return [res async for res in iterate_pages_async(session, url, prefetch=True)]
+
+  inferences = [res for resources in await asyncio.gather(*(_load(url) for url in list_urls)) for res in resources]
+  if len(list_urls) > 1:
+    inferences.sort(key=lambda res: int(res.id))
+  session.add_resources(*inferences)
+  count_documents = await asyncio.gather(*(session._fetch_json_async(url) for url in count_urls))
+  skipped = 0 if len(count_urls) == 0 else skipped_count(count_documents, len(inferences))
+  logger.info(f"Inferences loaded: {len(inferences)}, skipped: {skipped}")
+  return inferences, skipped
+
+
+async def commit_batched_async(client: Sen2CubeClient,
+                               session: Session,
+                               resources: List[ResourceObject],
+                               concurrency: int = 1,
+                               batch_size: int = 1
+                               ) -> AsyncIterator[Tuple[ResourceObject, Optional[Exception]]]:
+  """Async version of commit_batched."""
+  async def _commit_batch(batch: List[ResourceObject]) -> None:
+    apply_results(session, batch, await session.post_operations_async([operation(res) for res in batch]))
+
+  single: List[ResourceObject] = []
+  pending = batches(resources, batch_size)
+  if batch_size <= 1 or len(resources) <= 1 or client.atomic_operations is False:
+    single, pending = list(resources), []
+  elif client.atomic_operations is None:
+    batch = pending.pop(0)
+    try:
+      await _commit_batch(batch)
+      client.atomic_operations = True
+      for resource in batch:
+        yield resource, None
+    except Exception as e:
+      if is_unsupported(e):
+        logger.info(f"The API does not support atomic operations ({e}). Committing every inference on its own.")
+        client.atomic_operations = False
+        single, pending = list(resources), []
+      else:
+        logger.warning(f"Batch of {len(batch)} operations failed ({e}). Committing them one by one.")
+        single.extend(batch)
+
+  async for batch, _, error in map_concurrent_async(_commit_batch, pending, concurrency, ordered=False):
+    if error is None:
+      for resource in batch:
+        yield resource, None
+    else:
+      logger.warning(f"Batch of {len(batch)} operations failed ({error}). Committing them one by one.")
+      single.extend(batch)
+
+  async for resource, _, error in map_concurrent_async(lambda res: res.commit(), single, concurrency, ordered=False):
+    yield resource, error
+
+
+async def update_inference_async(client: Sen2CubeClient,
+                                 id: Union[int, List, tuple, None] = None,
+                                 factbase_id: Union[int, List, tuple, None] = None,
+                                 knowledgebase_id: Union[int, List, tuple, None] = None,
+                                 status: Union[str, List, tuple, None] = None,
+                                 new_status: str = None,
+                                 dry_run: bool = False,
+                                 concurrency: int = 1,
+                                 summary: OperationSummary = None,
+                                 page_size: int = DEFAULT_PAGE_SIZE,
+                                 batch_size: int = ATOMIC_BATCH_SIZE
+                                 ) -> List[dict]:
+  """Async version of update_inference."""
+  summary = OperationSummary() if summary is None else summary
+  client.reserve_connections(concurrency)
+  async with client.async_api_session() as session:
+    try:
+      with client.phase('fetch'):
+        inferences, summary.skipped = await get_for_update_async(session, new_status, id, factbase_id,
+                                                                 knowledgebase_id, status, page_size)
+      if summary.skipped > 0:
+        logger.warning(f"Skipped {summary.skipped} inferences whose status can not be set to {new_status}.")
+      for inference in inferences:
+        inference.status = new_status
+
+      if dry_run:
+        logger.info("Dry run. Skipping commit.")
+        summary.succeeded = len(inferences)
+        return [dict_from_resource(res, DEFAULT_COLUMNS) for res in inferences]
+
+      updated_inferences = []
+      with client.phase('commit'):
+        async for inference, error in commit_batched_async(client, session, inferences, concurrency, batch_size):
+          if error is None:
+            summary.succeeded += 1
+            updated_inferences.append(inference)
+          else:
+            summary.failed += 1
+            logger.error(f"Could not set new status for inference {inference.id}. Reason: {error}")
+
+      ## batches complete in any order
+      position = {res.id: index for index, res in enumerate(inferences)}
+      updated_inferences.sort(key=lambda res: position[res.id])
+      return [dict_from_resource(res, DEFAULT_COLUMNS) for res in updated_inferences]
+    except DocumentError as e:
+      logger.error(f"Could not update inference. Reason: {e}", exc_info=True)
+    except Exception as e:
+      logger.error(f"Could not update inference. Reason: {e}", exc_info=True)
+    finally:
+      await session.close()
+
+
+async def delete_inference_async(client: Sen2CubeClient,
+                                 id: Union[int, List, tuple, None] = None,
+                                 factbase_id: Union[int, List, tuple, None] = None,
+                                 knowledgebase_id: Union[int, List, tuple, None] = None,
+                                 status: Union[str, List, tuple, None] = None,
+                                 dry_run: bool = False,
+                                 concurrency: int = 1,
+                                 summary: OperationSummary = None,
+                                 page_size: int = DEFAULT_PAGE_SIZE,
+                                 batch_size: int = ATOMIC_BATCH_SIZE
+                                 ) -> AsyncIterator[dict]:
+  """Async version of delete_inference."""
+  summary = OperationSummary() if summary is None else summary
+  client.reserve_connections(concurrency)
+  async with client.async_api_session() as session:
+    try:
+      with client.phase('fetch'):
+        inferences, summary.skipped = await get_for_update_async(session, 'DELETE', id, factbase_id, knowledgebase_id,
+                                                                 status, page_size)
+      if summary.skipped > 0:
+        logger.warning(f"Skipped {summary.skipped} inferences that can not be deleted in their status.")
+
+      if dry_run:
+        logger.info("Dry run. Skipping commit.")
+        for inference in inferences:
+          summary.succeeded += 1
+          yield dict_from_resource(inference, DEFAULT_COLUMNS)
+        return
+
+      for inference in inferences:
+        inference.delete()
+      async for inference, error in commit_batched_async(client, session, inferences, concurrency, batch_size):
+        if error is None:
+          summary.succeeded += 1
+          yield dict_from_resource(inference, DEFAULT_COLUMNS)
+        else:
+          summary.failed += 1
+          logger.error(f"Could not delete inference {inference.id}. Reason: {error}")
+    except DocumentError as e:
+      logger.error(f"Could not delete inference. Reason: {e}", exc_info=True)
+    except Exception as e:
+      logger.error(f"Could not delete inference. Reason: {e}", exc_info=True)
+    finally:
+      await session.close()
+
+
+async def _user_info_async(client: Sen2CubeClient) -> Optional[dict]:
+  """client.user_info in a worker thread. It can fetch the user info synchronously, which would block the event loop
+  and every request in flight."""
+  return await asyncio.get_running_loop().run_in_executor(None, client.user_info)
+
+
+async def create_inference_async(client: Sen2CubeClient,
+                                 factbase_id: int,
+                                 knowldegebase_id: int,
+                                 temp_range_start: datetime,
+                                 temp_range_end: datetime,
+                                 spatial_subset: str,
+                                 description: str,
+                                 dry_run: bool = False,
+                                 ) -> dict:
+  """Async version of create_inference."""
+  user_info = await _user_info_async(client)
+
+  async with client.async_api_session(schema=INFERENCE_SCHEMA) as session:
+    try:
+      inference = _build_inference(session, user_info['preferred_username'], factbase_id, knowldegebase_id,
+                                   temp_range_start, temp_range_end, spatial_subset, description)
+      if not dry_run:
+        await inference.commit()
+      else:
+        logger.info("Dry run. Skipping commit")
+      return dict_from_resource(inference, DEFAULT_COLUMNS)
+    except DocumentError as e:
+      logger.error(f"Could not create inference. Reason: {e}", exc_info=True)
+    except Exception as e:
+      logger.error(f"Could not create inference. Reason: {e}", exc_info=True)
+    finally:
+      await session.close()
+
+
+async def create_inferences_async(client: Sen2CubeClient,
+                                  manifest_rows: Iterable[dict],
+                                  dry_run: bool = False,
+                                  concurrency: int = 1,
+                                  summary: OperationSummary = None
+                                  ) -> AsyncIterator[dict]:
+  """Async version of create_inferences."""
+  summary = OperationSummary() if summary is None else summary
+  user_info = await _user_info_async(client)
+  client.reserve_connections(concurrency)
+
+  async with client.async_api_session(schema=INFERENCE_SCHEMA) as session:
+    async def _create(row: dict) -> ResourceObject:
+      if row['error'] is not None:
+        raise ValueError(row['error'])
+      inference = _build_inference(session, user_info['preferred_username'], row['factbase_id'],
+                                   row['knowledgebase_id'], row['temp_range_start'], row['temp_range_end'],
+                                   row['spatial_subset'], row['description'])
+      if not dry_run:
+        await inference.commit()
+      return inference
+
+    try:
+      if dry_run:
+        logger.info("Dry run. Skipping commit")
+      async for row, inference, error in map_concurrent_async(_create, manifest_rows, concurrency):
+        if error is None:
+          summary.succeeded += 1
+        else:
+          summary.failed += 1
+          logger.error(f"Could not create inference for manifest row {row['row']}. Reason: {error}")
+        yield {
+          'row': row['row'],
+          'id': None if inference is None else inference.id,
+          'status': None if inference is None else inference.status,
+          'knowledgebase_id': row['knowledgebase_id'],
+          'factbase_id': row['factbase_id'],
+          'temp_range_start': _format_date(row['temp_range_start']),
+          'temp_range_end': _format_date(row['temp_range_end']),
+          'description': row['description'],
+          'error': None if error is None else str(error),
+        }
+    finally:
+      await session.close()
@@ -0,0 +1,409 @@
+# Preprocessing of areas of interest (GeoJSON) before they are sent to the API: local validation, rounding of the
+# coordinates, Douglas-Peucker simplification, minified serialisation and splitting into tiles.
+import json
+import math
+from typing import Any, Iterator, List, Optional, TextIO, Tuple, Union
+
+from ..env import TILE_LIMIT
+
+## Geometry types that describe an area. Every geometry of an area of interest has to be one of them.
+AREA_TYPES: List[str] = ['Polygon', 'MultiPolygon']
+GEOMETRY_TYPES: List[str] = ['Point', 'MultiPoint', 'LineString', 'MultiLineString', 'Polygon', 'MultiPolygon',
+                             'GeometryCollection']
+TILE_UNITS: List[str] = ['km', 'deg']
+## Kilometres per degree of latitude and per degree of longitude at the equator (WGS84)
+KM_PER_DEGREE_LAT: float = 110.574
+KM_PER_DEGREE_LON: float = 111.320
+
+BBox = Tuple[float, float, float, float]
+
+
+class AoiStats(object):
+  """Size of an area of interest before and after preprocessing."""
+
+  def __init__(self):
+    self.bytes_in = 0
+    self.bytes_out = 0
+    self.vertices_in = 0
+    self.vertices_out = 0
+
+  def add(self, other: 'AoiStats') -> None:
+    self.bytes_in += other.bytes_in
+    self.bytes_out += other.bytes_out
+    self.vertices_in += other.vertices_in
+    self.vertices_out += other.vertices_out
+
+  def __str__(self):
+    change = f" ({(self.bytes_out - self.bytes_in) / self.bytes_in * 100:+.0f}%)" if self.bytes_in > 0 else ''
+    return f"{_format_bytes(self.bytes_in)} -> {_format_bytes(self.bytes_out)}{change}, " \
+           f"{self.vertices_in} -> {self.vertices_out} vertices"
+
+
+def _format_bytes(size: int) -> str:
+  for unit in ['B', 'KB', 'MB']:
+    if size < 1024 or unit == 'MB':
+      return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+    size /= 1024
+
+
+def _reject_constant(name: str) -> None:
+  raise ValueError(f"Invalid JSON: {name} is not a valid coordinate")
+
+
+def _is_number(value: Any) -> bool:
+  return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _validate_ring(ring: Any, where: str) -> None:
+  if not isinstance(ring, list) or len(ring) < 4:
+    raise ValueError(f"{where}: a linear ring needs at least 4 positions")
+  for i, position in enumerate(ring):
+    if not isinstance(position, list) or len(position) < 2 or not all(_is_number(c) for c in position):
+      raise ValueError(f"{where}[{i}]: invalid position {json.dumps(position)[:60]}")
+    if not (-180 <= position[0] <= 180 and -90 <= position[1] <= 90):
+      raise ValueError(f"{where}[{i}]: position {position} is outside of the WGS84 bounds (lon, lat)")
+  if ring[0][:2] != ring[-1][:2]:
+    raise ValueError(f"{where}: linear ring is not closed, the first and last position differ")
+
+
+def _polygons(geometry: dict) -> List[list]:
+  return [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+
+
+def _validate_area(geometry: dict, where: str) -> int:
+  """Validates a Polygon / MultiPolygon and returns its number of vertices."""
+  coordinates = geometry.get('coordinates')
+  if not isinstance(coordinates, list) or len(coordinates) == 0:
+    raise ValueError(f"{where}: {geometry['type']} has no coordinates")
+  vertices = 0
+  for i, polygon in enumerate(_polygons(geometry)):
+    path = f"{where}.coordinates" if geometry['type'] == 'Polygon' else f"{where}.coordinates[{i}]"
+    if not isinstance(polygon, list) or len(polygon) == 0:
+      raise ValueError(f"{path}: polygon has no exterior ring")
+    for j, ring in enumerate(polygon):
+      _validate_ring(ring, f"{path}[{j}]")
+      vertices += len(ring)
+  return vertices
+
+
+def area_geometries(aoi: Any, where: str = 'aoi') -> Iterator[Tuple[dict, str]]:
+  """
+  Polygon / MultiPolygon geometries of a GeoJSON geometry, Feature or FeatureCollection.
+
+  :param aoi: Parsed GeoJSON.
+  :param where: Path of aoi used in error messages.
+  :return: Iterator over (geometry, path).
+  :raises ValueError: If aoi is no GeoJSON or contains a geometry that does not describe an area.
+  """
+  geojson_type = aoi.get('type') if isinstance(aoi, dict) else None
+  if geojson_type == 'FeatureCollection':
+    if not isinstance(aoi.get('features'), list):
+      raise ValueError(f"{where}: FeatureCollection has no features")
+    for i, feature in enumerate(aoi['features']):
+      yield from area_geometries(feature, f"{where}.features[{i}]")
+  elif geojson_type == 'Feature':
+    if aoi.get('geometry') is None:
+      raise ValueError(f"{where}: Feature has no geometry")
+    yield from area_geometries(aoi['geometry'], f"{where}.geometry")
+  elif geojson_type == 'GeometryCollection':
+    for i, geometry in enumerate(aoi.get('geometries') or []):
+      yield from area_geometries(geometry, f"{where}.geometries[{i}]")
+  elif geojson_type in AREA_TYPES:
+    yield aoi, where
+  elif geojson_type in GEOMETRY_TYPES:
+    raise ValueError(f"{where}: {geojson_type} does not describe an area, use Polygon or MultiPolygon")
+  else:
+    raise ValueError(f"{where}: not a GeoJSON object (type {geojson_type!r})")
+
+
+def _segment_distance2(point: list, start: list, end: list) -> float:
+  """Squared distance of point to the segment start - end."""
+  dx = end[0] - start[0]
+  dy = end[1] - start[1]
+  t = 0.0
+  if dx != 0 or dy != 0:
+    t = max(0.0, min(1.0, ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) / (dx * dx + dy * dy)))
+  x = start[0] + t * dx - point[0]
+  y = start[1] + t * dy - point[1]
+  return x * x + y * y
+
+
+def simplify_line(points: List[list], tolerance: float) -> List[list]:
+  """
+  Douglas-Peucker simplification. Keeps the first and last position, so closed rings stay closed.
+
+  Iterative, so rings with millions of vertices do not hit the recursion limit.
+
+  :param points: Positions of a line or ring.
+  :param tolerance: Maximum distance of a dropped position to the simplified line, in coordinate units (degrees).
+  """
+  if len(points) < 3 or tolerance <= 0:
+    return points
+  keep = [False] * len(points)
+  keep[0] = keep[-1] = True
+  tolerance2 = tolerance * tolerance
+  stack = [(0, len(points) - 1)]
+  while len(stack) > 0:
+    first, last = stack.pop()
+    max_distance2 = 0.0
+    index = first
+    for i in range(first + 1, last):
+      distance2 = _segment_distance2(points[i], points[first], points[last])
+      if distance2 > max_distance2:
+        max_distance2 = distance2
+        index = i
+    if max_distance2 > tolerance2:
+      keep[index] = True
+      stack.append((first, index))
+      stack.append((index, last))
+  return [point for point, kept in zip(points, keep) if kept]
+
+
+def _compact_ring(ring: List[list], precision: Optional[int], tolerance: Optional[float]) -> Optional[List[list]]:
+  """Rounded and simplified ring without repeated positions. None if fewer than 4 positions are left."""
+  if not precision is None:
+    ring = [[round(c, precision) for c in position] for position in ring]
+  ring = [position for i, position in enumerate(ring) if i == 0 or position != ring[i - 1]]
+  if tolerance:
+    ring = simplify_line(ring, tolerance)
+  return ring if len(ring) >= 4 else None
+
+
+def _compact_area(geometry: dict, where: str, precision: Optional[int], tolerance: Optional[float]) -> int:
+  """Compacts a validated Polygon / MultiPolygon in place and returns its number of vertices. Holes and parts of a
+  MultiPolygon that collapse are dropped."""
+  polygons = []
+  for polygon in _polygons(geometry):
+    exterior = _compact_ring(polygon[0], precision, tolerance)
+    if exterior is None:
+      continue
+    holes = [hole for hole in (_compact_ring(ring, precision, tolerance) for ring in polygon[1:]) if not hole is None]
+    polygons.append([exterior] + holes)
+  if len(polygons) == 0:
+    raise ValueError(f"{where}: {geometry['type']} collapses at this precision / simplification tolerance")
+  geometry['coordinates'] = polygons[0] if geometry['type'] == 'Polygon' else polygons
+  return sum(len(ring) for polygon in polygons for ring in polygon)
+
+
+def prepare_aoi(source: Union[str, dict, TextIO], precision: Optional[int] = None,
+                tolerance: Optional[float] = None) -> Tuple[str, AoiStats]:
+  """
+  Validates an area of interest and serialises it as minified JSON.
+
+  Every geometry needs to be a Polygon or MultiPolygon with closed rings of at least 4 positions within the WGS84
+  bounds. Optionally the coordinates are rounded to `precision` decimal places and the rings simplified with the
+  Douglas-Peucker `tolerance` (degrees). Rings that collapse by that are dropped.
+
+  :param source: GeoJSON text, parsed GeoJSON or an open GeoJSON file.
+  :param precision: Decimal places to round the coordinates to. None to keep them.
+  :param tolerance: Simplification tolerance in degrees. None or 0 to keep all vertices.
+  :return: Minified GeoJSON and the sizes before / after.
+  :raises ValueError: If source is not valid JSON or not a valid area of interest.
+  """
+  stats = AoiStats()
+  if isinstance(source, dict):
+    aoi = source
+    stats.bytes_in = len(json.dumps(aoi).encode())
+  else:
+    text = source if isinstance(source, str) else source.read()
+    stats.bytes_in = len(text.encode())
+    try:
+      aoi = json.loads(text, parse_constant=_reject_constant)
+    except json.JSONDecodeError as e:
+      raise ValueError(f"Invalid JSON: {e}")
+
+  areas = list(area_geometries(aoi))
+  if len(areas) == 0:
+    raise ValueError("aoi: contains no Polygon or MultiPolygon")
+  for geometry, where in areas:
+    stats.vertices_in += _validate_area(geometry, where)
+  for geometry, where in areas:
+    stats.vertices_out += _compact_area(geometry, where, precision, tolerance)
+
+  result = json.dumps(aoi, separators=(',', ':'))
+  stats.bytes_out = len(result.encode())
+  return result, stats
+
+
+def bounding_box(aoi: Any) -> BBox:
+  """(min lon, min lat, max lon, max lat) of all Polygons / MultiPolygons of a validated area of interest."""
+  xs = []
+  ys = []
+  for geometry, _ in area_geometries(aoi):
+    for polygon in _polygons(geometry):
+      xs.extend(position[0] for position in polygon[0])
+      ys.extend(position[1] for position in polygon[0])
+  return min(xs), min(ys), max(xs), max(ys)
+
+
+def _grid_steps(bbox: BBox, tile_size: float, tile_unit: str) -> Tuple[float, float]:
+  """Tile width and height in degrees. Kilometres are converted at the latitude of the centre of bbox."""
+  if tile_unit == 'deg':
+    return tile_size, tile_size
+  latitude = math.radians((bbox[1] + bbox[3]) / 2)
+  return tile_size / (KM_PER_DEGREE_LON * max(math.cos(latitude), 0.01)), tile_size / KM_PER_DEGREE_LAT
+
+
+def _signed_area(ring: List[list]) -> float:
+  """Area of a closed ring (shoelace formula) in square degrees. Positive for counterclockwise rings."""
+  return sum(ring[i][0] * ring[i + 1][1] - ring[i + 1][0] * ring[i][1] for i in range(len(ring) - 1)) / 2
+
+
+def _ring_area(ring: List[list]) -> float:
+  """Unsigned area of a closed ring in square degrees."""
+  return abs(_signed_area(ring))
+
+
+def _oriented(ring: List[list], counterclockwise: bool) -> List[list]:
+  return ring if (_signed_area(ring) > 0) == counterclockwise else ring[::-1]
+
+
+def _contains(ring: List[list], point: list) -> bool:
+  """Even-odd rule (ray casting) point in ring test."""
+  inside = False
+  for i in range(len(ring) - 1):
+    (x1, y1), (x2, y2) = ring[i][:2], ring[i + 1][:2]
+    if (y1 > point[1]) != (y2 > point[1]) and point[0] < x1 + (point[1] - y1) / (y2 - y1) * (x2 - x1):
+      inside = not inside
+  return inside
+
+
+def _clip_polygon(polygon: List[list], axis: int, bound: float, above: bool) -> List[list]:
+  """
+  Clips a polygon with holes to the half plane position[axis] > bound (above) or < bound (not above).
+
+  Every ring is cut into chains that run inside the half plane from where they enter to where they leave it. With the
+  exterior counterclockwise and the holes clockwise, the boundary of the clipped area follows the clip line from the
+  end of a chain to the start of the nearest chain in the direction that keeps the half plane on the left
+  (Weiler-Atherton for a single clip edge). Unlike Sutherland-Hodgman, a concave polygon that leaves and re-enters the half
+  plane gives separate polygons and not one ring that runs back and forth along the clip line.
+
+  :return: The clipped polygons. Empty if the polygon does not reach into the half plane.
+  """
+  other = 1 - axis
+  ## direction along the clip line (other axis) with the half plane on the left
+  direction = (1 if above else -1) if axis == 1 else (-1 if above else 1)
+
+  def inside(position: list) -> bool:
+    return position[axis] > bound if above else position[axis] < bound
+
+  def intersection(start: list, end: list) -> list:
+    t = (bound - start[axis]) / (end[axis] - start[axis])
+    position = [0.0, 0.0]
+    position[axis] = bound
+    position[other] = start[other] + t * (end[other] - start[other])
+    return position
+
+  exteriors = []
+  holes = []
+  chains = []
+  for index, ring in enumerate(polygon):
+    ring = _oriented(ring, index == 0)
+    points = ring[:-1]
+    outside = [i for i, position in enumerate(points) if not inside(position)]
+    if len(outside) == 0:
+      (exteriors if index == 0 else holes).append(ring)
+      continue
+    ## start at a position outside, so every chain is closed before the walk around the ring ends
+    points = points[outside[0]:] + points[:outside[0] + 1]
+    chain = None
+    for previous, position in zip(points, points[1:]):
+      if inside(position):
+        if chain is None:
+          chain = [intersection(previous, position)]
+        chain.append(position)
+      elif not chain is None:
+        chain.append(intersection(previous, position))
+        chains.append(chain)
+        chain = None
+
+  used = [False] * len(chains)
+  for first in range(len(chains)):
+    if used[first]:
+      continue
+    ring = []
+    current = first
+    while not used[current]:
+      used[current] = True
+      ring.extend(chains[current])
+      end = ring[-1][other]
+      following = [(direction * (chain[0][other] - end), i) for i, chain in enumerate(chains)
+                   if direction * (chain[0][other] - end) >= 0 and (not used[i] or i == first)]
+      if len(following) == 0:
+        break
+      current = min(following)[1]
+    exteriors.append(ring + ring[:1])
+
+  clipped = [[exterior] for exterior in exteriors]
+  for hole in holes:
+    container = next((polygon for polygon in clipped if _contains(polygon[0], hole[0])), None)
+    if not container is None:
+      container.append(hole)
+  return clipped
+
+
+def _clip_polygons(polygons: List[list], axis: int, low: float, high: float) -> List[list]:
+  """Clips polygons with holes to low < position[axis] < high."""
+  clipped = []
+  for polygon in polygons:
+    for part in _clip_polygon(polygon, axis, low, True):
+      clipped.extend(_clip_polygon(part, axis, high, False))
+  return clipped
+
+
+def tile_aoi(aoi: Any, tile_size: float, tile_unit: str = 'km', precision: Optional[int] = None,
+             limit: int = TILE_LIMIT) -> List[dict]:
+  """
+  Splits a validated area of interest into a regular grid of tiles clipped to the area.
+
+  The grid starts at the south west corner of the bounding box. Rows are clipped first and the columns of every row
+  only from the clipped row, so every vertex is visited once per row and once per column and not once per tile.
+  Grid cells that do not intersect the area are dropped. Concave parts that leave and re-enter a tile become separate
+  polygons of a MultiPolygon (see _clip_polygon).
+
+  :param aoi: Parsed and validated GeoJSON (see prepare_aoi). All Polygons / MultiPolygons are tiled together.
+  :param tile_size: Width and height of a tile in tile_unit.
+  :param tile_unit: 'km' (converted at the latitude of the centre of the area) or 'deg'.
+  :param precision: Round the coordinates of the tiles to this many decimal places.
+  :param limit: Maximum number of grid cells.
+  :return: List of tiles with `tile` (<row>_<column>), `bbox` and the clipped Polygon / MultiPolygon `geometry`.
+  :raises ValueError: If the grid has more than `limit` cells or a tile is not a valid area of interest.
+  """
+  polygons = [polygon for geometry, _ in area_geometries(aoi) for polygon in _polygons(geometry)]
+  bbox = bounding_box(aoi)
+  step_x, step_y = _grid_steps(bbox, tile_size, tile_unit)
+  ## the small epsilon avoids an empty sliver row / column if the extent is a multiple of the tile size
+  rows = max(1, math.ceil((bbox[3] - bbox[1]) / step_y - 1e-9))
+  columns = max(1, math.ceil((bbox[2] - bbox[0]) / step_x - 1e-9))
+  if rows * columns > limit:
+    raise ValueError(f"{tile_size} {tile_unit} tiles give a grid of {rows} x {columns} cells, more than the limit of "
+                     f"{limit} (IQ_TILE_LIMIT). Use larger tiles.")
+  min_area = step_x * step_y * 1e-9
+  tiles = []
+  for row in range(rows):
+    low_y = bbox[1] + row * step_y
+    high_y = min(bbox[3], low_y + step_y)
+    row_polygons = _clip_polygons(polygons, 1, low_y, high_y)
+    for column in range(columns if len(row_polygons) > 0 else 0):
+      low_x = bbox[0] + column * step_x
+      high_x = min(bbox[2], low_x + step_x)
+      tile_polygons = []
+      for polygon in _clip_polygons(row_polygons, 0, low_x, high_x):
+        ## clipping repeats positions at the corners of a tile, _compact_ring drops them. Rounding to `precision` can
+        ## collapse slivers along the tile border.
+        exterior = _compact_ring(polygon[0], precision, None)
+        if not exterior is None and _ring_area(exterior) > min_area:
+          holes = [ring for ring in (_compact_ring(hole, precision, None) for hole in polygon[1:]) if not ring is None]
+          tile_polygons.append([exterior] + holes)
+      if len(tile_polygons) == 0:
+        continue
+      geometry = {'type': 'Polygon', 'coordinates': tile_polygons[0]} if len(tile_polygons) == 1 \
+        else {'type': 'MultiPolygon', 'coordinates': tile_polygons}
+      ## the same checks as for an area of interest, so every tile can be sent as aoi of its own
+      _validate_area(geometry, f"tiles[{row}_{column}]")
+      tiles.append({
+        'tile': f"{row}_{column}",
+        'bbox': [low_x, low_y, high_x, high_y],
+        'geometry': geometry,
+      })
+  return tiles
@@ -0,0 +1,99 @@
+# Batched commits of inference updates / deletes with the JSON:API Atomic Operations extension: up to `batch_size`
+# changes travel in one POST <API_BASE_URL>/operations. Whether the API supports it is detected with the first batch,
+# without support every inference is committed by its own request as before.
+import logging
+from typing import Iterator, List, Optional, Tuple
+
+from jsonapi_client import Session
+from jsonapi_client.common import HttpStatus
+from jsonapi_client.exceptions import DocumentError
+from jsonapi_client.resourceobject import ResourceObject
+
+from ..client import Sen2CubeClient
+from ..utils import map_concurrent
+
+logger = logging.getLogger(__name__)
+
+## Responses to the first batch meaning that the API has no (atomic) operations endpoint
+ATOMIC_UNSUPPORTED_STATUS: List[int] = [404, 405, 415, 501]
+
+
+def operation(resource: ResourceObject) -> dict:
+  """Atomic operation with the pending change of resource: its deletion or its changed attributes (the PATCH body)."""
+  if resource._delete:
+    return {'op': 'remove', 'ref': {'type': resource.type, 'id': str(resource.id)}}
+  return {'op': 'update', 'data': resource._commit_data()['data']}
+
+
+def apply_results(session: Session, batch: List[ResourceObject], results: List[dict]) -> None:
+  """Updates the resources of a committed batch from the operation results, like ResourceObject.commit() does."""
+  for resource, result in zip(batch, results):
+    if resource._delete:
+      session.remove_resource(resource)
+    elif result.get('data'):
+      resource._post_commit(HttpStatus.OK_200, result, None)
+    else:
+      resource.mark_clean()
+
+
+def batches(resources: List[ResourceObject], batch_size: int) -> List[List[ResourceObject]]:
+  return [resources[i:i + batch_size] for i in range(0, len(resources), batch_size)]
+
+
+def is_unsupported(error: Exception) -> bool:
+  return isinstance(error, DocumentError) and (error.errors or {}).get('status_code') in ATOMIC_UNSUPPORTED_STATUS
+
+
+def commit_batched(client: Sen2CubeClient,
+                   session: Session,
+                   resources: List[ResourceObject],
+                   concurrency: int = 1,
+                   batch_size: int = 1
+                   ) -> Iterator[Tuple[ResourceObject, Optional[Exception]]]:
+  """
+  Commits the pending changes of resources (updates or deletes) in atomic batches.
+
+  The first batch is sent alone. If the API rejects it as unsupported (see ATOMIC_UNSUPPORTED_STATUS), this is
+  remembered in client.atomic_operations and all resources are committed one by one. The remaining batches are sent by
+  a pool of `concurrency` workers. A failing batch is rolled back by the API, so its resources are committed one by one
+  afterwards to find the failing ones.
+
+  :param session: Session the resources were loaded with.
+  :param resources: Resources with pending changes (ResourceObject.delete() or changed attributes).
+  :param concurrency: Number of requests in flight at the same time.
+  :param batch_size: Maximum number of operations per request. 1 commits every resource with its own request.
+  :return: Iterator over (resource, error) in order of completion. error is None if the resource was committed.
+  """
+  def _commit_batch(batch: List[ResourceObject]) -> None:
+    apply_results(session, batch, session.post_operations([operation(res) for res in batch]))
+
+  single: List[ResourceObject] = []
+  pending = batches(resources, batch_size)
+  if batch_size <= 1 or len(resources) <= 1 or client.atomic_operations is False:
+    single, pending = list(resources), []
+  elif client.atomic_operations is None:
+    batch = pending.pop(0)
+    try:
+      _commit_batch(batch)
+      client.atomic_operations = True
+      for resource in batch:
+        yield resource, None
+    except Exception as e:
+      if is_unsupported(e):
+        logger.info(f"The API does not support atomic operations ({e}). Committing every inference on its own.")
+        client.atomic_operations = False
+        single, pending = list(resources), []
+      else:
+        logger.warning(f"Batch of {len(batch)} operations failed ({e}). Committing them one by one.")
+        single.extend(batch)
+
+  for batch, _, error in map_concurrent(_commit_batch, pending, concurrency, ordered=False):
+    if error is None:
+      for resource in batch:
+        yield resource, None
+    else:
+      logger.warning(f"Batch of {len(batch)} operations failed ({error}). Committing them one by one.")
+      single.extend(batch)
+
+  for resource, _, error in map_concurrent(lambda res: res.commit(), single, concurrency, ordered=False):
+    yield resource, error
@@ -0,0 +1,198 @@
+# Local SQLite mirror of the inferences, so repeated listings do not have to go to the API
+import json
+import logging
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Union
+
+from .util import AVAILABLE_COLUMNS
+from ..client import Sen2CubeClient
+from ..env import API_BASE_URL, CONFIG_PATH_CACHE, DEFAULT_PAGE_SIZE, FILTER_CHUNK_SIZE
+from ..utils import dict_from_resource
+
+logger = logging.getLogger(__name__)
+
+## area_of_interest is never mirrored, it can be huge
+CACHE_COLUMNS: List[str] = [col for col in AVAILABLE_COLUMNS if col != 'area_of_interest']
+INDEXED_COLUMNS: List[str] = ['status', 'factbase_id', 'knowledgebase_id', 'status_timestamp', 'timestamp_created']
+
+
+def open_cache(cache_path: str = CONFIG_PATH_CACHE) -> sqlite3.Connection:
+  """Opens (and creates if necessary) the inference cache."""
+  connection = sqlite3.connect(cache_path)
+  connection.row_factory = sqlite3.Row
+  with connection:
+    connection.execute(f"CREATE TABLE IF NOT EXISTS inference (id INTEGER PRIMARY KEY, {', '.join(CACHE_COLUMNS)})")
+    connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    for col in INDEXED_COLUMNS:
+      connection.execute(f"CREATE INDEX IF NOT EXISTS inference_{col} ON inference ({col})")
+  return connection
+
+
+def _get_meta(connection: sqlite3.Connection, key: str) -> Optional[str]:
+  row = connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+  return None if row is None else row['value']
+
+
+def _set_meta(connection: sqlite3.Connection, key: str, value: Optional[str]) -> None:
+  connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def _to_db(row: dict) -> tuple:
+  return (int(row['id']),) + tuple(json.dumps(row[col]) if isinstance(row[col], list) else row[col]
+                                   for col in CACHE_COLUMNS)
+
+
+def _from_db(row: sqlite3.Row, columns: List[str]) -> dict:
+  ret = {'id': str(row['id'])}
+  for col in columns:
+    value = row[col]
+    if col == 'output' and value is not None:
+      value = json.loads(value)
+    elif col == 'favourite' and value is not None:
+      value = bool(value)
+    ret[col] = value
+  return ret
+
+
+def _watermark(*timestamps: Optional[str]) -> Optional[str]:
+  return max(filter(None, timestamps), default=None)
+
+
+def cache_synced_at(cache_path: str = CONFIG_PATH_CACHE) -> Optional[str]:
+  """Time of the last successful sync or None if the cache was never synced."""
+  with closing(open_cache(cache_path)) as connection:
+    return _get_meta(connection, 'synced_at')
+
+
+def sync_inference(client: Sen2CubeClient,
+                   full: bool = False,
+                   page_size: int = DEFAULT_PAGE_SIZE,
+                   cache_path: str = CONFIG_PATH_CACHE) -> int:
+  """
+  Mirror the inferences into the local cache.
+
+  Only inferences whose `status_timestamp` or `timestamp_created` is at or after the watermark of the last sync are
+  fetched. The sync runs in a single transaction, so the cache and its watermark are only updated if all pages could
+  be fetched. Inferences deleted on the server are only removed by a full sync.
+
+  :param client: Sen2CubeClient with a valid session token
+  :param full: Drop the cache and fetch all inferences.
+  :param page_size: Number of inferences per request.
+  :param cache_path: Path of the SQLite cache.
+  :return: Number of inferences fetched.
+  """
+  from jsonapi_client.filter import Filter, Modifier
+
+  from .get import iterate_pages
+
+  with closing(open_cache(cache_path)) as connection:
+    if _get_meta(connection, 'api_base_url') not in (None, API_BASE_URL):
+      logger.warning(f"Cache was synced from {_get_meta(connection, 'api_base_url')}. Doing a full sync.")
+      full = True
+    watermark = None if full else _get_meta(connection, 'watermark')
+
+    modifier_list: List[Modifier] = [
+      Modifier('sort=id'),
+      Modifier(f'page[size]={page_size}'),
+      Modifier(f'fields[inference]={",".join(CACHE_COLUMNS)}'),
+    ]
+    if watermark is not None:
+      logger.info(f"Fetching inferences changed since {watermark}")
+      changed_since = [{'or': [{'name': 'status_timestamp', 'op': 'ge', 'val': watermark},
+                               {'name': 'timestamp_created', 'op': 'ge', 'val': watermark}]}]
+      modifier_list.append(Filter(query_str=f'filter={json.dumps(changed_since)}'))
+    merged_filters = sum(modifier_list, Modifier())
+
+    insert = f"INSERT OR REPLACE INTO inference (id, {', '.join(CACHE_COLUMNS)}) " \
+             f"VALUES ({', '.join(['?'] * (len(CACHE_COLUMNS) + 1))})"
+    synced = 0
+    with connection, client.api_session() as session:
+      try:
+        if full:
+          connection.execute("DELETE FROM inference")
+        batch = []
+        for resource in iterate_pages(session, merged_filters.url_with_modifiers(f'{session.url_prefix}/inference'),
+                                      prefetch=True):
+          row = dict_from_resource(resource, CACHE_COLUMNS)
+          watermark = _watermark(watermark, row['status_timestamp'], row['timestamp_created'])
+          batch.append(_to_db(row))
+          if len(batch) >= page_size:
+            connection.executemany(insert, batch)
+            synced += len(batch)
+            batch = []
+        connection.executemany(insert, batch)
+        synced += len(batch)
+
+        _set_meta(connection, 'watermark', watermark)
+        _set_meta(connection, 'api_base_url', API_BASE_URL)
+        _set_meta(connection, 'synced_at', datetime.now(timezone.utc).isoformat())
+      finally:
+        session.close()
+    logger.info(f"Synced {synced} inferences. Watermark: {watermark}")
+    return synced
+
+
+def _order_by(sort_by: Optional[str]) -> str:
+  """Translates a JSON:API sort parameter (e.g. `owner,-id`) into an ORDER BY clause of whitelisted columns."""
+  if sort_by is None or sort_by.strip() == '':
+    return ''
+  order = []
+  for col in sort_by.split(','):
+    col = col.strip()
+    name = col.lstrip('-')
+    if name != 'id' and name not in CACHE_COLUMNS:
+      raise ValueError(f"Can not sort by '{name}'")
+    order.append(f"{name} {'DESC' if col.startswith('-') else 'ASC'}")
+  return f" ORDER BY {', '.join(order)}"
+
+
+def query_cache(id: Union[int, List, tuple, None] = None,
+                factbase_id: Union[int, List, tuple, None] = None,
+                knowledgebase_id: Union[int, List, tuple, None] = None,
+                status: Union[str, List, tuple, None] = None,
+                sort_by: str = None,
+                columns: Optional[List[str]] = None,
+                cache_path: str = CONFIG_PATH_CACHE) -> Iterator[dict]:
+  """
+  Get inferences from the local cache. Same filters as get_inference.
+
+  Filters with more than FILTER_CHUNK_SIZE values (e.g. from --id_file) are loaded into a temporary table instead of
+  binding one SQL variable per value, which older SQLite builds limit to 999.
+
+  :param columns: Columns to return. Must be in CACHE_COLUMNS. None for all.
+  :param cache_path: Path of the SQLite cache.
+  :return: Iterator over rows like the ones of dict_from_resource.
+  """
+  columns = CACHE_COLUMNS if columns is None else columns
+  unknown = [col for col in columns if col not in CACHE_COLUMNS]
+  if len(unknown) > 0:
+    raise ValueError(f"Column(s) not in cache: {', '.join(unknown)}")
+
+  with closing(open_cache(cache_path)) as connection:
+    where = []
+    params = []
+    for name, value in [('id', id), ('factbase_id', factbase_id), ('knowledgebase_id', knowledgebase_id),
+                        ('status', status)]:
+      if value is None or (isinstance(value, (list, tuple)) and len(value) == 0):
+        continue
+      values = list(value) if isinstance(value, (list, tuple)) else [value]
+      if len(values) > FILTER_CHUNK_SIZE:
+        connection.execute(f"CREATE TEMP TABLE IF NOT EXISTS filter_{name} (value PRIMARY KEY)")
+        connection.execute(f"DELETE FROM temp.filter_{name}")
+        connection.executemany(f"INSERT OR IGNORE INTO temp.filter_{name} (value) VALUES (?)",
+                               ((v,) for v in values))
+        where.append(f"{name} IN (SELECT value FROM temp.filter_{name})")
+      else:
+        where.append(f"{name} IN ({', '.join(['?'] * len(values))})")
+        params += values
+
+    query = f"SELECT id, {', '.join(columns)} FROM inference"
+    if len(where) > 0:
+      query += f" WHERE {' AND '.join(where)}"
+    query += _order_by(sort_by)
+    logger.debug(query)
+
+    for row in connection.execute(query, params):
+      yield _from_db(row, columns)
@@ -1,32 +1,198 @@
 # Sen2CLI inference module click group / commands
+import json
 import logging
+import os
+import re
+from collections import Counter
+from contextlib import nullcontext
+from datetime import datetime
 from io import TextIOWrapper
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
 
 import click
 
-from .create import create_inference
-from .delete import delete_inference
-from .get import get_inference
-from .update import update_inference
-from .util import DEFAULT_COLUMNS, INFERENCE_STATUS
-from ..env import AUTH_CLIENT_ID, AUTH_TOKEN_URL, CONFIG_PATH_TOKENFILE
-from ..session.oauth_util import load_or_refresh_token
-from ..utils import csv_from_dictlist, dict_from_resource
+from .aoi import TILE_UNITS
+from .util import AVAILABLE_COLUMNS, DEFAULT_COLUMNS, INFERENCE_STATUS, OperationSummary
+from ..client import Sen2CubeClient, client_config
+from ..env import ATOMIC_BATCH_SIZE, CONFIG_PATH_TOKENFILE, DEFAULT_PAGE_SIZE, DEFAULT_WATCH_INTERVAL, \
+  DEFAULT_WATCH_MAX_INTERVAL
+from ..utils import dict_from_resource, write_csv, write_json, write_ndjson
 
 logger = logging.getLogger(__name__)
 
+## Typed columnar output formats written by columnar.write_arrow
+BINARY_OUTPUT_FORMATS: List[str] = ['arrow', 'parquet']
+
+## The inference operations import jsonapi_client, requests and aiohttp. They are imported inside the commands, so that
+## `sen2cli --help` and commands that do not talk to the API do not pay for these imports.
+
+
+def _click_echo_output(output_format: str, resources: Iterable[dict]):
+  """Print output to StdOut in the correct format.
+
+  CSV and NDJSON rows are written one by one as they are produced by `resources`, so (lazy) iterables are streamed
+  and never held in memory as a whole.
+  """
+  stdout = click.get_text_stream('stdout')
+  client = click.get_current_context().find_object(Sen2CubeClient)
+  timings = None if client is None else client.timings
+  if output_format in BINARY_OUTPUT_FORMATS:
+    try:
+      from .columnar import write_arrow
+    except ImportError:
+      raise click.ClickException(f"Output format '{output_format}' needs pyarrow. "
+                                 f"Install it with `pip install sen2cli[arrow]`.")
+    if stdout.isatty():
+      raise click.UsageError(f"Refusing to write {output_format} output to a terminal. Redirect StdOut to a file.")
+  if not timings is None and not resources is None:
+    ## time spent waiting for the next row (lazy listing / commits) is not counted as rendering
+    resources = timings.timed_iter('rows', resources)
+  with nullcontext() if timings is None else timings.phase('render'):
+    if output_format == 'csv':
+      write_csv(resources, stdout, with_headers=True)
+    elif output_format == 'csv_no_hdr':
+      write_csv(resources, stdout, with_headers=False)
+    elif output_format == 'ndjson':
+      write_ndjson(resources, stdout)
+    elif output_format == 'json':
+      write_json(resources, stdout)
+    elif output_format in BINARY_OUTPUT_FORMATS:
+      write_arrow(resources, click.get_binary_stream('stdout'), file_format=output_format)
+    else:
+      raise ValueError(f'Unsupported output_format: {output_format}')
+
+
+def _parse_columns(ctx: click.Context, param: click.Parameter, value: Optional[str]) -> Optional[List[str]]:
+  """Click callback that turns a comma separated list of column names into a list."""
+  if value is None:
+    return None
+  columns = [col.strip() for col in value.split(',') if col.strip()]
+  unknown = [col for col in columns if col not in AVAILABLE_COLUMNS]
+  if len(unknown) > 0:
+    raise click.BadParameter(f"Unknown column(s): {', '.join(unknown)}. Available: {', '.join(AVAILABLE_COLUMNS)}")
+  return columns
+
+
+def _id_file_option(f):
+  """Adds --id_file to a command that filters by inference id."""
+  return click.option('--id_file', help="Also filter for the inference IDs in this file (separated by newlines, commas "
+                                        "or semicolons). - reads them from StdIn.",
+                      type=click.File('r'))(f)
+
+
+def _with_id_file(id: Tuple[int, ...], id_file: Optional[TextIO]) -> Optional[Tuple[int, ...]]:
+  """Adds the ids read from --id_file to the --id values.
+
+  :return: All ids without duplicates or None if --id_file was given but did not contain any id.
+  """
+  if id_file is None:
+    return id
+  ids = list(id)
+  for line_number, line in enumerate(id_file, start=1):
+    for value in re.split(r'[\s,;]+', line.strip()):
+      if value == '' or (line_number == 1 and value == 'id'):
+        continue
+      try:
+        ids.append(int(value))
+      except ValueError:
+        raise click.BadParameter(f"'{value}' in line {line_number} is not an inference ID.", param_hint="'--id_file'")
+  if len(ids) == 0:
+    click.echo("No inference IDs given.", err=True)
+    return None
+  logger.info(f"{len(ids)} inference IDs given")
+  return tuple(dict.fromkeys(ids))
+
+
+def _watch_options(f):
+  """Adds the poll options shared by `watch` and the --wait flag of other commands."""
+  f = click.option('--timeout', help="Stop waiting after this many seconds.",
+                   type=click.FloatRange(min=0))(f)
+  f = click.option('--max_interval', help="Maximum poll interval in seconds while nothing changes.",
+                   type=click.FloatRange(min=0), default=DEFAULT_WATCH_MAX_INTERVAL, show_default=True)(f)
+  f = click.option('--interval', help="Initial poll interval in seconds.",
+                   type=click.FloatRange(min=0), default=DEFAULT_WATCH_INTERVAL, show_default=True)(f)
+  return f
+
+
+def _aoi_options(f):
+  """Adds the area of interest preprocessing options of `create` and `create-batch`. See aoi.prepare_aoi."""
+  f = click.option('--simplify', help="Simplify the area of interest (Douglas-Peucker) with this tolerance in "
+                                     "degrees.",
+                   type=click.FloatRange(min=0))(f)
+  f = click.option('--precision', help="Round the coordinates of the area of interest to this many decimal places.",
+                   type=click.IntRange(min=0, max=15))(f)
+  return f
+
+
+def _batch_size_option(f):
+  """Adds --batch_size to the bulk commands rerun, abort and delete. See atomic.commit_batched."""
+  return click.option('--batch_size', help="Inferences changed per request if the API supports JSON:API atomic "
+                                           "operations. 1 sends one request per inference.",
+                      type=click.IntRange(min=1), default=ATOMIC_BATCH_SIZE, show_default=True)(f)
+
+
+def _plan_options(f):
+  """Adds --plan_out / --plan_in to the bulk commands rerun, abort and delete. See plan.py."""
+  f = click.option('--plan_in', help="Apply the command to exactly the inferences of this plan file (see --plan_out) "
+                                     "without filtering again. Inferences that changed since are skipped.",
+                   type=click.File('r'))(f)
+  f = click.option('--plan_out', help="Only resolve the affected inferences and write them with their current status "
+                                      "to this plan file.",
+                   type=click.Path(dir_okay=False, writable=True))(f)
+  return f
+
+
+def _check_plan_options(plan_out: Optional[str], plan_in: Optional[TextIO], *filters: Tuple) -> None:
+  if not plan_in is None and (not plan_out is None or any(len(values) > 0 for values in filters)):
+    raise click.UsageError("--plan_in can not be combined with filters or --plan_out.")
 
-def _click_echo_output(output_format: str, resources: List[dict]):
-  """Print output to whatever click.echo points in the correct format."""
-  if output_format == 'csv':
-    click.echo(csv_from_dictlist(resources, with_headers=True))
-  elif output_format == 'csv_no_hdr':
-    click.echo(csv_from_dictlist(resources, with_headers=False))
-  elif output_format == 'json':
-    click.echo(resources)
-  else:
-    raise ValueError(f'Unsupported output_format: {output_format}')
+
+def _apply_plan_file(client: Sen2CubeClient, plan_in: TextIO, action: str, dry_run: bool, concurrency: int,
+                     batch_size: int, summary: OperationSummary) -> Iterator[dict]:
+  from .plan import apply_plan, read_plan
+  try:
+    plan = read_plan(plan_in, action)
+  except ValueError as e:
+    raise click.BadParameter(str(e), param_hint="'--plan_in'")
+  logger.info(f"Applying plan of {plan['created']} with {len(plan['inferences'])} inferences")
+  return apply_plan(client, plan, dry_run=dry_run, concurrency=concurrency, summary=summary, batch_size=batch_size)
+
+
+def _write_plan_file(client: Sen2CubeClient, plan_out: str, action: str, concurrency: int, summary: OperationSummary,
+                     id: Tuple, factbase_id: Tuple, knowledgebase_id: Tuple, status: Tuple) -> List[dict]:
+  from .plan import plan_inference, write_plan
+  try:
+    rows = plan_inference(client, action, id, factbase_id, knowledgebase_id, status, concurrency=concurrency,
+                          summary=summary)
+  except Exception as e:
+    raise click.ClickException(f"Could not resolve the inferences of the plan. Reason: {e}")
+  with open(plan_out, 'w') as plan_file:
+    write_plan(plan_file, action, rows, {'id': list(id), 'factbase_id': list(factbase_id),
+                                         'knowledgebase_id': list(knowledgebase_id), 'status': list(status)})
+  click.echo(f"Planned {len(rows)}, skipped {summary.skipped}. Plan written to {plan_out}.", err=True)
+  return rows
+
+
+def _echo_watch_summary(final_status: Dict[str, Optional[str]]) -> int:
+  """Prints how many of the watched inferences ended in which status to StdErr.
+
+  :return: Exit code. 0 if all inferences SUCCEEDED, 1 otherwise.
+  """
+  counts = Counter('NOT FOUND' if status is None else status for status in final_status.values())
+  click.echo(', '.join(f"{status} {count}" for status, count in sorted(counts.items())) or "Nothing to watch.",
+             err=True)
+  return 0 if all(status == 'SUCCEEDED' for status in final_status.values()) else 1
+
+
+def _wait_for(client: Sen2CubeClient, ids: Iterable, interval: float, max_interval: float,
+              timeout: Optional[float]) -> int:
+  """Waits until the inferences are finished. Status changes are only logged. See watch_inference."""
+  from .watch import watch_inference
+  final_status: Dict[str, Optional[str]] = {}
+  for row in watch_inference(client, ids, interval=interval, max_interval=max_interval, timeout=timeout,
+                             final_status=final_status):
+    logger.info(f"Inference {row['id']}: {row['status']}")
+  return _echo_watch_summary(final_status)
 
 
 class InferenceCommandConfig(object):
@@ -45,8 +211,10 @@ inference_command_config = click \
               show_envvar=True,
               type=click.Path(exists=False, file_okay=True, dir_okay=False, writable=True, readable=True),
               default=CONFIG_PATH_TOKENFILE)
-@click.option('--output_format', '-f', help="Specify output format (CSV, CSV without header, JSON)",
-              type=click.Choice(['csv', 'csv_no_hdr', 'json']), default='csv')
+@click.option('--output_format', '-f',
+              help="Specify output format (CSV, CSV without header, JSON, newline delimited JSON, Arrow IPC file, "
+                   "Parquet). arrow and parquet need pyarrow (`pip install sen2cli[arrow]`).",
+              type=click.Choice(['csv', 'csv_no_hdr', 'json', 'ndjson'] + BINARY_OUTPUT_FORMATS), default='csv')
 @inference_command_config
 def inference(inference_command_config: InferenceCommandConfig,
               tokenfile,
@@ -59,6 +227,7 @@ def inference(inference_command_config: InferenceCommandConfig,
 @inference.command(help="List inferences")
 @click.option('--id', help="Filter for inference ID",
               type=click.INT, multiple=True)
+@_id_file_option
 @click.option('--factbase_id', help="Filter for factbase ID",
               type=click.INT, multiple=True)
 @click.option('--knowledgebase_id', help="Filter for model ID",
@@ -70,101 +239,379 @@ def inference(inference_command_config: InferenceCommandConfig,
 @click.option('--raw_modifier',
               help="This will be added to the query string and can be used to build lmore sophisticated filters etc.",
               type=click.STRING)
+@click.option('--page_size', help="Number of inferences fetched per request.",
+              type=click.IntRange(min=1), default=DEFAULT_PAGE_SIZE, show_default=True)
+@click.option('--prefetch/--no-prefetch', help="Fetch the next page while the current one is printed.",
+              default=True, show_default=True)
+@click.option('--columns', help="Comma separated list of columns to fetch and print. Defaults to all but area_of_interest.",
+              type=click.STRING, callback=_parse_columns)
+@click.option('--with_aoi', help="Also fetch and print the area of interest (can be large).",
+              type=click.BOOL, default=False, is_flag=True)
+@click.option('--cached', help="Answer from the local cache (see `sync`) instead of the API.",
+              type=click.BOOL, default=False, is_flag=True)
+@client_config
 @inference_command_config
 def ls(inference_command_config: InferenceCommandConfig,
+       client: Sen2CubeClient,
        id: int,
+       id_file: Optional[TextIO],
        factbase_id: int,
        knowledgebase_id: int,
        status: str,
        sort: str,
-       raw_modifier: str):
+       raw_modifier: str,
+       page_size: int,
+       prefetch: bool,
+       columns: Optional[List[str]],
+       with_aoi: bool,
+       cached: bool):
   """Lists inferences"""
-  token = load_or_refresh_token(inference_command_config.tokenfile, AUTH_TOKEN_URL, AUTH_CLIENT_ID)
+  id = _with_id_file(id, id_file)
+  if id is None:
+    return
+  columns = list(DEFAULT_COLUMNS) if columns is None else columns
+  if with_aoi and 'area_of_interest' not in columns:
+    columns.append('area_of_interest')
+  if cached:
+    from .cache import cache_synced_at, query_cache
+    if 'area_of_interest' in columns:
+      raise click.BadParameter("The area of interest is not cached.", param_hint="'--with_aoi' / '--columns'")
+    if raw_modifier is not None:
+      raise click.BadParameter("Can not be combined with --cached.", param_hint="'--raw_modifier'")
+    synced_at = cache_synced_at()
+    if synced_at is None:
+      click.echo("No cached inferences. Run 'sen2cli inference sync' first.", err=True)
+      return
+    logger.info(f"Using cache synced at {synced_at}")
+    try:
+      rows = query_cache(id=id, factbase_id=factbase_id, knowledgebase_id=knowledgebase_id, status=status,
+                         sort_by=sort, columns=columns)
+      _click_echo_output(inference_command_config.output_format, rows)
+    except ValueError as e:
+      raise click.BadParameter(str(e), param_hint="'--sort'")
+    return
+  from .aio import get_inference_async
+  from .get import get_inference
+  token = client.load_token(inference_command_config.tokenfile)
   if not token is None:
-    inferences = get_inference(token, id=id, factbase_id=factbase_id, knowledgebase_id=knowledgebase_id, status=status,
-                               sort_by=sort, raw_modifier=raw_modifier)
-    resources = [dict_from_resource(res, DEFAULT_COLUMNS) for res in inferences]
+    get = get_inference_async if client.use_async else get_inference
+    inferences = get(client, id=id, factbase_id=factbase_id, knowledgebase_id=knowledgebase_id, status=status,
+                     sort_by=sort, raw_modifier=raw_modifier, page_size=page_size, prefetch=prefetch, columns=columns)
+    if client.use_async:
+      inferences = client.iterate_async(inferences)
+    resources = (dict_from_resource(res, columns) for res in inferences)
     _click_echo_output(inference_command_config.output_format, resources)
   else:
     click.echo("No active Session or invalid token.")
 
 
+@inference.command(help="Update the local inference cache used by `ls --cached`")
+@click.option('--full', help="Drop the cache and fetch all inferences. Also removes inferences deleted on the server.",
+              type=click.BOOL, default=False, is_flag=True)
+@click.option('--page_size', help="Number of inferences fetched per request.",
+              type=click.IntRange(min=1), default=DEFAULT_PAGE_SIZE, show_default=True)
+@client_config
+@inference_command_config
+def sync(inference_command_config: InferenceCommandConfig,
+         client: Sen2CubeClient,
+         full: bool,
+         page_size: int):
+  """Fetches the inferences that changed since the last sync into the local cache."""
+  from .cache import sync_inference
+  token = client.load_token(inference_command_config.tokenfile)
+  if not token is None:
+    try:
+      synced = sync_inference(client, full=full, page_size=page_size)
+      click.echo(f"Synced {synced} inferences.", err=True)
+    except Exception as e:
+      logger.error(f"Could not sync inferences. Reason: {e}", exc_info=True)
+      click.echo(f"Could not sync inferences: {e}", err=True)
+  else:
+    click.echo("No active Session or invalid token.")
+
+
+@inference.command(help="Wait for inferences to finish and print every status change")
+@click.option('--id', help="Which inference to watch.", type=click.INT, multiple=True)
+@_id_file_option
+@click.option('--factbase_id', help="Watch all inferences of this factbase.",
+              type=click.INT, multiple=True)
+@click.option('--knowledgebase_id', help="Watch all inferences of this model.",
+              type=click.INT, multiple=True)
+@click.option('--status', help="Watch all inferences with this status.",
+              type=click.Choice(INFERENCE_STATUS), multiple=True)
+@_watch_options
+@client_config
+@inference_command_config
+@click.pass_context
+def watch(ctx: click.Context,
+          inference_command_config: InferenceCommandConfig,
+          client: Sen2CubeClient,
+          id: int,
+          id_file: Optional[TextIO],
+          factbase_id: int,
+          knowledgebase_id: int,
+          status: str,
+          interval: float,
+          max_interval: float,
+          timeout: Optional[float]):
+  """Polls the selected inferences until all of them are SUCCEEDED, FAILED or ABORTED.
+
+  Exits with 1 if any of them did not succeed (or the timeout was reached).
+  """
+  from .get import get_inference
+  from .watch import watch_inference
+  id = _with_id_file(id, id_file)
+  if id is None:
+    return
+  if len(id) == 0 and len(factbase_id) == 0 and len(knowledgebase_id) == 0 and len(status) == 0:
+    click.echo("At least one filter needs to be specified.")
+  else:
+    token = client.load_token(inference_command_config.tokenfile)
+    if not token is None:
+      ids = list(id)
+      if len(factbase_id) > 0 or len(knowledgebase_id) > 0 or len(status) > 0:
+        ids = [res.id for res in get_inference(client, id=id, factbase_id=factbase_id,
+                                               knowledgebase_id=knowledgebase_id, status=status, columns=['status'])]
+      final_status: Dict[str, Optional[str]] = {}
+      changes = watch_inference(client, ids, interval=interval, max_interval=max_interval, timeout=timeout,
+                                final_status=final_status)
+      _click_echo_output(inference_command_config.output_format, changes)
+      ctx.exit(_echo_watch_summary(final_status))
+    else:
+      click.echo("No active Session or invalid token.")
+
+
 @inference.command(help="Rerun finished / stopped / failed inferences")
 @click.option('--id', help="Which inference to rerun.", type=click.INT, multiple=True)
+@_id_file_option
 @click.option('--factbase_id', help="Filter for factbase ID",
               type=click.INT, multiple=True)
 @click.option('--knowledgebase_id', help="Filter for model ID",
               type=click.INT, multiple=True)
 @click.option('--status', help="Filter for status",
               type=click.Choice(INFERENCE_STATUS), multiple=True)
+@click.option('--concurrency', help="Number of inferences updated in parallel.",
+              type=click.IntRange(min=1), default=1, show_default=True)
+@_batch_size_option
 @click.option('--dry-run', help="Will only display the inferences affected by rerun but not schedule them.", type=click.BOOL, default=False, is_flag=True)
+@_plan_options
+@click.option('--wait', help="Wait until the rerun inferences are finished. Exits with 1 if any of them did not succeed.",
+              type=click.BOOL, default=False, is_flag=True)
+@_watch_options
+@client_config
 @inference_command_config
-def rerun(inference_command_config: InferenceCommandConfig,
+@click.pass_context
+def rerun(ctx: click.Context,
+          inference_command_config: InferenceCommandConfig,
+          client: Sen2CubeClient,
           id: int,
+          id_file: Optional[TextIO],
           factbase_id: int,
           knowledgebase_id: int,
           status: str,
-          dry_run: bool):
-  if len(id) == 0 and len(factbase_id) == 0 and len(knowledgebase_id) == 0 and len(status) == 0:
+          dry_run: bool,
+          plan_out: Optional[str],
+          plan_in: Optional[TextIO],
+          concurrency: int,
+          batch_size: int,
+          wait: bool,
+          interval: float,
+          max_interval: float,
+          timeout: Optional[float]):
+  from .aio import update_inference_async
+  from .update import update_inference
+  id = _with_id_file(id, id_file)
+  if id is None:
+    return
+  _check_plan_options(plan_out, plan_in, id, factbase_id, knowledgebase_id, status)
+  if plan_in is None and len(id) == 0 and len(factbase_id) == 0 and len(knowledgebase_id) == 0 and len(status) == 0:
     click.echo("At least one filter needs to be specified.")
   else:
-    token = load_or_refresh_token(inference_command_config.tokenfile, AUTH_TOKEN_URL, AUTH_CLIENT_ID)
+    token = client.load_token(inference_command_config.tokenfile)
     if not token is None:
-      updated = update_inference(token, id, factbase_id, knowledgebase_id, status, 'CREATED', dry_run=dry_run)
+      summary = OperationSummary()
+      if not plan_in is None:
+        updated = list(_apply_plan_file(client, plan_in, 'CREATED', dry_run, concurrency, batch_size, summary))
+      elif not plan_out is None:
+        updated = _write_plan_file(client, plan_out, 'CREATED', concurrency, summary, id, factbase_id, knowledgebase_id,
+                                   status)
+      elif client.use_async:
+        updated = client.run_async(update_inference_async(client, id, factbase_id, knowledgebase_id, status, 'CREATED',
+                                                          dry_run=dry_run, concurrency=concurrency, summary=summary,
+                                                          batch_size=batch_size))
+      else:
+        updated = update_inference(client, id, factbase_id, knowledgebase_id, status, 'CREATED', dry_run=dry_run,
+                                   concurrency=concurrency, summary=summary, batch_size=batch_size)
       _click_echo_output(inference_command_config.output_format, updated)
+      if plan_out is None:
+        click.echo(f"Rerun {summary.succeeded}, skipped {summary.skipped}, failed {summary.failed}.", err=True)
+      if wait and not dry_run and plan_out is None and updated:
+        ctx.exit(_wait_for(client, [row['id'] for row in updated], interval, max_interval, timeout))
     else:
       click.echo("No active Session or invalid token.")
 
 
 @inference.command(help="Abort running / scheduled inferences")
 @click.option('--id', help="Which inference to abort.", type=click.INT, multiple=True)
+@_id_file_option
 @click.option('--factbase_id', help="Filter for factbase ID",
               type=click.INT, multiple=True)
 @click.option('--knowledgebase_id', help="Filter for model ID",
               type=click.INT, multiple=True)
 @click.option('--status', help="Filter for status",
               type=click.Choice(INFERENCE_STATUS), multiple=True)
+@click.option('--concurrency', help="Number of inferences updated in parallel.",
+              type=click.IntRange(min=1), default=1, show_default=True)
+@_batch_size_option
 @click.option('--dry-run', help="Will only display the inferences affected by abort but not abort them.", type=click.BOOL, default=False, is_flag=True)
+@_plan_options
+@client_config
 @inference_command_config
 def abort(inference_command_config: InferenceCommandConfig,
+          client: Sen2CubeClient,
           id: int,
+          id_file: Optional[TextIO],
           factbase_id: int,
           knowledgebase_id: int,
           status: str,
-          dry_run: bool):
-  if len(id) == 0 and len(factbase_id) == 0 and len(knowledgebase_id) == 0 and len(status) == 0:
+          dry_run: bool,
+          plan_out: Optional[str],
+          plan_in: Optional[TextIO],
+          concurrency: int,
+          batch_size: int):
+  from .aio import update_inference_async
+  from .update import update_inference
+  id = _with_id_file(id, id_file)
+  if id is None:
+    return
+  _check_plan_options(plan_out, plan_in, id, factbase_id, knowledgebase_id, status)
+  if plan_in is None and len(id) == 0 and len(factbase_id) == 0 and len(knowledgebase_id) == 0 and len(status) == 0:
     click.echo("At least one filter needs to be specified.")
   else:
-    token = load_or_refresh_token(inference_command_config.tokenfile, AUTH_TOKEN_URL, AUTH_CLIENT_ID)
+    token = client.load_token(inference_command_config.tokenfile)
     if not token is None:
-      updated = update_inference(token, id, factbase_id, knowledgebase_id, status, 'ABORTED', dry_run=dry_run)
+      summary = OperationSummary()
+      if not plan_in is None:
+        updated = _apply_plan_file(client, plan_in, 'ABORTED', dry_run, concurrency, batch_size, summary)
+      elif not plan_out is None:
+        updated = _write_plan_file(client, plan_out, 'ABORTED', concurrency, summary, id, factbase_id, knowledgebase_id,
+                                   status)
+      elif client.use_async:
+        updated = client.run_async(update_inference_async(client, id, factbase_id, knowledgebase_id, status, 'ABORTED',
+                                                          dry_run=dry_run, concurrency=concurrency, summary=summary,
+                                                          batch_size=batch_size))
+      else:
+        updated = update_inference(client, id, factbase_id, knowledgebase_id, status, 'ABORTED', dry_run=dry_run,
+                                   concurrency=concurrency, summary=summary, batch_size=batch_size)
       _click_echo_output(inference_command_config.output_format, updated)
+      if plan_out is None:
+        click.echo(f"Aborted {summary.succeeded}, skipped {summary.skipped}, failed {summary.failed}.", err=True)
     else:
       click.echo("No active Session or invalid token.")
 
 @inference.command(help="Delete inferences.")
 @click.option('--id', help="Which inference to abort.", type=click.INT, multiple=True)
+@_id_file_option
 @click.option('--factbase_id', help="Filter for factbase ID",
               type=click.INT, multiple=True)
 @click.option('--knowledgebase_id', help="Filter for model ID",
               type=click.INT, multiple=True)
 @click.option('--status', help="Filter for status",
               type=click.Choice(INFERENCE_STATUS), multiple=True)
+@click.option('--concurrency', help="Number of inferences deleted in parallel.",
+              type=click.IntRange(min=1), default=1, show_default=True)
+@_batch_size_option
 @click.option('--dry-run', help="Will only display the inferences affected by delete but not delete them.", type=click.BOOL, default=False, is_flag=True)
+@_plan_options
+@client_config
 @inference_command_config
 def delete(inference_command_config: InferenceCommandConfig,
+           client: Sen2CubeClient,
           id: int,
+          id_file: Optional[TextIO],
           factbase_id: int,
           knowledgebase_id: int,
           status: str,
-          dry_run: bool):
-  if len(id) == 0 and len(factbase_id) == 0 and len(knowledgebase_id) == 0 and len(status) == 0:
+          dry_run: bool,
+          plan_out: Optional[str],
+          plan_in: Optional[TextIO],
+          concurrency: int,
+          batch_size: int):
+  from .aio import delete_inference_async
+  from .delete import delete_inference
+  id = _with_id_file(id, id_file)
+  if id is None:
+    return
+  _check_plan_options(plan_out, plan_in, id, factbase_id, knowledgebase_id, status)
+  if plan_in is None and len(id) == 0 and len(factbase_id) == 0 and len(knowledgebase_id) == 0 and len(status) == 0:
     click.echo("At least one filter needs to be specified.")
   else:
-    token = load_or_refresh_token(inference_command_config.tokenfile, AUTH_TOKEN_URL, AUTH_CLIENT_ID)
+    token = client.load_token(inference_command_config.tokenfile)
     if not token is None:
-      deleted = delete_inference(token, id, factbase_id, knowledgebase_id, status, dry_run=dry_run)
+      summary = OperationSummary()
+      if not plan_in is None:
+        deleted = _apply_plan_file(client, plan_in, 'DELETE', dry_run, concurrency, batch_size, summary)
+      elif not plan_out is None:
+        deleted = _write_plan_file(client, plan_out, 'DELETE', concurrency, summary, id, factbase_id, knowledgebase_id,
+                                   status)
+      else:
+        delete_op = delete_inference_async if client.use_async else delete_inference
+        deleted = delete_op(client, id, factbase_id, knowledgebase_id, status, dry_run=dry_run,
+                            concurrency=concurrency, summary=summary, batch_size=batch_size)
+        if client.use_async:
+          deleted = client.iterate_async(deleted)
       _click_echo_output(inference_command_config.output_format, deleted)
+      if plan_out is None:
+        click.echo(f"Deleted {summary.succeeded}, skipped {summary.skipped}, failed {summary.failed}.", err=True)
+    else:
+      click.echo("No active Session or invalid token.")
+
+
+@inference.command(help="Download the outputs of inferences. Resumes interrupted downloads, skips complete files.")
+@click.option('--id', help="Which inference to download.", type=click.INT, multiple=True)
+@_id_file_option
+@click.option('--factbase_id', help="Filter for factbase ID",
+              type=click.INT, multiple=True)
+@click.option('--knowledgebase_id', help="Filter for model ID",
+              type=click.INT, multiple=True)
+@click.option('--status', help="Filter for status",
+              type=click.Choice(INFERENCE_STATUS), multiple=True)
+@click.option('--output_dir', help="Files are stored as <output_dir>/<inference id>/<file name>.",
+              type=click.Path(file_okay=False, writable=True), default='.', show_default=True)
+@click.option('--concurrency', help="Number of files downloaded in parallel.",
+              type=click.IntRange(min=1), default=4, show_default=True)
+@click.option('--qgis/--no-qgis', 'with_qgis', help="Also download the QGIS project.", default=True, show_default=True)
+@client_config
+@inference_command_config
+@click.pass_context
+def download(ctx: click.Context,
+             inference_command_config: InferenceCommandConfig,
+             client: Sen2CubeClient,
+             id: int,
+             id_file: Optional[TextIO],
+             factbase_id: int,
+             knowledgebase_id: int,
+             status: str,
+             output_dir: str,
+             concurrency: int,
+             with_qgis: bool):
+  from .download import download_inference
+  id = _with_id_file(id, id_file)
+  if id is None:
+    return
+  if len(id) == 0 and len(factbase_id) == 0 and len(knowledgebase_id) == 0 and len(status) == 0:
+    click.echo("At least one filter needs to be specified.")
+  else:
+    token = client.load_token(inference_command_config.tokenfile)
+    if not token is None:
+      summary = OperationSummary()
+      ## downloads run on threads, also with --async
+      downloaded = download_inference(client, id, factbase_id, knowledgebase_id, status, output_dir=output_dir,
+                                      concurrency=concurrency, with_qgis=with_qgis, summary=summary)
+      _click_echo_output(inference_command_config.output_format, downloaded)
+      click.echo(f"Downloaded {summary.succeeded}, skipped {summary.skipped}, failed {summary.failed}.", err=True)
+      if summary.failed > 0:
+        ctx.exit(1)
     else:
       click.echo("No active Session or invalid token.")
 
@@ -176,21 +623,172 @@ def delete(inference_command_config: InferenceCommandConfig,
 @click.argument('temporal_subset_end', type=click.DateTime(formats=['%Y-%m-%d']))
 @click.argument('spatial_subset', type=click.File('r'))
 @click.option('--description', help="Description of the inference", type=click.STRING)
+@_aoi_options
+@click.option('--tile_size', help="Split the area of interest into tiles of this size and create one inference per "
+                                  "tile.",
+              type=click.FloatRange(min=0, min_open=True))
+@click.option('--tile_unit', help="Unit of --tile_size.",
+              type=click.Choice(TILE_UNITS), default='km', show_default=True)
+@click.option('--tile_manifest', help="JSON lines file that links every tile to its inference. "
+                                      "[default: <spatial_subset>.tiles.jsonl]",
+              type=click.Path(dir_okay=False, writable=True))
+@click.option('--concurrency', help="Number of tiles created in parallel.",
+              type=click.IntRange(min=1), default=1, show_default=True)
 @click.option('--dry-run', help="Will only display the inference but not create it.", type=click.BOOL, default=False, is_flag=True)
+@click.option('--wait', help="Wait until the inference is finished. Exits with 1 if it did not succeed.",
+              type=click.BOOL, default=False, is_flag=True)
+@_watch_options
+@client_config
 @inference_command_config
-def create(inference_command_config, knowledgebase_id, factbase_id, temporal_subset_start, temporal_subset_end,
-           spatial_subset: TextIOWrapper, description, dry_run: bool):
-  token = load_or_refresh_token(inference_command_config.tokenfile, AUTH_TOKEN_URL, AUTH_CLIENT_ID)
-  if not token is None:
-    geojson = spatial_subset.read().replace("\n", " ")
-    created = create_inference(token,
-                               factbase_id=factbase_id,
-                               knowldegebase_id=knowledgebase_id,
-                               temp_range_start=temporal_subset_start,
-                               temp_range_end=temporal_subset_end,
-                               spatial_subset=geojson,
-                               description=description,
-                               dry_run=dry_run)
+@click.pass_context
+def create(ctx: click.Context, inference_command_config, client: Sen2CubeClient, knowledgebase_id, factbase_id,
+           temporal_subset_start, temporal_subset_end, spatial_subset: TextIOWrapper, description,
+           precision: Optional[int], simplify: Optional[float], tile_size: Optional[float], tile_unit: str,
+           tile_manifest: Optional[str], concurrency: int, dry_run: bool,
+           wait: bool, interval: float, max_interval: float, timeout: Optional[float]):
+  from .aio import create_inference_async
+  from .aoi import prepare_aoi, tile_aoi
+  from .create import create_inference
+  ## validated before anything is sent, so a broken file does not cost an upload
+  try:
+    geojson, aoi_stats = prepare_aoi(spatial_subset, precision, simplify)
+  except ValueError as e:
+    raise click.BadParameter(str(e), param_hint="'SPATIAL_SUBSET'")
+  click.echo(f"Area of interest: {aoi_stats}", err=True)
+  tiles = None
+  if not tile_size is None:
+    try:
+      tiles = tile_aoi(json.loads(geojson), tile_size, tile_unit, precision)
+    except ValueError as e:
+      raise click.BadParameter(str(e), param_hint="'--tile_size'")
+    if tile_manifest is None:
+      name = getattr(spatial_subset, 'name', '')
+      stdin = name.startswith('<') or name == '-'
+      tile_manifest = 'tiles.jsonl' if stdin else f"{os.path.splitext(name)[0]}.tiles.jsonl"
+    click.echo(f"Split the area of interest into {len(tiles)} tiles of {tile_size} {tile_unit}.", err=True)
+  token = client.load_token(inference_command_config.tokenfile)
+  if not token is None and not tiles is None:
+    ids = _create_tiles(client, inference_command_config.output_format, tiles, knowledgebase_id, factbase_id,
+                        temporal_subset_start, temporal_subset_end, description, concurrency, dry_run, tile_manifest)
+    if wait and not dry_run and len(ids) > 0:
+      ctx.exit(_wait_for(client, ids, interval, max_interval, timeout))
+  elif not token is None:
+    create_op = create_inference_async if client.use_async else create_inference
+    created = create_op(client,
+                        factbase_id=factbase_id,
+                        knowldegebase_id=knowledgebase_id,
+                        temp_range_start=temporal_subset_start,
+                        temp_range_end=temporal_subset_end,
+                        spatial_subset=geojson,
+                        description=description,
+                        dry_run=dry_run)
+    if client.use_async:
+      created = client.run_async(created)
     _click_echo_output(inference_command_config.output_format, [created])
+    if wait and not dry_run and created is not None:
+      ctx.exit(_wait_for(client, [created['id']], interval, max_interval, timeout))
+  else:
+    click.echo("No active Session or invalid token.")
+
+
+def _create_tiles(client: Sen2CubeClient, output_format: str, tiles: List[dict], knowledgebase_id: int,
+                  factbase_id: int, temp_range_start: datetime, temp_range_end: datetime, description: Optional[str],
+                  concurrency: int, dry_run: bool, tile_manifest: str) -> List[str]:
+  """Creates one inference per tile and writes the tile manifest while they are created.
+
+  :return: Ids of the created inferences.
+  """
+  from .aio import create_inferences_async
+  from .create import create_inferences
+  from .tiles import tile_manifest_entry, tile_rows
+  summary = OperationSummary()
+  create_op = create_inferences_async if client.use_async else create_inferences
+  created = create_op(client, tile_rows(tiles, knowledgebase_id, factbase_id, temp_range_start, temp_range_end,
+                                        description), dry_run=dry_run, concurrency=concurrency, summary=summary)
+  if client.use_async:
+    created = client.iterate_async(created)
+  ids = []
+  with nullcontext() if dry_run else open(tile_manifest, 'w') as manifest:
+    def _results() -> Iterator[dict]:
+      for row in created:
+        tile = tiles[row.pop('row') - 1]
+        if not manifest is None:
+          manifest.write(json.dumps(tile_manifest_entry(tile, row), separators=(',', ':')) + '\n')
+        if not row['id'] is None:
+          ids.append(row['id'])
+        yield {'tile': tile['tile'], **row}
+
+    _click_echo_output(output_format, _results())
+  click.echo(f"Created {summary.succeeded} of {len(tiles)} tiles, failed {summary.failed}." +
+             ('' if dry_run else f" Tile manifest: {tile_manifest}"), err=True)
+  return ids
+
+
+@inference.command(name='tile-status', help="Aggregate progress of the tiles of `create --tile_size`")
+@click.argument('tile_manifest', type=click.File('r'))
+@client_config
+@inference_command_config
+def tile_status(inference_command_config: InferenceCommandConfig,
+                client: Sen2CubeClient,
+                tile_manifest: TextIO):
+  """Prints the status of the inference of every tile and the number of tiles per status and mean progress to StdErr.
+  All inferences are fetched with one query."""
+  from .tiles import progress_summary, read_tile_manifest, tile_status as get_tile_status
+  try:
+    entries = read_tile_manifest(tile_manifest)
+  except ValueError as e:
+    raise click.BadParameter(str(e), param_hint="'TILE_MANIFEST'")
+  token = client.load_token(inference_command_config.tokenfile)
+  if not token is None:
+    try:
+      rows = list(get_tile_status(client, entries))
+    except Exception as e:
+      raise click.ClickException(f"Could not fetch the status of the tiles. Reason: {e}")
+    _click_echo_output(inference_command_config.output_format, rows)
+    click.echo(progress_summary(rows), err=True)
+  else:
+    click.echo("No active Session or invalid token.")
+
+
+@inference.command(name='create-batch', help="Create and schedule inferences for every row of a CSV / JSONL manifest")
+@click.argument('manifest', type=click.File('r'))
+@click.option('--manifest_format', help="Format of the manifest. 'auto' decides by file extension (.jsonl / .ndjson).",
+              type=click.Choice(['auto', 'csv', 'jsonl']), default='auto', show_default=True)
+@click.option('--concurrency', help="Number of inferences created in parallel.",
+              type=click.IntRange(min=1), default=1, show_default=True)
+@_aoi_options
+@click.option('--dry-run', help="Will only validate and display the inferences but not create them.", type=click.BOOL,
+              default=False, is_flag=True)
+@client_config
+@inference_command_config
+def create_batch(inference_command_config: InferenceCommandConfig,
+                 client: Sen2CubeClient,
+                 manifest: TextIOWrapper,
+                 manifest_format: str,
+                 concurrency: int,
+                 precision: Optional[int],
+                 simplify: Optional[float],
+                 dry_run: bool):
+  """Creates inferences from a manifest.
+
+  Columns: knowledgebase_id, factbase_id, temporal_subset_start, temporal_subset_end, spatial_subset (path to a
+  GeoJSON file relative to the manifest) or area_of_interest (inline GeoJSON), description (optional).
+  """
+  from .aio import create_inferences_async
+  from .aoi import AoiStats
+  from .create import create_inferences
+  from .manifest import read_manifest
+  token = client.load_token(inference_command_config.tokenfile)
+  if not token is None:
+    summary = OperationSummary()
+    create_op = create_inferences_async if client.use_async else create_inferences
+    aoi_stats = AoiStats()
+    manifest_rows = read_manifest(manifest, manifest_format, precision=precision, tolerance=simplify,
+                                  aoi_stats=aoi_stats)
+    created = create_op(client, manifest_rows, dry_run=dry_run, concurrency=concurrency, summary=summary)
+    if client.use_async:
+      created = client.iterate_async(created)
+    _click_echo_output(inference_command_config.output_format, created)
+    click.echo(f"Created {summary.succeeded}, failed {summary.failed}. Areas of interest: {aoi_stats}", err=True)
   else:
     click.echo("No active Session or invalid token.")
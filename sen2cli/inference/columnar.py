@@ -0,0 +1,125 @@
+# Apache Arrow IPC / Parquet output of inference listings. Needs the optional pyarrow dependency
+# (`pip install sen2cli[arrow]`).
+import json
+import re
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet as pq
+
+from .util import DEFAULT_COLUMNS
+
+## Rows are converted and written in record batches (Parquet: row groups) of this size
+BATCH_SIZE: int = 10000
+
+TIMESTAMP = pa.timestamp('us', tz='UTC')
+
+## Fractional seconds of an ISO 8601 timestamp. Before Python 3.11, datetime.fromisoformat only takes 3 or 6 digits.
+FRACTION = re.compile(r'([T ]\d{2}:\d{2}:\d{2})\.(\d+)')
+
+
+def _int(value: Any) -> Optional[int]:
+  return None if value is None else int(value)
+
+
+def _float(value: Any) -> Optional[float]:
+  return None if value is None or value == '' else float(value)
+
+
+def _timestamp(value: Any) -> Optional[datetime]:
+  """Parses an ISO 8601 timestamp of the API. Timestamps without time zone are UTC."""
+  if value is None or value == '':
+    return None
+  if isinstance(value, str):
+    ## microseconds: pad or truncate the fraction to 6 digits
+    value = FRACTION.sub(lambda match: f"{match.group(1)}.{match.group(2)[:6].ljust(6, '0')}", value)
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+  else:
+    parsed = value
+  return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None else parsed
+
+
+def _text(value: Any) -> Optional[str]:
+  if value is None:
+    return None
+  return json.dumps(value) if isinstance(value, (list, dict)) else str(value)
+
+
+## column -> (arrow type, conversion of the value of dict_from_resource). Other columns are written as strings.
+## output is a list of objects and written as JSON text.
+COLUMN_TYPES: Dict[str, Tuple[pa.DataType, Callable[[Any], Any]]] = {
+  'id': (pa.int64(), _int),
+  'factbase_id': (pa.int64(), _int),
+  'knowledgebase_id': (pa.int64(), _int),
+  'output_scale_factor': (pa.int64(), _int),
+  'favourite': (pa.bool_(), lambda value: None if value is None else bool(value)),
+  'status_progress': (pa.float64(), _float),
+  'status_timestamp': (TIMESTAMP, _timestamp),
+  'temp_range_start': (TIMESTAMP, _timestamp),
+  'temp_range_end': (TIMESTAMP, _timestamp),
+  'timestamp_created': (TIMESTAMP, _timestamp),
+  'timestamp_started': (TIMESTAMP, _timestamp),
+  'timestamp_finished': (TIMESTAMP, _timestamp),
+}
+
+
+def arrow_schema(columns: List[str]) -> pa.Schema:
+  """Typed schema for rows with these columns."""
+  return pa.schema([(col, COLUMN_TYPES.get(col, (pa.string(), _text))[0]) for col in columns])
+
+
+def _record_batch(schema: pa.Schema, rows: List[dict]) -> pa.RecordBatch:
+  arrays = []
+  for field in schema:
+    convert = COLUMN_TYPES.get(field.name, (pa.string(), _text))[1]
+    arrays.append(pa.array([convert(row.get(field.name)) for row in rows], type=field.type))
+  return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _open_writer(stream: BinaryIO, schema: pa.Schema, file_format: str):
+  if file_format == 'parquet':
+    return pq.ParquetWriter(stream, schema, compression='zstd')
+  return pa.ipc.new_file(stream, schema)
+
+
+def write_arrow(rows: Iterable[dict], stream: BinaryIO, file_format: str = 'arrow',
+                batch_size: int = BATCH_SIZE) -> int:
+  """
+  Writes rows (see dict_from_resource) as typed columnar data. The columns are taken from the keys of the first row.
+
+  Rows are converted in batches of `batch_size`, so memory stays bounded for large listings. An empty iterable gives a
+  file without rows that has the schema of the default columns, so readers do not fail on an empty listing.
+
+  :param rows: Rows to write. Can be a lazy iterable.
+  :param stream: Binary stream to write to. Does not need to be seekable.
+  :param file_format: 'arrow' for the Arrow IPC file format (Feather v2) or 'parquet'.
+  :param batch_size: Number of rows per record batch / Parquet row group.
+  :return: Number of rows written.
+  """
+  writer = None
+  schema = None
+  batch: List[dict] = []
+  row_count = 0
+  try:
+    for row in rows or []:
+      if schema is None:
+        schema = arrow_schema(list(row.keys()))
+        writer = _open_writer(stream, schema, file_format)
+      batch.append(row)
+      if len(batch) >= batch_size:
+        writer.write_batch(_record_batch(schema, batch))
+        row_count += len(batch)
+        batch = []
+    if schema is None:
+      schema = arrow_schema(['id'] + DEFAULT_COLUMNS)
+      writer = _open_writer(stream, schema, file_format)
+    if len(batch) > 0:
+      writer.write_batch(_record_batch(schema, batch))
+      row_count += len(batch)
+  finally:
+    if not writer is None:
+      writer.close()
+  stream.flush()
+  return row_count
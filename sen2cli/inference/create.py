@@ -1,19 +1,56 @@
 import logging
 from datetime import datetime
+from typing import Iterable, Iterator, Optional
 
 from jsonapi_client import Session
 from jsonapi_client.exceptions import DocumentError
-from oauthlib.oauth2 import OAuth2Token
+from jsonapi_client.resourceobject import ResourceObject
 
-from ..utils import dict_from_resource
-from .util import DEFAULT_COLUMNS, INFERENCE_SCHEMA
-from ..env import API_BASE_URL
-from ..session.oauth_util import get_user_info
+from ..utils import dict_from_resource, map_concurrent
+from .manifest import MANIFEST_DATE_FORMAT
+from .util import DEFAULT_COLUMNS, INFERENCE_SCHEMA, OperationSummary
+from ..client import Sen2CubeClient
 
 logger = logging.getLogger(__name__)
 
 
-def create_inference(token: OAuth2Token,
+def _build_inference(session: Session,
+                     owner: str,
+                     factbase_id: int,
+                     knowldegebase_id: int,
+                     temp_range_start: datetime,
+                     temp_range_end: datetime,
+                     spatial_subset: str,
+                     description: str) -> ResourceObject:
+  """Builds the (uncommitted) inference resource to create."""
+  trs = temp_range_start.strftime("%Y-%m-%dT00:00:00.000Z")
+  tre = temp_range_end.strftime("%Y-%m-%dT23:59:59.999Z")
+
+  desc = "Created by sen2cli" if description is None else description
+  inference = session.create('inference',
+                             owner=owner,
+                             timestamp_created=None,
+                             timestamp_started=None,
+                             timestamp_finished=None,
+                             status=None,
+                             output=[],
+                             favourite=False,
+                             comment=desc,
+                             fields={
+                               'status_message': None,
+                               'temp_range_start': trs,
+                               'temp_range_end': tre,
+                               'area_of_interest': spatial_subset,
+                               'output_scale_factor': 1,
+                             },
+                             )
+  inference.knowledgebase = knowldegebase_id
+  inference.factbase = factbase_id
+  logger.debug(inference.json)
+  return inference
+
+
+def create_inference(client: Sen2CubeClient,
                      factbase_id: int,
                      knowldegebase_id: int,
                      temp_range_start: datetime,
@@ -23,36 +60,12 @@ def create_inference(token: OAuth2Token,
                      dry_run: bool = False,
                      ) -> dict:
 
-  user_info = get_user_info(token)
+  user_info = client.user_info()
 
-  with Session(API_BASE_URL, schema=INFERENCE_SCHEMA,
-               request_kwargs=dict(
-                   headers={'Authorization': f"{token['token_type']} {token['access_token']}"})) as session:
+  with client.api_session(schema=INFERENCE_SCHEMA) as session:
     try:
-      trs = temp_range_start.strftime("%Y-%m-%dT00:00:00.000Z")
-      tre = temp_range_end.strftime("%Y-%m-%dT23:59:59.999Z")
-
-      desc = "Created by sen2cli" if description is None else description
-      inference = session.create('inference',
-                                 owner=user_info['preferred_username'],
-                                 timestamp_created=None,
-                                 timestamp_started=None,
-                                 timestamp_finished=None,
-                                 status=None,
-                                 output=[],
-                                 favourite=False,
-                                 comment=desc,
-                                 fields={
-                                   'status_message': None,
-                                   'temp_range_start': trs,
-                                   'temp_range_end': tre,
-                                   'area_of_interest': spatial_subset,
-                                   'output_scale_factor': 1,
-                                 },
-                                 )
-      inference.knowledgebase = knowldegebase_id
-      inference.factbase = factbase_id
-      logger.debug(inference.json)
+      inference = _build_inference(session, user_info['preferred_username'], factbase_id, knowldegebase_id,
+                                   temp_range_start, temp_range_end, spatial_subset, description)
       if not dry_run:
         inference.commit()
       else:
@@ -64,3 +77,63 @@ def create_inference(token: OAuth2Token,
       logger.error(f"Could not create inference. Reason: {e}", exc_info=True)
     finally:
       session.close()
+
+
+def _format_date(value: Optional[datetime]) -> Optional[str]:
+  return None if value is None else value.strftime(MANIFEST_DATE_FORMAT)
+
+
+def create_inferences(client: Sen2CubeClient,
+                      manifest_rows: Iterable[dict],
+                      dry_run: bool = False,
+                      concurrency: int = 1,
+                      summary: OperationSummary = None
+                      ) -> Iterator[dict]:
+  """
+  Create inferences for all rows of a manifest (see read_manifest) over one session.
+
+  The user info is resolved once and the inferences are committed on a pool of `concurrency` workers. Exactly one
+  result row is yielded per manifest row, in manifest order, with either the created id or the error.
+
+  :param manifest_rows: Rows as produced by read_manifest.
+  :param concurrency: Number of inferences created in parallel.
+  :param summary: Optional OperationSummary that counts created and failed inferences.
+  :return: Iterator over one result row per manifest row.
+  """
+  summary = OperationSummary() if summary is None else summary
+  user_info = client.user_info()
+  client.reserve_connections(concurrency)
+
+  with client.api_session(schema=INFERENCE_SCHEMA) as session:
+    def _create(row: dict) -> ResourceObject:
+      if row['error'] is not None:
+        raise ValueError(row['error'])
+      inference = _build_inference(session, user_info['preferred_username'], row['factbase_id'],
+                                   row['knowledgebase_id'], row['temp_range_start'], row['temp_range_end'],
+                                   row['spatial_subset'], row['description'])
+      if not dry_run:
+        inference.commit()
+      return inference
+
+    try:
+      if dry_run:
+        logger.info("Dry run. Skipping commit")
+      for row, inference, error in map_concurrent(_create, manifest_rows, concurrency):
+        if error is None:
+          summary.succeeded += 1
+        else:
+          summary.failed += 1
+          logger.error(f"Could not create inference for manifest row {row['row']}. Reason: {error}")
+        yield {
+          'row': row['row'],
+          'id': None if inference is None else inference.id,
+          'status': None if inference is None else inference.status,
+          'knowledgebase_id': row['knowledgebase_id'],
+          'factbase_id': row['factbase_id'],
+          'temp_range_start': _format_date(row['temp_range_start']),
+          'temp_range_end': _format_date(row['temp_range_end']),
+          'description': row['description'],
+          'error': None if error is None else str(error),
+        }
+    finally:
+      session.close()
@@ -1,63 +1,73 @@
 import logging
-from typing import List, Union
+from typing import Iterator, List, Union
 
-from jsonapi_client import Filter, Modifier, Session
 from jsonapi_client.exceptions import DocumentError
-from oauthlib.oauth2 import OAuth2Token
 
-from .util import ALLOWED_BEFORE_STATUS, DEFAULT_COLUMNS
-from ..env import API_BASE_URL
-from ..utils import dict_from_resource, filter_string_from_parameter
+from .atomic import commit_batched
+from .util import DEFAULT_COLUMNS, OperationSummary
+from .get import get_for_update
+from ..env import ATOMIC_BATCH_SIZE, DEFAULT_PAGE_SIZE
+from ..utils import dict_from_resource
+from ..client import Sen2CubeClient
 
 logger = logging.getLogger(__name__)
 
 
-def delete_inference(token: OAuth2Token,
+def delete_inference(client: Sen2CubeClient,
                      id: Union[int, List, tuple, None] = None,
                      factbase_id: Union[int, List, tuple, None] = None,
                      knowledgebase_id: Union[int, List, tuple, None] = None,
                      status: Union[str, List, tuple, None] = None,
-                     dry_run: bool = False
-                     ) -> List[dict]:
-  with Session(API_BASE_URL,
-               request_kwargs=dict(
-                   headers={'Authorization': f"{token['token_type']} {token['access_token']}"})) as session:
+                     dry_run: bool = False,
+                     concurrency: int = 1,
+                     summary: OperationSummary = None,
+                     page_size: int = DEFAULT_PAGE_SIZE,
+                     batch_size: int = ATOMIC_BATCH_SIZE
+                     ) -> Iterator[dict]:
+  """
+  Delete all inferences matching the filter.
+
+  Deletes run on a pool of `concurrency` workers, in atomic batches of `batch_size` deletes if the API supports them
+  (see commit_batched) and else as one DELETE per inference. Every deleted inference is yielded as soon as its request
+  finished, so callers can stream the results. Inferences in a status that must not be deleted are not loaded, only
+  counted as skipped. Failing deletes are logged and do not stop the remaining deletes. A DELETE that is retried after a
+  lost response and then gets 404 counts as deleted (see RetryPolicy.deleted_by_earlier_attempt).
+
+  :param concurrency: Number of deletes in flight at the same time.
+  :param summary: Optional OperationSummary that counts deleted, skipped and failed inferences.
+  :param page_size: Number of inferences loaded per request.
+  :param batch_size: Number of deletes sent per request if the API supports atomic operations.
+  :return: Iterator over the deleted inferences in order of completion.
+  """
+  summary = OperationSummary() if summary is None else summary
+  client.reserve_connections(concurrency)
+  with client.api_session() as session:
     try:
-      filter_str_list = ','.join(list(filter(None, [
-        filter_string_from_parameter('id', id),
-        filter_string_from_parameter('factbase_id', factbase_id),
-        filter_string_from_parameter('knowledgebase_id', knowledgebase_id),
-        filter_string_from_parameter('status', status)
-      ])))
-      modifier_list: List[Modifier] = []
-
-      if len(filter_str_list) > 0:
-        modifier_list.append(Filter(query_str=f'filter=[{filter_str_list}]'))
-      else:
-        raise ValueError("At least one filter argument needs to be given.")
-
-      merged_filters = sum(modifier_list, Modifier())
-
-      logger.debug(merged_filters.url_with_modifiers(''))
-      inferences = session.get('inference', merged_filters)
-      logger.info(f"Inferences loaded: {len(inferences.resources)}")
-      deleted_inferences = []
-      for inference in inferences.resources:
-        if inference.status in ALLOWED_BEFORE_STATUS['DELETE']:
-          if not dry_run:
-            inference.delete()
-            inference.commit()
-          else:
-            logger.info("Dry run. Skipping commit.")
-          deleted_inferences.append(inference)
-        else:
-          logger.warning(
-              f"Could not delete inference {inference.id}: {inference.status} -> DELETE is not allowed.")
+      with client.phase('fetch'):
+        inferences, summary.skipped = get_for_update(session, 'DELETE', id, factbase_id, knowledgebase_id, status,
+                                                     page_size, concurrency)
+      if summary.skipped > 0:
+        logger.warning(f"Skipped {summary.skipped} inferences that can not be deleted in their status.")
 
-      return [dict_from_resource(res, DEFAULT_COLUMNS) for res in deleted_inferences]
+      if dry_run:
+        logger.info("Dry run. Skipping commit.")
+        for inference in inferences:
+          summary.succeeded += 1
+          yield dict_from_resource(inference, DEFAULT_COLUMNS)
+        return
+
+      for inference in inferences:
+        inference.delete()
+      for inference, error in commit_batched(client, session, inferences, concurrency, batch_size):
+        if error is None:
+          summary.succeeded += 1
+          yield dict_from_resource(inference, DEFAULT_COLUMNS)
+        else:
+          summary.failed += 1
+          logger.error(f"Could not delete inference {inference.id}. Reason: {error}")
     except DocumentError as e:
-      logger.error(f"Could not update inference. Reason: {e}", exc_info=True)
+      logger.error(f"Could not delete inference. Reason: {e}", exc_info=True)
     except Exception as e:
-      logger.error(f"Could not update inference. Reason: {e}", exc_info=True)
+      logger.error(f"Could not delete inference. Reason: {e}", exc_info=True)
     finally:
       session.close()
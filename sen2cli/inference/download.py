@@ -0,0 +1,248 @@
+# Download of inference outputs (the files listed in `output` and `qgis_project_location`)
+import hashlib
+import logging
+import os
+from typing import Iterator, List, Optional, Tuple, Union
+from urllib.parse import urljoin, urlsplit
+
+from .get import get_inference
+from .util import OperationSummary
+from ..client import Sen2CubeClient
+from ..env import API_BASE_URL, OUTPUT_BASE_URL, RETRY_MAX
+from ..utils import dict_from_resource, map_concurrent
+
+logger = logging.getLogger(__name__)
+
+## Files are streamed to disk in chunks of this size. A broken connection loses at most the chunk being read.
+CHUNK_SIZE: int = 64 * 1024
+## Checksums verified if an output entry is an object that carries one of them, e.g. {"data": "...", "sha256": "..."}
+CHECKSUM_ALGORITHMS: List[str] = ['sha256', 'md5']
+DOWNLOAD_COLUMNS: List[str] = ['output', 'qgis_project_location']
+## Suffix of partially downloaded files. They are resumed with a range request by the next download.
+PART_SUFFIX: str = '.part'
+
+
+class OutputFile(object):
+  """One file of the output of an inference."""
+
+  def __init__(self, inference_id: int, url: str, path: str, size: Optional[int] = None,
+               checksum: Optional[Tuple[str, str]] = None):
+    self.inference_id = inference_id
+    self.url = url
+    self.path = path
+    self.size = size
+    self.checksum = checksum
+
+  def __repr__(self):
+    return f"OutputFile({self.inference_id}, {self.url})"
+
+
+def _output_url(location: str) -> str:
+  return location if urlsplit(location).scheme else urljoin(OUTPUT_BASE_URL.rstrip('/') + '/', location.lstrip('/'))
+
+
+def _url_parts(url: str) -> List[str]:
+  """Segments of the URL path without empty, `.` and `..` segments, so a file can not end up outside its directory."""
+  return [part for part in urlsplit(url).path.split('/') if not part in ('', '.', '..')]
+
+
+def _relative_paths(urls: List[str]) -> List[str]:
+  """
+  Paths of the files of one inference below its directory: the URL path without the directories all files share.
+  Files in the same directory keep their name, files in different directories (e.g. a/result.tif, b/result.tif) keep
+  the directories that differ. Paths that are still taken (same path on different hosts) get a numbered suffix.
+  """
+  parts = [_url_parts(url) for url in urls]
+  directories = [segments[:-1] for segments in parts]
+  common = 0
+  while all(len(directory) > common and directory[common] == directories[0][common] for directory in directories):
+    common += 1
+  paths = []
+  for segments in parts:
+    path = os.path.join(*segments[common:]) if len(segments) > common else 'output'
+    stem, ext = os.path.splitext(path)
+    suffix = 1
+    while path in paths:
+      suffix += 1
+      path = f"{stem}_{suffix}{ext}"
+    paths.append(path)
+  return paths
+
+
+def output_files(row: dict, output_dir: str, with_qgis: bool = True) -> List[OutputFile]:
+  """
+  Files of one inference.
+
+  Output entries are paths / URLs or objects with the path in `data` and optionally the size in `bytes` and a checksum
+  (see CHECKSUM_ALGORITHMS). Relative paths are resolved against OUTPUT_BASE_URL.
+
+  :param row: Inference with the columns DOWNLOAD_COLUMNS (see dict_from_resource).
+  :param output_dir: Files are stored as <output_dir>/<inference id>/<path>, see _relative_paths.
+  :param with_qgis: Include the QGIS project.
+  """
+  inference_id = int(row['id'])
+  ## (url, size, checksum)
+  entries = []
+  for entry in row.get('output') or []:
+    if isinstance(entry, str):
+      entries.append((_output_url(entry), None, None))
+    elif isinstance(entry, dict) and entry.get('data'):
+      checksum = next(((algorithm, entry[algorithm]) for algorithm in CHECKSUM_ALGORITHMS if entry.get(algorithm)),
+                      None)
+      size = entry.get('bytes')
+      entries.append((_output_url(entry['data']), None if size is None else int(size), checksum))
+  if with_qgis and row.get('qgis_project_location'):
+    entries.append((_output_url(row['qgis_project_location']), None, None))
+  if len(entries) == 0:
+    return []
+  paths = _relative_paths([url for url, _, _ in entries])
+  return [OutputFile(inference_id, url, os.path.join(output_dir, str(inference_id), path), size, checksum)
+          for (url, size, checksum), path in zip(entries, paths)]
+
+
+def _checksum_matches(path: str, checksum: Tuple[str, str]) -> bool:
+  algorithm, expected = checksum
+  digest = hashlib.new(algorithm)
+  with open(path, 'rb') as f:
+    for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+      digest.update(block)
+  return digest.hexdigest().lower() == str(expected).lower()
+
+
+def _is_complete(file: OutputFile) -> bool:
+  """A file is only moved to its final path once it is complete, so it is re-checked only if size / checksum are
+  known."""
+  if not os.path.isfile(file.path):
+    return False
+  if not file.checksum is None:
+    return _checksum_matches(file.path, file.checksum)
+  return file.size is None or os.path.getsize(file.path) == file.size
+
+
+def _total_size(content_range: Optional[str]) -> Optional[int]:
+  """Total size of `Content-Range: bytes <start>-<end>/<total>` or `bytes */<total>`."""
+  if content_range is None or '/' not in content_range:
+    return None
+  total = content_range.rsplit('/', 1)[1].strip()
+  return int(total) if total.isdigit() else None
+
+
+def _result(file: OutputFile, result: str) -> dict:
+  return {
+    'id': file.inference_id,
+    'url': file.url,
+    'path': file.path,
+    'bytes': os.path.getsize(file.path),
+    'result': result,
+  }
+
+
+def download_file(client: Sen2CubeClient, file: OutputFile, max_retries: int = RETRY_MAX) -> dict:
+  """
+  Downloads one file, streaming it to `<path>.part` and renaming it once it is complete.
+
+  An existing part file is resumed with a range request, also if the connection breaks during the transfer. Servers that
+  ignore the range send the whole file, which then replaces the part file. Files that already exist with the expected
+  size / checksum are skipped.
+
+  :param client: Sen2CubeClient. The session token is only sent to the API host.
+  :param file: File to download.
+  :param max_retries: Number of times an interrupted transfer is resumed.
+  :return: Row with the inference id, url, path, size and result (downloaded, resumed or skipped).
+  """
+  import requests
+
+  if _is_complete(file):
+    return _result(file, 'skipped')
+  os.makedirs(os.path.dirname(file.path) or '.', exist_ok=True)
+  part_path = file.path + PART_SUFFIX
+  same_host = urlsplit(file.url).netloc == urlsplit(API_BASE_URL).netloc
+  headers = client.authorization_header if same_host and not client.token is None else {}
+  http_session = client.http_session(file.url)
+  expected_size = file.size
+  resumed = False
+  attempt = 0
+  while True:
+    offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    request_headers = {**headers, 'Range': f'bytes={offset}-'} if offset > 0 else headers
+    try:
+      with http_session.get(file.url, headers=request_headers, stream=True) as response:
+        if response.status_code == 416 and offset > 0:
+          ## Nothing left to download. Complete if the part file has the size of the remote file, else start over.
+          if _total_size(response.headers.get('Content-Range')) == offset:
+            expected_size = offset
+            break
+          os.remove(part_path)
+          continue
+        response.raise_for_status()
+        if response.status_code == 206:
+          resumed = resumed or offset > 0
+          expected_size = _total_size(response.headers.get('Content-Range')) or expected_size
+          mode = 'ab'
+        else:
+          ## Content-Length is the compressed size if the server compresses the response
+          length = response.headers.get('Content-Length')
+          if not length is None and not 'Content-Encoding' in response.headers:
+            expected_size = int(length)
+          mode = 'wb'
+        with open(part_path, mode) as part_file:
+          for chunk in response.iter_content(CHUNK_SIZE):
+            part_file.write(chunk)
+      if expected_size is None or os.path.getsize(part_path) >= expected_size:
+        break
+      raise requests.exceptions.ChunkedEncodingError(f"Got {os.path.getsize(part_path)} of {expected_size} bytes")
+    except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError) as e:
+      if attempt >= max_retries:
+        raise
+      attempt += 1
+      logger.warning(f"Download of {file.url} interrupted ({e}). Resuming {attempt}/{max_retries}")
+
+  size = os.path.getsize(part_path)
+  if not expected_size is None and size != expected_size:
+    os.remove(part_path)
+    raise IOError(f"Got {size} bytes of {file.url}, expected {expected_size} bytes")
+  if not file.checksum is None and not _checksum_matches(part_path, file.checksum):
+    os.remove(part_path)
+    raise IOError(f"{file.checksum[0]} checksum of {file.url} does not match")
+  os.replace(part_path, file.path)
+  return _result(file, 'resumed' if resumed else 'downloaded')
+
+
+def download_inference(client: Sen2CubeClient,
+                       id: Union[int, List, tuple, None] = None,
+                       factbase_id: Union[int, List, tuple, None] = None,
+                       knowledgebase_id: Union[int, List, tuple, None] = None,
+                       status: Union[str, List, tuple, None] = None,
+                       output_dir: str = '.',
+                       concurrency: int = 1,
+                       with_qgis: bool = True,
+                       summary: OperationSummary = None
+                       ) -> Iterator[dict]:
+  """
+  Download the outputs of all inferences matching the filter.
+
+  Inferences are listed lazily and their files are downloaded by a pool of `concurrency` workers while the next pages
+  are fetched. A failing download is logged and does not stop the others.
+
+  :param output_dir: Files are stored as <output_dir>/<inference id>/<path>, see _relative_paths.
+  :param concurrency: Number of downloads in flight at the same time.
+  :param with_qgis: Also download the QGIS project of every inference.
+  :param summary: Optional OperationSummary that counts downloaded, skipped (already complete) and failed files.
+  :return: Iterator over one row per file (see download_file) in the order the downloads finish.
+  """
+  summary = OperationSummary() if summary is None else summary
+  client.reserve_connections(concurrency)
+  inferences = get_inference(client, id=id, factbase_id=factbase_id, knowledgebase_id=knowledgebase_id,
+                             status=status, prefetch=True, columns=DOWNLOAD_COLUMNS)
+  files = (file for res in inferences
+           for file in output_files(dict_from_resource(res, DOWNLOAD_COLUMNS), output_dir, with_qgis))
+  for file, result, error in map_concurrent(lambda f: download_file(client, f), files, concurrency, ordered=False):
+    if error is None:
+      if result['result'] == 'skipped':
+        summary.skipped += 1
+      else:
+        summary.succeeded += 1
+      yield result
+    else:
+      summary.failed += 1
+      logger.error(f"Could not download {file.url} of inference {file.inference_id}. Reason: {error}")
@@ -1,66 +1,321 @@
+import heapq
 import logging
-from typing import List, Union
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import chain
+from typing import Any, Callable, Iterator, List, Optional, Tuple, Union
 
-from jsonapi_client import Filter, Session
+from jsonapi_client import Session
 from jsonapi_client.exceptions import DocumentError
 from jsonapi_client.filter import Filter, Modifier
 from jsonapi_client.resourceobject import ResourceObject
-from oauthlib.oauth2 import OAuth2Token
 
-from ..env import API_BASE_URL
-from ..utils import filter_string_from_parameter
+from .util import DEFAULT_COLUMNS, actionable_status
+from ..env import DEFAULT_PAGE_SIZE, FILTER_CHUNK_SIZE
+from ..utils import filter_string_from_parameter, map_concurrent
+from ..client import Sen2CubeClient
 
 logger = logging.getLogger(__name__)
 
 
-def get_inference(token: OAuth2Token,
+def inference_filter(id: Union[int, List, tuple, None] = None,
+                     factbase_id: Union[int, List, tuple, None] = None,
+                     knowledgebase_id: Union[int, List, tuple, None] = None,
+                     status: Union[str, List, tuple, None] = None) -> Optional[Filter]:
+  """
+  JSON:API filter for the common inference filter options. Values of one option are combined with OR, different
+  options with AND.
+
+  :return: Filter or None if no filter option is set.
+  """
+  filter_str_list = ','.join(list(filter(None, [
+    filter_string_from_parameter('id', id),
+    filter_string_from_parameter('factbase_id', factbase_id),
+    filter_string_from_parameter('knowledgebase_id', knowledgebase_id),
+    filter_string_from_parameter('status', status)
+  ])))
+  return Filter(query_str=f'filter=[{filter_str_list}]') if len(filter_str_list) > 0 else None
+
+
+def _as_list(value: Union[str, int, List, tuple, None]) -> list:
+  if value is None:
+    return []
+  return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def inference_filters(id: Union[int, List, tuple, None] = None,
+                      factbase_id: Union[int, List, tuple, None] = None,
+                      knowledgebase_id: Union[int, List, tuple, None] = None,
+                      status: Union[str, List, tuple, None] = None,
+                      chunk_size: int = FILTER_CHUNK_SIZE) -> List[Optional[Filter]]:
+  """
+  Like inference_filter, but splits the longest id list into chunks of `chunk_size` values, so the URL of every
+  request stays short. One request per returned filter matches the same inferences as inference_filter.
+
+  :return: List of filters. A list with only None if no filter option is set.
+  """
+  values = {'id': _as_list(id), 'factbase_id': _as_list(factbase_id), 'knowledgebase_id': _as_list(knowledgebase_id)}
+  name = max(values, key=lambda n: len(values[n]))
+  if len(values[name]) <= chunk_size:
+    return [inference_filter(id, factbase_id, knowledgebase_id, status)]
+  unique = list(dict.fromkeys(values[name]))
+  logger.info(f"Splitting {len(unique)} {name} values into chunks of {chunk_size}")
+  return [inference_filter(status=status, **{**values, name: unique[start:start + chunk_size]})
+          for start in range(0, len(unique), chunk_size)]
+
+
+class _SortKey(object):
+  """Orders resources like a JSON:API `sort` parameter. None is ordered last (first if descending), like PostgreSQL."""
+  __slots__ = ('values', 'descending')
+
+  def __init__(self, values: tuple, descending: tuple):
+    self.values = values
+    self.descending = descending
+
+  def __eq__(self, other: '_SortKey') -> bool:
+    return self.values == other.values
+
+  def __lt__(self, other: '_SortKey') -> bool:
+    for value, other_value, descending in zip(self.values, other.values, self.descending):
+      if value == other_value:
+        continue
+      if value is None:
+        less = False
+      elif other_value is None:
+        less = True
+      else:
+        less = value < other_value
+      return not less if descending else less
+    return False
+
+
+def _sort_fields(sort_by: str) -> List[Tuple[str, bool]]:
+  return [(col.strip().lstrip('-'), col.strip().startswith('-')) for col in sort_by.split(',') if col.strip()]
+
+
+def resource_sort_key(sort_by: str) -> Callable[[ResourceObject], Any]:
+  """Key function that orders resources like the JSON:API sort parameter `sort_by` (e.g. `owner,-id`)."""
+  fields = _sort_fields(sort_by)
+  descending = tuple(desc for _, desc in fields)
+
+  def _key(res: ResourceObject) -> _SortKey:
+    return _SortKey(tuple(int(res.id) if name == 'id' else res[name] for name, _ in fields), descending)
+
+  return _key
+
+
+def update_urls(url_prefix: str,
+                action: str,
+                id: Union[int, List, tuple, None] = None,
+                factbase_id: Union[int, List, tuple, None] = None,
+                knowledgebase_id: Union[int, List, tuple, None] = None,
+                status: Union[str, List, tuple, None] = None,
+                page_size: int = DEFAULT_PAGE_SIZE) -> Tuple[List[str], List[str]]:
+  """
+  URLs for loading the inferences that an update / delete applies to.
+
+  The statuses allowed before `action` are intersected with `status` and sent as filter, so inferences that would be
+  skipped are never transferred, only counted. Long id lists are split into several requests (see inference_filters).
+
+  :param url_prefix: URL prefix of the API.
+  :param action: Key of ALLOWED_BEFORE_STATUS.
+  :return: URLs of the first pages of actionable inferences (empty if there can not be any) and URLs for counting all
+           inferences matching the filters (empty if all of them are actionable).
+  """
+  if inference_filter(id, factbase_id, knowledgebase_id, status) is None:
+    raise ValueError("At least one filter argument needs to be given.")
+  allowed = actionable_status(action, status)
+
+  list_urls = []
+  if len(allowed) > 0:
+    list_urls = [sum([list_filter,
+                      Modifier('sort=id'),
+                      Modifier(f'page[size]={page_size}'),
+                      Modifier(f'fields[inference]={",".join(DEFAULT_COLUMNS)}')],
+                     Modifier()).url_with_modifiers(f'{url_prefix}/inference')
+                 for list_filter in inference_filters(id, factbase_id, knowledgebase_id, allowed)]
+
+  count_urls = []
+  status_list = _as_list(status)
+  if len(status_list) == 0 or len(allowed) < len(set(status_list)):
+    count_urls = [sum([count_filter, Modifier('page[size]=1'), Modifier('fields[inference]=status')],
+                      Modifier()).url_with_modifiers(f'{url_prefix}/inference')
+                  for count_filter in inference_filters(id, factbase_id, knowledgebase_id, status)]
+  return list_urls, count_urls
+
+
+def skipped_count(count_documents: List[dict], actionable: int) -> int:
+  """Number of skipped inferences from the `meta.count` of the count_urls documents and the number of actionable
+  ones."""
+  counts = [(json_data.get('meta') or {}).get('count') for json_data in count_documents]
+  if None in counts:
+    logger.warning("The API did not return a count. Can not tell how many inferences were skipped.")
+    return 0
+  return max(0, sum(counts) - actionable)
+
+
+def get_for_update(session: Session,
+                   action: str,
+                   id: Union[int, List, tuple, None] = None,
+                   factbase_id: Union[int, List, tuple, None] = None,
+                   knowledgebase_id: Union[int, List, tuple, None] = None,
+                   status: Union[str, List, tuple, None] = None,
+                   page_size: int = DEFAULT_PAGE_SIZE,
+                   concurrency: int = 1) -> Tuple[List[ResourceObject], int]:
+  """
+  Load all inferences that `action` applies to. See update_urls.
+
+  All pages are loaded before anything is committed, as committing changes the set matched by the filter and would
+  shift the pages.
+
+  :param concurrency: Number of chunks of a long id list loaded in parallel.
+  :return: Actionable inferences (in the session cache, so they can be committed) and the number of skipped ones.
+  """
+  list_urls, count_urls = update_urls(session.url_prefix, action, id, factbase_id, knowledgebase_id, status, page_size)
+  inferences = []
+  for _, resources, error in map_concurrent(lambda url: list(iterate_pages(session, url, prefetch=True)), list_urls,
+                                            concurrency):
+    if not error is None:
+      raise error
+    inferences += resources
+  if len(list_urls) > 1:
+    inferences.sort(key=lambda res: int(res.id))
+  session.add_resources(*inferences)
+
+  count_documents = []
+  for _, json_data, error in map_concurrent(session._fetch_json, count_urls, concurrency):
+    if not error is None:
+      raise error
+    count_documents.append(json_data)
+  skipped = 0 if len(count_urls) == 0 else skipped_count(count_documents, len(inferences))
+  logger.info(f"Inferences loaded: {len(inferences)}, skipped: {skipped}")
+  return inferences, skipped
+
+
+def iterate_pages(session: Session, url: str, prefetch: bool = False,
+                  json_data: Optional[dict] = None) -> Iterator[ResourceObject]:
+  """
+  Lazily iterate over all resources of a paginated JSON:API collection by following `links.next`.
+
+  Resources are not added to the session cache and every page is dropped once it has been read, so memory stays
+  bounded by the page size.
+
+  :param session: Session used for fetching the pages.
+  :param url: URL of the first page including all query parameters.
+  :param prefetch: Fetch the next page in the background while the current one is being consumed.
+  :param json_data: The first page, if it was already fetched.
+  :return: Iterator over all resources of all pages.
+  """
+  with ThreadPoolExecutor(max_workers=1) if prefetch else nullcontext() as executor:
+    json_data = session._fetch_json(url) if json_data is None else json_data
+    page = 1
+    while True:
+      document = session.read(json_data, url, no_cache=True)
+      session.documents_by_link.pop(url, None)
+      logger.info(f"Page {page} loaded: {len(document.resources)} inferences")
+      next_url = document.links.next.url if document.links.next and len(document.resources) > 0 else None
+      next_page: Optional[Future] = None
+      if next_url is not None and executor is not None:
+        next_page = executor.submit(session._fetch_json, next_url)
+      yield from document.resources
+
+      if next_url is None:
+        break
+      json_data = next_page.result() if next_page is not None else session._fetch_json(next_url)
+      url = next_url
+      page += 1
+
+
+def inference_urls(url_prefix: str,
+                   id: Union[int, List, tuple, None] = None,
+                   factbase_id: Union[int, List, tuple, None] = None,
+                   knowledgebase_id: Union[int, List, tuple, None] = None,
+                   status: Union[str, List, tuple, None] = None,
+                   sort_by: str = None,
+                   raw_modifier: str = None,
+                   page_size: Optional[int] = DEFAULT_PAGE_SIZE,
+                   columns: Optional[List[str]] = None) -> List[str]:
+  """URLs of the first pages of a listing. More than one if a long id list was split (see inference_filters)."""
+  filters = inference_filters(id, factbase_id, knowledgebase_id, status)
+  if len(filters) > 1 and sort_by is not None and columns is not None:
+    ## the chunks are merged by the sort columns, so they have to be fetched
+    columns = list(dict.fromkeys(columns + [name for name, _ in _sort_fields(sort_by) if name != 'id']))
+
+  urls = []
+  for chunk_filter in filters:
+    modifier_list: List[Modifier] = []
+    if chunk_filter is not None:
+      modifier_list.append(chunk_filter)
+
+    if sort_by is not None:
+      modifier_list.append(Modifier(f'sort={sort_by}'))
+
+    if page_size is not None:
+      modifier_list.append(Modifier(f'page[size]={page_size}'))
+
+    if columns is not None:
+      modifier_list.append(Modifier(f'fields[inference]={",".join(columns)}'))
+
+    if raw_modifier is not None:
+      modifier_list.append(Modifier(raw_modifier))
+
+    merged_filters = sum(modifier_list, Modifier())
+    logger.debug(merged_filters.url_with_modifiers(''))
+    urls.append(merged_filters.url_with_modifiers(f'{url_prefix}/inference'))
+  return urls
+
+
+def get_inference(client: Sen2CubeClient,
                   id: Union[int, List, tuple, None] = None,
                   factbase_id: Union[int, List, tuple, None] = None,
                   knowledgebase_id: Union[int, List, tuple, None] = None,
                   status: Union[str, List, tuple, None] = None,
                   sort_by: str = None,
-                  raw_modifier: str = None
-                  ) -> List[ResourceObject]:
+                  raw_modifier: str = None,
+                  page_size: Optional[int] = DEFAULT_PAGE_SIZE,
+                  prefetch: bool = False,
+                  columns: Optional[List[str]] = None,
+                  raise_errors: bool = False
+                  ) -> Iterator[ResourceObject]:
   """
-  Get inferences
+  Get inferences. Pages are fetched lazily while iterating over the result.
+
+  Id lists longer than FILTER_CHUNK_SIZE are split into several queries. Their first pages are fetched in parallel and
+  the results are merged in `sort_by` order.
 
-  :param token: OAuth2Token for a valid session
+  :param client: Sen2CubeClient with a valid session token
   :param id: id(s) of the inference to fetch. None for all.
   :param factbase_id: factbase_id(s) of the inference to fetch. None for all.
   :param knowledgebase_id: knowledgebase_id(s) (models) of the inference to fetch. None for all.
   :param status: Status of the inference to fetch. None for all.
-  :return:
+  :param page_size: Number of inferences per page (`page[size]`). None for the server default.
+  :param prefetch: Fetch the next page while the current one is being consumed.
+  :param columns: Only fetch these attributes (JSON:API sparse fieldset). None for all.
+  :param raise_errors: Raise if a query fails instead of logging the error and ending the iteration.
+  :return: Iterator over all matching inferences.
   """
-  with Session(API_BASE_URL,
-               request_kwargs=dict(
-                   headers={'Authorization': f"{token['token_type']} {token['access_token']}"})) as session:
+  with client.api_session() as session:
     try:
-      filter_str_list = ','.join(list(filter(None, [
-        filter_string_from_parameter('id', id),
-        filter_string_from_parameter('factbase_id', factbase_id),
-        filter_string_from_parameter('knowledgebase_id', knowledgebase_id),
-        filter_string_from_parameter('status', status)
-      ])))
-
-      modifier_list: List[Modifier] = []
-
-      if len(filter_str_list) > 0:
-        modifier_list.append(Filter(query_str=f'filter=[{filter_str_list}]'))
-
-      if sort_by is not None:
-        modifier_list.append(Modifier(f'sort={sort_by}'))
-
-      if raw_modifier is not None:
-        modifier_list.append(Modifier(raw_modifier))
-
-      merged_filters = sum(modifier_list, Modifier())
-      logger.debug(merged_filters.url_with_modifiers(''))
-      inferences = session.get('inference', merged_filters)
-      logger.info(f"Inferences loaded: {len(inferences.resources)}")
-      return inferences.resources
+      urls = inference_urls(session.url_prefix, id, factbase_id, knowledgebase_id, status, sort_by, raw_modifier,
+                            page_size, columns)
+      if len(urls) == 1:
+        yield from iterate_pages(session, urls[0], prefetch=prefetch)
+      else:
+        first_pages = []
+        for url, json_data, error in map_concurrent(session._fetch_json, urls, client.pool_size):
+          if not error is None:
+            raise error
+          first_pages.append(json_data)
+        chunks = [iterate_pages(session, url, prefetch=prefetch, json_data=json_data)
+                  for url, json_data in zip(urls, first_pages)]
+        yield from chain(*chunks) if sort_by is None else heapq.merge(*chunks, key=resource_sort_key(sort_by))
     except DocumentError as e:
+      if raise_errors:
+        raise
       logger.error(f"Could not fetch inference. Reason: {e}", exc_info=True)
     except Exception as e:
+      if raise_errors:
+        raise
       logger.error(f"Could not fetch inference. Reason: {e}", exc_info=True)
     finally:
       session.close()
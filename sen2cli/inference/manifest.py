@@ -0,0 +1,105 @@
+import json
+import logging
+import os
+from csv import DictReader
+from datetime import datetime
+from typing import Iterator, Optional, TextIO
+
+from .aoi import AoiStats, prepare_aoi
+from ..env import DEFAULT_DELIMITER
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_DATE_FORMAT = '%Y-%m-%d'
+
+
+def _manifest_format(manifest: TextIO, manifest_format: str) -> str:
+  if manifest_format != 'auto':
+    return manifest_format
+  name = getattr(manifest, 'name', '')
+  return 'jsonl' if name.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def _parse_date(value) -> datetime:
+  if isinstance(value, datetime):
+    return value
+  return datetime.strptime(str(value).strip(), MANIFEST_DATE_FORMAT)
+
+
+def _read_aoi(raw: dict, base_dir: str, precision: Optional[int], tolerance: Optional[float],
+              aoi_stats: Optional[AoiStats]) -> str:
+  aoi = raw.get('area_of_interest')
+  if aoi in (None, ''):
+    path = raw.get('spatial_subset')
+    if path in (None, ''):
+      raise ValueError("Either 'area_of_interest' or 'spatial_subset' is required")
+    with open(os.path.join(base_dir, path), 'r') as aoi_file:
+      aoi, stats = prepare_aoi(aoi_file, precision, tolerance)
+  else:
+    aoi, stats = prepare_aoi(aoi, precision, tolerance)
+  if not aoi_stats is None:
+    aoi_stats.add(stats)
+  return aoi
+
+
+def _manifest_row(row_number: int, raw: dict, base_dir: str, precision: Optional[int] = None,
+                  tolerance: Optional[float] = None, aoi_stats: Optional[AoiStats] = None) -> dict:
+  row = {
+    'row': row_number,
+    'knowledgebase_id': None,
+    'factbase_id': None,
+    'temp_range_start': None,
+    'temp_range_end': None,
+    'spatial_subset': None,
+    'description': raw.get('description') or None,
+    'error': None,
+  }
+  try:
+    row['knowledgebase_id'] = int(raw['knowledgebase_id'])
+    row['factbase_id'] = int(raw['factbase_id'])
+    row['temp_range_start'] = _parse_date(raw['temporal_subset_start'])
+    row['temp_range_end'] = _parse_date(raw['temporal_subset_end'])
+    row['spatial_subset'] = _read_aoi(raw, base_dir, precision, tolerance, aoi_stats)
+  except KeyError as e:
+    row['error'] = f"Missing column {e}"
+  except (ValueError, TypeError, OSError) as e:
+    row['error'] = str(e)
+  return row
+
+
+def read_manifest(manifest: TextIO, manifest_format: str = 'auto', precision: Optional[int] = None,
+                  tolerance: Optional[float] = None, aoi_stats: Optional[AoiStats] = None) -> Iterator[dict]:
+  """
+  Lazily read a manifest with one inference per row.
+
+  Every row needs `knowledgebase_id`, `factbase_id`, `temporal_subset_start`, `temporal_subset_end` (YYYY-MM-DD) and
+  either an inline GeoJSON `area_of_interest` or a `spatial_subset` path (relative to the manifest). `description` is
+  optional. CSV manifests use DEFAULT_DELIMITER, JSONL manifests have one JSON object per line.
+
+  Rows that can not be parsed are not dropped but carry the reason in `error`. That includes invalid areas of interest,
+  which are validated and minified with prepare_aoi.
+
+  :param manifest: Open manifest file.
+  :param manifest_format: 'csv', 'jsonl' or 'auto' to decide by file extension.
+  :param precision: Round the coordinates of the areas of interest to this many decimal places.
+  :param tolerance: Simplify the areas of interest with this tolerance in degrees.
+  :param aoi_stats: Optional AoiStats that sums up the sizes of all areas of interest.
+  :return: Iterator over normalized manifest rows.
+  """
+  base_dir = os.path.dirname(os.path.abspath(getattr(manifest, 'name', '.')))
+  if _manifest_format(manifest, manifest_format) == 'jsonl':
+    for row_number, line in enumerate(manifest, start=1):
+      if line.strip() == '':
+        continue
+      try:
+        raw: Optional[dict] = json.loads(line)
+      except ValueError as e:
+        yield {**_manifest_row(row_number, {}, base_dir), 'error': f"Invalid JSON: {e}"}
+        continue
+      if not isinstance(raw, dict):
+        yield {**_manifest_row(row_number, {}, base_dir), 'error': "Row is not a JSON object"}
+        continue
+      yield _manifest_row(row_number, raw, base_dir, precision, tolerance, aoi_stats)
+  else:
+    for row_number, raw in enumerate(DictReader(manifest, delimiter=DEFAULT_DELIMITER), start=1):
+      yield _manifest_row(row_number, raw, base_dir, precision, tolerance, aoi_stats)
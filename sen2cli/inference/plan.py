@@ -0,0 +1,197 @@
+# Plan files of rerun / abort / delete: the affected inferences are resolved once (--plan_out), can be reviewed and the
+# action is later applied to exactly these inferences (--plan_in) without running the filter query again.
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, TextIO, Union
+
+from jsonapi_client.exceptions import DocumentError
+from jsonapi_client.filter import Modifier
+
+from .atomic import commit_batched
+from .get import get_for_update
+from .util import ALLOWED_BEFORE_STATUS, DEFAULT_COLUMNS, OperationSummary
+from ..client import Sen2CubeClient
+from ..env import API_BASE_URL, ATOMIC_BATCH_SIZE, DEFAULT_PAGE_SIZE
+from ..utils import dict_from_resource, map_concurrent
+
+logger = logging.getLogger(__name__)
+
+PLAN_FORMAT: str = 'sen2cli-plan'
+## Incremented on incompatible changes of the plan file
+PLAN_VERSION: int = 1
+## Command of every action (see ALLOWED_BEFORE_STATUS), used in messages
+PLAN_COMMANDS = {'CREATED': 'rerun', 'ABORTED': 'abort', 'DELETE': 'delete'}
+
+
+class StalePlanEntry(Exception):
+  """The inference was changed or deleted since the plan was made."""
+
+
+def plan_inference(client: Sen2CubeClient,
+                   action: str,
+                   id: Union[int, List, tuple, None] = None,
+                   factbase_id: Union[int, List, tuple, None] = None,
+                   knowledgebase_id: Union[int, List, tuple, None] = None,
+                   status: Union[str, List, tuple, None] = None,
+                   concurrency: int = 1,
+                   summary: OperationSummary = None,
+                   page_size: int = DEFAULT_PAGE_SIZE
+                   ) -> List[dict]:
+  """
+  Resolve the inferences that `action` applies to for a plan, without changing them.
+
+  Same query as update_inference / delete_inference (see get_for_update). The rows are not modified, so they carry the
+  status and status_timestamp the inferences have when the plan is made.
+
+  :param action: Key of ALLOWED_BEFORE_STATUS the plan is made for.
+  :param concurrency: Number of chunks of a long id list loaded in parallel.
+  :param summary: Optional OperationSummary that counts planned and skipped inferences.
+  :param page_size: Number of inferences loaded per request.
+  :return: List of the planned inferences (see dict_from_resource).
+  """
+  summary = OperationSummary() if summary is None else summary
+  client.reserve_connections(concurrency)
+  with client.api_session() as session:
+    try:
+      with client.phase('fetch'):
+        inferences, summary.skipped = get_for_update(session, action, id, factbase_id, knowledgebase_id, status,
+                                                     page_size, concurrency)
+      if summary.skipped > 0:
+        logger.warning(f"Skipped {summary.skipped} inferences that can not be {PLAN_COMMANDS[action]}.")
+      summary.succeeded = len(inferences)
+      return [dict_from_resource(res, DEFAULT_COLUMNS) for res in inferences]
+    finally:
+      session.close()
+
+
+def write_plan(stream: TextIO, action: str, rows: Iterable[dict], filters: dict) -> int:
+  """
+  Writes a plan file.
+
+  Every inference is stored with the status and status_timestamp observed when the plan was made. The timestamp is the
+  version marker: if it changed, the status of the inference was changed in between.
+
+  :param action: Key of ALLOWED_BEFORE_STATUS the plan is made for.
+  :param rows: Unmodified inferences with at least id, status and status_timestamp (see plan_inference).
+  :param filters: Filters the inferences were resolved with. Only informative.
+  :return: Number of inferences in the plan.
+  """
+  entries = [{'id': str(row['id']), 'status': row['status'], 'status_timestamp': row['status_timestamp']}
+             for row in rows]
+  json.dump({
+    'format': PLAN_FORMAT,
+    'version': PLAN_VERSION,
+    'action': action,
+    'api': API_BASE_URL,
+    'created': datetime.now(timezone.utc).isoformat(),
+    'filters': filters,
+    'inferences': entries,
+  }, stream, indent=2)
+  stream.write('\n')
+  return len(entries)
+
+
+def read_plan(stream: TextIO, action: str) -> dict:
+  """
+  Reads a plan file written by write_plan.
+
+  :param action: Action the plan is applied with. Has to be the action it was made for.
+  :raises ValueError: If the file is no plan, of another version, for another action or for another API.
+  """
+  try:
+    plan = json.load(stream)
+  except ValueError as e:
+    raise ValueError(f"Not a plan file: {e}")
+  if not isinstance(plan, dict) or plan.get('format') != PLAN_FORMAT:
+    raise ValueError("Not a plan file.")
+  if plan.get('version') != PLAN_VERSION:
+    raise ValueError(f"Unsupported plan version {plan.get('version')}, expected {PLAN_VERSION}.")
+  if plan.get('action') != action:
+    raise ValueError(f"The plan was made for `{PLAN_COMMANDS.get(plan.get('action'), plan.get('action'))}`, "
+                     f"not for `{PLAN_COMMANDS.get(action, action)}`.")
+  if plan.get('api') != API_BASE_URL:
+    raise ValueError(f"The plan was made for {plan.get('api')}, not for {API_BASE_URL}.")
+  return plan
+
+
+def apply_plan(client: Sen2CubeClient,
+               plan: dict,
+               dry_run: bool = False,
+               concurrency: int = 1,
+               summary: OperationSummary = None,
+               batch_size: int = ATOMIC_BATCH_SIZE
+               ) -> Iterator[dict]:
+  """
+  Apply the action of a plan to exactly the inferences of the plan.
+
+  Every inference is read by id (GET /inference/<id>) and only changed if its status_timestamp still matches the plan
+  and its status still allows the action (see ALLOWED_BEFORE_STATUS). Changed and deleted inferences are reported as
+  stale and skipped. Reads and commits run on a pool of `concurrency` workers, the commits in atomic batches if the API
+  supports them (see commit_batched).
+
+  :param plan: Plan as returned by read_plan.
+  :param dry_run: Only check the inferences for staleness.
+  :param concurrency: Number of inferences processed in parallel.
+  :param summary: Optional OperationSummary that counts applied, stale (skipped) and failed inferences.
+  :param batch_size: Number of changes sent per request if the API supports atomic operations.
+  :return: Iterator over the changed inferences in order of completion.
+  """
+  summary = OperationSummary() if summary is None else summary
+  action = plan['action']
+  client.reserve_connections(concurrency)
+  with client.api_session() as session:
+    def _check(entry: dict):
+      url = Modifier(f'fields[inference]={",".join(DEFAULT_COLUMNS)}').url_with_modifiers(
+        f"{session.url_prefix}/inference/{entry['id']}")
+      try:
+        document = session.read(session._fetch_json(url), url, no_cache=True)
+      except DocumentError as e:
+        if (e.errors or {}).get('status_code') == 404:
+          raise StalePlanEntry(f"Inference {entry['id']} was deleted since the plan was made.")
+        raise
+      session.documents_by_link.pop(url, None)
+      inference = document.resource
+      if inference['status_timestamp'] != entry['status_timestamp']:
+        raise StalePlanEntry(f"Inference {entry['id']} changed since the plan was made: planned with status "
+                             f"{entry.get('status')} since {entry['status_timestamp']}, now {inference.status} since "
+                             f"{inference['status_timestamp']}.")
+      if not inference.status in ALLOWED_BEFORE_STATUS[action]:
+        raise StalePlanEntry(f"Inference {entry['id']} has status {inference.status}, "
+                             f"it can not be {PLAN_COMMANDS[action]}.")
+      return inference
+
+    try:
+      inferences = []
+      for entry, inference, error in map_concurrent(_check, plan['inferences'], concurrency):
+        if error is None:
+          inferences.append(inference)
+        elif isinstance(error, StalePlanEntry):
+          summary.skipped += 1
+          logger.warning(f"{error} Skipped.")
+        else:
+          summary.failed += 1
+          logger.error(f"Could not {PLAN_COMMANDS[action]} inference {entry['id']}. Reason: {error}")
+
+      if dry_run:
+        logger.info("Dry run. Skipping commit.")
+        for inference in inferences:
+          summary.succeeded += 1
+          yield dict_from_resource(inference, DEFAULT_COLUMNS)
+        return
+
+      for inference in inferences:
+        session.add_resources(inference)
+        if action == 'DELETE':
+          inference.delete()
+        else:
+          inference.status = action
+      for inference, error in commit_batched(client, session, inferences, concurrency, batch_size):
+        if error is None:
+          summary.succeeded += 1
+          yield dict_from_resource(inference, DEFAULT_COLUMNS)
+        else:
+          summary.failed += 1
+          logger.error(f"Could not {PLAN_COMMANDS[action]} inference {inference.id}. Reason: {error}")
+    finally:
+      session.close()
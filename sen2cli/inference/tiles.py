@@ -0,0 +1,96 @@
+# Inferences of a tiled area of interest (`inference create --tile_size`) and their tile manifest
+import json
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO
+
+from .get import get_inference
+from ..client import Sen2CubeClient
+from ..env import FILTER_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+TILE_STATUS_COLUMNS: List[str] = ['status', 'status_progress', 'status_message']
+
+
+def tile_rows(tiles: List[dict], knowledgebase_id: int, factbase_id: int, temp_range_start: datetime,
+              temp_range_end: datetime, description: Optional[str]) -> Iterator[dict]:
+  """Rows for create_inferences, one per tile (see aoi.tile_aoi). The row number is the index of the tile + 1."""
+  for row_number, tile in enumerate(tiles, start=1):
+    yield {
+      'row': row_number,
+      'knowledgebase_id': knowledgebase_id,
+      'factbase_id': factbase_id,
+      'temp_range_start': temp_range_start,
+      'temp_range_end': temp_range_end,
+      'spatial_subset': json.dumps(tile['geometry'], separators=(',', ':')),
+      'description': f"{description or 'Created by sen2cli'} (tile {tile['tile']})",
+      'error': None,
+    }
+
+
+def tile_manifest_entry(tile: dict, created: dict) -> dict:
+  """Line of the tile manifest: the tile, its geometry and the result of create_inferences for it."""
+  return {
+    'tile': tile['tile'],
+    'id': created['id'],
+    'error': created['error'],
+    'knowledgebase_id': created['knowledgebase_id'],
+    'factbase_id': created['factbase_id'],
+    'temp_range_start': created['temp_range_start'],
+    'temp_range_end': created['temp_range_end'],
+    'bbox': tile['bbox'],
+    'geometry': tile['geometry'],
+  }
+
+
+def read_tile_manifest(manifest: TextIO) -> List[dict]:
+  """Reads a tile manifest (JSON lines, see tile_manifest_entry)."""
+  entries = []
+  for line_number, line in enumerate(manifest, start=1):
+    if line.strip() == '':
+      continue
+    try:
+      entries.append(json.loads(line))
+    except ValueError as e:
+      raise ValueError(f"Line {line_number} is not valid JSON: {e}")
+  return entries
+
+
+def tile_status(client: Sen2CubeClient, entries: Iterable[dict]) -> Iterator[dict]:
+  """
+  Current status of the inference of every tile.
+
+  All inferences are fetched with one `id in (...)` listing (split into parallel queries of FILTER_CHUNK_SIZE ids), only
+  the status columns are requested.
+
+  :param entries: Tile manifest entries (see read_tile_manifest).
+  :return: Iterator over one row per tile in manifest order. The status is NOT CREATED for tiles whose inference could
+           not be created and NOT FOUND for deleted inferences.
+  :raises Exception: If the inferences can not be fetched.
+  """
+  entries = list(entries)
+  ids = [int(entry['id']) for entry in entries if not entry.get('id') is None]
+  status: Dict[str, dict] = {}
+  if len(ids) > 0:
+    ## a failed query raises, it must not report every tile as NOT FOUND
+    inferences = get_inference(client, id=ids, page_size=min(len(ids), FILTER_CHUNK_SIZE),
+                               columns=TILE_STATUS_COLUMNS, raise_errors=True)
+    status = {str(res.id): {col: res[col] for col in TILE_STATUS_COLUMNS} for res in inferences}
+  for entry in entries:
+    if entry.get('id') is None:
+      current = {'status': 'NOT CREATED', 'status_progress': None, 'status_message': entry.get('error')}
+    else:
+      current = status.get(str(entry['id']), {'status': 'NOT FOUND', 'status_progress': None, 'status_message': None})
+    yield {'tile': entry['tile'], 'id': entry.get('id'), **current}
+
+
+def progress_summary(rows: Iterable[dict]) -> str:
+  """Number of tiles per status and the mean progress of all tiles. Succeeded tiles count as 100%."""
+  rows = list(rows)
+  counts = Counter(row['status'] for row in rows)
+  progress = [100.0 if row['status'] == 'SUCCEEDED' else float(row['status_progress'] or 0) for row in rows]
+  mean = sum(progress) / len(progress) if len(progress) > 0 else 0.0
+  return f"{len(rows)} tiles: " + ', '.join(f"{status} {count}" for status, count in sorted(counts.items())) + \
+         f". Progress {mean:.0f}%"
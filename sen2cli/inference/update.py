@@ -1,60 +1,74 @@
 import logging
 from typing import List, Union
 
-from jsonapi_client import Filter, Modifier, Session
 from jsonapi_client.exceptions import DocumentError
-from oauthlib.oauth2 import OAuth2Token
 
-from .util import ALLOWED_BEFORE_STATUS, DEFAULT_COLUMNS
-from ..env import API_BASE_URL
-from ..utils import dict_from_resource, filter_string_from_parameter
+from .atomic import commit_batched
+from .util import DEFAULT_COLUMNS, OperationSummary
+from .get import get_for_update
+from ..env import ATOMIC_BATCH_SIZE, DEFAULT_PAGE_SIZE
+from ..utils import dict_from_resource
+from ..client import Sen2CubeClient
 
 logger = logging.getLogger(__name__)
 
 
-def update_inference(token: OAuth2Token,
+def update_inference(client: Sen2CubeClient,
                      id: Union[int, List, tuple, None] = None,
                      factbase_id: Union[int, List, tuple, None] = None,
                      knowledgebase_id: Union[int, List, tuple, None] = None,
                      status: Union[str, List, tuple, None] = None,
                      new_status: str = None,
-                     dry_run: bool = False
+                     dry_run: bool = False,
+                     concurrency: int = 1,
+                     summary: OperationSummary = None,
+                     page_size: int = DEFAULT_PAGE_SIZE,
+                     batch_size: int = ATOMIC_BATCH_SIZE
                      ) -> List[dict]:
-  with Session(API_BASE_URL,
-               request_kwargs=dict(
-                   headers={'Authorization': f"{token['token_type']} {token['access_token']}"})) as session:
-    try:
-      filter_str_list = ','.join(list(filter(None, [
-        filter_string_from_parameter('id', id),
-        filter_string_from_parameter('factbase_id', factbase_id),
-        filter_string_from_parameter('knowledgebase_id', knowledgebase_id),
-        filter_string_from_parameter('status', status)
-      ])))
-      modifier_list: List[Modifier] = []
+  """
+  Set a new status for all inferences matching the filter.
+
+  Only inferences whose status allows the transition (see ALLOWED_BEFORE_STATUS) are loaded, the others are only
+  counted as skipped. The commits then run on a pool of `concurrency` workers, in atomic batches of `batch_size`
+  updates if the API supports them (see commit_batched) and else as one PATCH per inference. A failing commit is logged
+  and only drops that single inference from the result.
 
-      if len(filter_str_list) > 0:
-        modifier_list.append(Filter(query_str=f'filter=[{filter_str_list}]'))
-      else:
-        raise ValueError("At least one filter argument needs to be given.")
+  :param concurrency: Number of commits in flight at the same time.
+  :param summary: Optional OperationSummary that counts updated, skipped and failed inferences.
+  :param page_size: Number of inferences loaded per request.
+  :param batch_size: Number of updates sent per request if the API supports atomic operations.
+  :return: List of updated inferences in the order they were loaded.
+  """
+  summary = OperationSummary() if summary is None else summary
+  client.reserve_connections(concurrency)
+  with client.api_session() as session:
+    try:
+      with client.phase('fetch'):
+        inferences, summary.skipped = get_for_update(session, new_status, id, factbase_id, knowledgebase_id, status,
+                                                     page_size, concurrency)
+      if summary.skipped > 0:
+        logger.warning(f"Skipped {summary.skipped} inferences whose status can not be set to {new_status}.")
+      for inference in inferences:
+        inference.status = new_status
 
-      merged_filters = sum(modifier_list, Modifier())
+      if dry_run:
+        logger.info("Dry run. Skipping commit.")
+        summary.succeeded = len(inferences)
+        return [dict_from_resource(res, DEFAULT_COLUMNS) for res in inferences]
 
-      logger.debug(merged_filters.url_with_modifiers(''))
-      inferences = session.get('inference', merged_filters)
-      logger.info(f"Inferences loaded: {len(inferences.resources)}")
       updated_inferences = []
-      for inference in inferences.resources:
-        if inference.status in ALLOWED_BEFORE_STATUS[new_status]:
-          inference.status = new_status
-          if not dry_run:
-            inference.commit()
+      with client.phase('commit'):
+        for inference, error in commit_batched(client, session, inferences, concurrency, batch_size):
+          if error is None:
+            summary.succeeded += 1
+            updated_inferences.append(inference)
           else:
-            logger.info("Dry run. Skipping commit.")
-          updated_inferences.append(inference)
-        else:
-          logger.warning(
-              f"Could not set new status for inference {inference.id}: {inference.status} -> {new_status} is not allowed.")
+            summary.failed += 1
+            logger.error(f"Could not set new status for inference {inference.id}. Reason: {error}")
 
+      ## batches complete in any order
+      position = {res.id: index for index, res in enumerate(inferences)}
+      updated_inferences.sort(key=lambda res: position[res.id])
       return [dict_from_resource(res, DEFAULT_COLUMNS) for res in updated_inferences]
     except DocumentError as e:
       logger.error(f"Could not update inference. Reason: {e}", exc_info=True)
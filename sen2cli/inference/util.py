@@ -1,4 +1,4 @@
-from typing import Final, List
+from typing import Final, List, Union
 
 INFERENCE_STATUS = ['ABORTED',
                     'CREATED',
@@ -9,6 +9,9 @@ INFERENCE_STATUS = ['ABORTED',
                     'SUCCEEDED'
                     ]
 
+## An inference in one of these states will not change its status on its own anymore
+TERMINAL_STATUS = ['ABORTED', 'FAILED', 'SUCCEEDED']
+
 ALLOWED_BEFORE_STATUS = {
   'CREATED': ['ABORTED', 'FAILED', 'SUCCEEDED'],
   'ABORTED': ['CREATED', 'SCHEDULED', 'STARTED'],
@@ -16,6 +19,26 @@ ALLOWED_BEFORE_STATUS = {
 }
 
 
+def actionable_status(action: str, status: Union[str, List, tuple, None] = None) -> List[str]:
+  """Statuses an inference may have for `action` (a key of ALLOWED_BEFORE_STATUS), restricted to `status` if given."""
+  if status is None or len(status) == 0:
+    return list(ALLOWED_BEFORE_STATUS[action])
+  status = [status] if isinstance(status, str) else status
+  return [s for s in ALLOWED_BEFORE_STATUS[action] if s in status]
+
+
+class OperationSummary(object):
+  """Counts the outcome of a bulk operation on inferences."""
+
+  def __init__(self):
+    self.succeeded = 0
+    self.skipped = 0
+    self.failed = 0
+
+  def __str__(self):
+    return f"succeeded: {self.succeeded}, skipped: {self.skipped}, failed: {self.failed}"
+
+
 DEFAULT_COLUMNS: Final[List[str]] = [
   'factbase_id',
   'favourite',
@@ -34,6 +57,13 @@ DEFAULT_COLUMNS: Final[List[str]] = [
   'timestamp_started'
 ]
 
+## area_of_interest can be huge and is therefore never fetched unless explicitly requested
+AVAILABLE_COLUMNS: Final[List[str]] = sorted(DEFAULT_COLUMNS + [
+  'area_of_interest',
+  'comment',
+  'output_scale_factor'
+])
+
 INFERENCE_SCHEMA = {
   "inference": {
     "properties": {
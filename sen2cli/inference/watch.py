@@ -0,0 +1,110 @@
+import logging
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from jsonapi_client.resourceobject import ResourceObject
+
+from .get import get_inference
+from .util import DEFAULT_COLUMNS, TERMINAL_STATUS
+from ..client import Sen2CubeClient
+from ..env import DEFAULT_WATCH_INTERVAL, DEFAULT_WATCH_MAX_INTERVAL
+from ..utils import dict_from_resource
+
+logger = logging.getLogger(__name__)
+
+## Fields requested on every tick. Full rows are only fetched for inferences whose status_timestamp moved.
+WATCH_COLUMNS: List[str] = ['status', 'status_timestamp']
+BACKOFF_FACTOR: float = 1.5
+
+
+def _poll(client: Sen2CubeClient, pending: List[str], status_timestamps: Dict[str, Optional[str]]
+          ) -> Tuple[Set[str], Dict[str, ResourceObject]]:
+  """
+  One tick of watch_inference. Raises if a query fails, so that a failed tick is not taken for deleted inferences.
+
+  :return: Ids of the pending inferences that still exist and the full rows of those whose status_timestamp moved.
+  """
+  client.load_token(client.tokenfile)
+  first_tick = len(status_timestamps) == 0
+  rows = {res.id: res for res in get_inference(client, id=[int(i) for i in pending], page_size=len(pending),
+                                               columns=DEFAULT_COLUMNS if first_tick else WATCH_COLUMNS,
+                                               raise_errors=True)}
+  changed = [inference_id for inference_id, res in rows.items()
+             if inference_id not in status_timestamps or status_timestamps[inference_id] != res['status_timestamp']]
+  if len(changed) > 0 and not first_tick:
+    full_rows = {res.id: res for res in get_inference(client, id=[int(i) for i in changed], page_size=len(changed),
+                                                      columns=DEFAULT_COLUMNS, raise_errors=True)}
+  else:
+    full_rows = rows
+  return set(rows), {inference_id: full_rows[inference_id] for inference_id in changed if inference_id in full_rows}
+
+
+def watch_inference(client: Sen2CubeClient,
+                    ids: Iterable[int],
+                    interval: float = DEFAULT_WATCH_INTERVAL,
+                    max_interval: float = DEFAULT_WATCH_MAX_INTERVAL,
+                    timeout: Optional[float] = None,
+                    final_status: Dict[str, Optional[str]] = None,
+                    sleep: Callable[[float], None] = time.sleep
+                    ) -> Iterator[dict]:
+  """
+  Poll a set of inferences until all of them reached a terminal status (see TERMINAL_STATUS).
+
+  Every tick issues one batched query for the `status` and `status_timestamp` of all pending inferences. Full rows
+  are only fetched for the inferences whose status_timestamp moved since the previous tick. The first tick fetches
+  full rows right away. While nothing changes the poll interval grows by BACKOFF_FACTOR up to max_interval and it
+  drops back to interval as soon as something changes. A tick whose query fails (timeout, server error, expired
+  session) is retried with the same backoff. Only inferences missing from a successful query are dropped as deleted.
+
+  :param client: Sen2CubeClient with a valid session token
+  :param ids: Ids of the inferences to watch.
+  :param interval: Initial poll interval in seconds.
+  :param max_interval: Maximum poll interval in seconds.
+  :param timeout: Stop watching after this many seconds. None to wait forever.
+  :param final_status: Optional dict that receives the last known status per inference id (None if not found).
+  :param sleep: Function used for waiting between ticks.
+  :return: Iterator over the full rows of every inference whose status changed, as they change.
+  """
+  final_status = {} if final_status is None else final_status
+  pending = sorted({str(i) for i in ids}, key=int)
+  for inference_id in pending:
+    final_status.setdefault(inference_id, None)
+  status_timestamps: Dict[str, Optional[str]] = {}
+  deadline = None if timeout is None else time.monotonic() + timeout
+  delay = interval
+  tick = 0
+
+  while len(pending) > 0:
+    tick += 1
+    try:
+      found, changed = _poll(client, pending, status_timestamps)
+    except Exception as e:
+      delay = min(delay * BACKOFF_FACTOR, max_interval)
+      logger.warning(f"Tick {tick} failed. Reason: {e}. Retrying.")
+    else:
+      logger.info(f"Tick {tick}: {len(pending)} pending, {len(changed)} changed")
+      for inference_id in pending:
+        if inference_id not in found:
+          logger.warning(f"Inference {inference_id} not found. Not watching it anymore.")
+      pending = [inference_id for inference_id in pending if inference_id in found]
+
+      if len(changed) > 0:
+        for inference_id, res in changed.items():
+          status_timestamps[inference_id] = res['status_timestamp']
+          final_status[inference_id] = res['status']
+          yield dict_from_resource(res, DEFAULT_COLUMNS)
+        pending = [inference_id for inference_id in pending if final_status[inference_id] not in TERMINAL_STATUS]
+        delay = interval
+      else:
+        delay = min(delay * BACKOFF_FACTOR, max_interval)
+
+    if len(pending) == 0:
+      break
+    if deadline is not None:
+      remaining = deadline - time.monotonic()
+      if remaining <= 0:
+        logger.warning(f"Timeout reached. {len(pending)} inferences did not finish.")
+        break
+      delay = min(delay, remaining)
+    logger.debug(f"Next poll in {delay:.1f}s")
+    sleep(delay)
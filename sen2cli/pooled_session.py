@@ -0,0 +1,221 @@
+# jsonapi_client Sessions that send their requests through the connection pools of Sen2CubeClient
+import asyncio
+import json
+import logging
+import time
+from typing import List, Optional, Tuple
+
+import aiohttp
+import requests
+from jsonapi_client import Session
+from jsonapi_client.common import HttpStatus, error_from_response
+from jsonapi_client.exceptions import DocumentError
+from requests.adapters import HTTPAdapter
+
+from .retry import RetryPolicy, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+## JSON:API Atomic Operations extension (https://jsonapi.org/ext/atomic/)
+ATOMIC_EXT = 'https://jsonapi.org/ext/atomic'
+ATOMIC_CONTENT_TYPE = f'application/vnd.api+json;ext="{ATOMIC_EXT}"'
+
+
+def _operations_results(status: int, content: bytes, operations: List[dict], json_data: dict, response) -> List[dict]:
+  try:
+    response_json = json.loads(content) if content else {}
+  except ValueError:
+    response_json = {}
+  if status == HttpStatus.NO_CONTENT_204:
+    return [{} for _ in operations]
+  if status != HttpStatus.OK_200:
+    raise DocumentError(f'Could not POST operations ({status}): {error_from_response(response_json)}',
+                        errors={'status_code': status},
+                        response=response,
+                        json_data=json_data)
+  return response_json.get('atomic:results') or [{} for _ in operations]
+
+
+class RetryingAdapter(HTTPAdapter):
+  """HTTPAdapter that sends every request through the client's rate limiter and retries failed requests according to
+  its RetryPolicy. Mounted on all pooled requests.Sessions of Sen2CubeClient."""
+
+  def __init__(self, rate_limiter: Optional[TokenBucket] = None, retry_policy: Optional[RetryPolicy] = None,
+               **kwargs) -> None:
+    super().__init__(**kwargs)
+    self.rate_limiter = rate_limiter
+    self.retry_policy = retry_policy
+
+  def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+    attempt = 0
+    while True:
+      if not self.rate_limiter is None:
+        self.rate_limiter.acquire()
+      try:
+        response = super().send(request, **kwargs)
+      except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        delay = None if self.retry_policy is None else self.retry_policy.next_delay(request.method, None, attempt)
+        if delay is None:
+          raise
+      else:
+        if not self.retry_policy is None \
+            and self.retry_policy.deleted_by_earlier_attempt(request.method, response.status_code, attempt):
+          logger.info(f"{request.method} {request.url} found nothing after a retry. Deleted by an earlier attempt.")
+          response.status_code = HttpStatus.NO_CONTENT_204
+          response._content = b''
+          return response
+        delay = None if self.retry_policy is None else self.retry_policy.next_delay(
+            request.method, response.status_code, attempt, response.headers.get('Retry-After'))
+        if delay is None:
+          return response
+        ## read the (error) body, so the connection goes back to the pool
+        response.content
+        response.close()
+      time.sleep(delay)
+      attempt += 1
+
+
+class PooledSession(Session):
+  """jsonapi_client Session that sends all requests through a shared, pooled requests.Session.
+
+  The upstream Session uses the module level `requests` functions, which open a new connection (and TLS handshake)
+  for every single request.
+  """
+
+  def __init__(self, http_session: requests.Session, server_url: str, schema: dict = None,
+               request_kwargs: dict = None) -> None:
+    super().__init__(server_url, schema=schema, request_kwargs=request_kwargs)
+    self._http_session = http_session
+
+  def _fetch_json(self, url: str) -> dict:
+    self.assert_sync()
+    logger.info(f"Fetching document from url {url}")
+    response = self._http_session.get(url, **self._request_kwargs)
+    response_content = response.json()
+    if response.status_code == HttpStatus.OK_200:
+      return response_content
+    else:
+      raise DocumentError(f'Error {response.status_code}: {error_from_response(response_content)}',
+                          errors={'status_code': response.status_code},
+                          response=response)
+
+  def http_request(self, http_method: str, url: str, send_json: dict,
+                   expected_statuses: List[str] = None) -> Tuple[int, dict, str]:
+    self.assert_sync()
+    logger.debug(f"{http_method.upper()} request: {send_json}")
+    expected_statuses = expected_statuses or HttpStatus.ALL_OK
+    kwargs = {**self._request_kwargs}
+    headers = {'Content-Type': 'application/vnd.api+json'}
+    headers.update(kwargs.pop('headers', {}))
+
+    response = self._http_session.request(http_method, url, json=send_json, headers=headers, **kwargs)
+    response_json = response.json() if response.content else {}
+    if response.status_code not in expected_statuses:
+      raise DocumentError(f'Could not {http_method.upper()} ({response.status_code}): '
+                          f'{error_from_response(response_json)}',
+                          errors={'status_code': response.status_code},
+                          response=response,
+                          json_data=send_json)
+
+    return response.status_code, response_json, response.headers.get('Location')
+
+  def post_operations(self, operations: List[dict]) -> List[dict]:
+    """Sends JSON:API atomic operations to <server_url>/operations in one request and returns their results. The
+    server applies all of them or none."""
+    self.assert_sync()
+    logger.debug(f"POST {len(operations)} atomic operations")
+    kwargs = {**self._request_kwargs}
+    headers = {**kwargs.pop('headers', {}), 'Content-Type': ATOMIC_CONTENT_TYPE, 'Accept': ATOMIC_CONTENT_TYPE}
+    send_json = {'atomic:operations': operations}
+    response = self._http_session.post(f'{self.url_prefix}/operations', json=send_json, headers=headers, **kwargs)
+    return _operations_results(response.status_code, response.content, operations, send_json, response)
+
+
+class AsyncPooledSession(Session):
+  """jsonapi_client Session in asyncio mode that sends all requests through the client's aiohttp session.
+
+  The aiohttp session (and its connection pool) is owned by Sen2CubeClient, so closing this Session only invalidates
+  its resources.
+  """
+
+  def __init__(self, aiohttp_session: aiohttp.ClientSession, server_url: str, schema: dict = None,
+               request_kwargs: dict = None, rate_limiter: Optional[TokenBucket] = None,
+               retry_policy: Optional[RetryPolicy] = None) -> None:
+    super().__init__(server_url, schema=schema, request_kwargs=request_kwargs)
+    self.enable_async = True
+    self._aiohttp_session = aiohttp_session
+    self._rate_limiter = rate_limiter
+    self._retry_policy = retry_policy
+
+  async def close(self):
+    self.invalidate()
+
+  async def _send_async(self, http_method: str, url: str, **kwargs) -> Tuple[aiohttp.ClientResponse, bytes]:
+    """Sends a request through the rate limiter, retries it according to the RetryPolicy and returns the last response
+    and its body."""
+    attempt = 0
+    while True:
+      if not self._rate_limiter is None:
+        await asyncio.sleep(self._rate_limiter.reserve())
+      try:
+        async with self._aiohttp_session.request(http_method, url, **kwargs) as response:
+          content = await response.read()
+      except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+        delay = None if self._retry_policy is None else self._retry_policy.next_delay(http_method, None, attempt)
+        if delay is None:
+          raise
+      else:
+        if not self._retry_policy is None \
+            and self._retry_policy.deleted_by_earlier_attempt(http_method, response.status, attempt):
+          logger.info(f"{http_method} {url} found nothing after a retry. Deleted by an earlier attempt.")
+          response.status = HttpStatus.NO_CONTENT_204
+          return response, b''
+        delay = None if self._retry_policy is None else self._retry_policy.next_delay(
+            http_method, response.status, attempt, response.headers.get('Retry-After'))
+        if delay is None:
+          return response, content
+      await asyncio.sleep(delay)
+      attempt += 1
+
+  async def _fetch_json_async(self, url: str) -> dict:
+    self.assert_async()
+    logger.info(f"Fetching document from url {url}")
+    response, content = await self._send_async('GET', url, **self._request_kwargs)
+    response_content = json.loads(content) if content else {}
+    if response.status == HttpStatus.OK_200:
+      return response_content
+    else:
+      raise DocumentError(f'Error {response.status}: {error_from_response(response_content)}',
+                          errors={'status_code': response.status},
+                          response=response)
+
+  async def http_request_async(self, http_method: str, url: str, send_json: dict,
+                               expected_statuses: List[str] = None) -> Tuple[int, dict, str]:
+    self.assert_async()
+    logger.debug(f"{http_method.upper()} request: {send_json}")
+    expected_statuses = expected_statuses or HttpStatus.ALL_OK
+    kwargs = {**self._request_kwargs}
+    headers = {'Content-Type': 'application/vnd.api+json'}
+    headers.update(kwargs.pop('headers', {}))
+
+    response, content = await self._send_async(http_method.upper(), url, json=send_json, headers=headers, **kwargs)
+    response_json = json.loads(content) if content else {}
+    if response.status not in expected_statuses:
+      raise DocumentError(f'Could not {http_method.upper()} ({response.status}): '
+                          f'{error_from_response(response_json)}',
+                          errors={'status_code': response.status},
+                          response=response,
+                          json_data=send_json)
+
+    return response.status, response_json, response.headers.get('Location')
+
+  async def post_operations_async(self, operations: List[dict]) -> List[dict]:
+    """Async version of PooledSession.post_operations."""
+    self.assert_async()
+    logger.debug(f"POST {len(operations)} atomic operations")
+    kwargs = {**self._request_kwargs}
+    headers = {**kwargs.pop('headers', {}), 'Content-Type': ATOMIC_CONTENT_TYPE, 'Accept': ATOMIC_CONTENT_TYPE}
+    send_json = {'atomic:operations': operations}
+    response, content = await self._send_async('POST', f'{self.url_prefix}/operations', json=send_json,
+                                               headers=headers, **kwargs)
+    return _operations_results(response.status, content, operations, send_json, response)
@@ -0,0 +1,141 @@
+# Client side rate limiting and retry policy shared by all requests of one sen2cli invocation
+import logging
+import random
+import threading
+import time
+from typing import FrozenSet, Iterable, Optional
+
+from .env import RATE_LIMIT, RATE_LIMIT_BURST, RETRY_BACKOFF, RETRY_BUDGET, RETRY_MAX, RETRY_MAX_BACKOFF
+
+logger = logging.getLogger(__name__)
+
+## Retried for every method, the request was rejected before it was processed. 503 only if sent with Retry-After.
+THROTTLED_STATUS: FrozenSet[int] = frozenset([429, 503])
+## Retried for idempotent methods only
+RETRY_STATUS: FrozenSet[int] = frozenset([502, 503, 504])
+## PATCH is included, because sen2cli only PATCHes absolute attribute values (e.g. a new status)
+IDEMPOTENT_METHODS: FrozenSet[str] = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'PATCH'])
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+  """Seconds to wait according to a Retry-After header (delay in seconds or HTTP date). None if missing / invalid."""
+  if value is None:
+    return None
+  try:
+    return max(0.0, float(value))
+  except ValueError:
+    pass
+  from email.utils import parsedate_to_datetime
+  try:
+    return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+  except (TypeError, ValueError):
+    return None
+
+
+class TokenBucket(object):
+  """Thread safe token bucket. Allows bursts of up to `burst` requests and `rate` requests per second on average.
+
+  reserve() takes a token right away and returns how long the caller has to wait before sending, so the same bucket
+  can be used from threads (time.sleep) and from the asyncio engine (asyncio.sleep).
+  """
+
+  def __init__(self, rate: float = RATE_LIMIT, burst: int = RATE_LIMIT_BURST):
+    self.rate = rate
+    self.burst = max(1, burst)
+    self._tokens = float(self.burst)
+    self._updated = time.monotonic()
+    self._paused_until = 0.0
+    self._lock = threading.Lock()
+
+  def reserve(self) -> float:
+    """Takes a token and returns the number of seconds to wait before it may be used."""
+    with self._lock:
+      now = time.monotonic()
+      wait = max(0.0, self._paused_until - now)
+      if self.rate > 0:
+        self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        if self._tokens < 0:
+          wait = max(wait, -self._tokens / self.rate)
+      return wait
+
+  def acquire(self) -> None:
+    """Blocks until a request may be sent."""
+    wait = self.reserve()
+    if wait > 0:
+      time.sleep(wait)
+
+  def pause(self, seconds: float) -> None:
+    """Holds back all requests for `seconds`, e.g. after the server asked to back off with Retry-After."""
+    with self._lock:
+      self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class RetryPolicy(object):
+  """Decides whether a failed request is retried and how long to wait before.
+
+  Delays grow exponentially from `backoff` up to `max_backoff` with full jitter. A Retry-After header sent by the server
+  is a lower bound for the delay and pauses the rate limiter, so the other workers back off as well. `budget` limits the
+  retries of all requests together, so a dead API does not multiply the requests of a bulk operation.
+  """
+
+  def __init__(self, max_retries: int = RETRY_MAX, backoff: float = RETRY_BACKOFF,
+               max_backoff: float = RETRY_MAX_BACKOFF, budget: Optional[int] = RETRY_BUDGET,
+               rate_limiter: Optional[TokenBucket] = None,
+               retry_status: Iterable[int] = RETRY_STATUS, idempotent_methods: Iterable[str] = IDEMPOTENT_METHODS):
+    self.max_retries = max_retries
+    self.backoff = backoff
+    self.max_backoff = max_backoff
+    self.budget = budget
+    self.rate_limiter = rate_limiter
+    self.retry_status = frozenset(retry_status)
+    self.idempotent_methods = frozenset(method.upper() for method in idempotent_methods)
+    self.retries = 0
+    self._lock = threading.Lock()
+
+  def reset(self) -> None:
+    """Restores the full retry budget, e.g. before the next command of `sen2cli shell`."""
+    with self._lock:
+      self.retries = 0
+
+  def _retryable(self, method: str, status: Optional[int], retry_after: Optional[str]) -> bool:
+    if status == 429 or (status in THROTTLED_STATUS and not retry_after is None):
+      return True
+    ## status is None for connection errors / timeouts
+    return method.upper() in self.idempotent_methods and (status is None or status in self.retry_status)
+
+  def deleted_by_earlier_attempt(self, method: str, status: Optional[int], attempt: int) -> bool:
+    """
+    True if a retried DELETE got 404. DELETE is retried after connection errors, so an earlier attempt may have deleted
+    the resource on the server and only its response was lost. The delete then succeeded and must not count as failed.
+    """
+    return attempt > 0 and method.upper() == 'DELETE' and status == 404
+
+  def next_delay(self, method: str, status: Optional[int], attempt: int,
+                 retry_after: Optional[str] = None) -> Optional[float]:
+    """
+    Delay in seconds before retrying a request or None if it must not be retried.
+
+    :param method: HTTP method of the request.
+    :param status: HTTP status of the response. None if no response was received.
+    :param attempt: Number of retries of this request so far.
+    :param retry_after: Value of the Retry-After response header.
+    """
+    if not self._retryable(method, status, retry_after) or attempt >= self.max_retries:
+      return None
+    with self._lock:
+      if not self.budget is None and self.retries >= self.budget:
+        logger.warning(f"Retry budget of {self.budget} retries exhausted. Not retrying {method} ({status}).")
+        return None
+      self.retries += 1
+
+    delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+    server_delay = parse_retry_after(retry_after)
+    if not server_delay is None:
+      delay = max(delay, server_delay)
+      if not self.rate_limiter is None:
+        self.rate_limiter.pause(server_delay)
+    logger.warning(f"{method} failed ({status or 'no response'}). Retry {attempt + 1}/{self.max_retries} "
+                   f"in {delay:.2f}s")
+    return delay
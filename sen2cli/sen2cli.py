@@ -1,23 +1,69 @@
 # Sen2Commandline Interface
 # Simple commandline interface for Sen2Cube backend via JSONApi
+import importlib
 import logging
 import os.path
+from typing import Dict, List, Optional
 
 import click
 
 from  .__version__ import __version__
-from .env import CONFIG_PATH
-from .inference import cli as inference_cli
-from .session import cli as session_cli
+from .client import Sen2CubeClient
+from .env import CONFIG_PATH, DEFAULT_POOL_SIZE, RATE_LIMIT, RETRY_MAX
+from .timings import Timings
 from .utils import configure_logging
 
 
-@click.group()
+class LazyGroup(click.Group):
+  """click Group that imports the modules of its subcommand groups only when they are invoked or listed."""
+
+  def __init__(self, *args, lazy_subcommands: Dict[str, str] = None, **kwargs):
+    super().__init__(*args, **kwargs)
+    ## command name -> 'module.path.attribute'
+    self.lazy_subcommands = {} if lazy_subcommands is None else lazy_subcommands
+
+  def list_commands(self, ctx: click.Context) -> List[str]:
+    return sorted(super().list_commands(ctx) + list(self.lazy_subcommands))
+
+  def get_command(self, ctx: click.Context, cmd_name: str) -> Optional[click.Command]:
+    if cmd_name in self.lazy_subcommands:
+      module_name, attribute = self.lazy_subcommands[cmd_name].rsplit('.', 1)
+      return getattr(importlib.import_module(module_name), attribute)
+    return super().get_command(ctx, cmd_name)
+
+
+@click.group(cls=LazyGroup, lazy_subcommands={
+  'inference': 'sen2cli.inference.cli.inference',
+  'session': 'sen2cli.session.cli.session',
+  'shell': 'sen2cli.shell.shell',
+})
 @click.option('--log_file', type=click.Path(dir_okay=False, writable=True),
               help="Write log to this file instead of StdErr.")
 @click.option('-v', '--verbose', count=True,
               help="Verbose log output. Can be added up to three times for even more verbosity (WARNING, INFO, DEBUG).")
-def cli(log_file, verbose: int):
+@click.option('--pool_size', help="Maximum number of kept-alive HTTP connections per host.",
+              envvar="S2C_POOL_SIZE", show_envvar=True,
+              type=click.IntRange(min=1), default=DEFAULT_POOL_SIZE, show_default=True)
+@click.option('--async', 'use_async', help="Use the asyncio engine for inference commands (many requests in flight on "
+                                           "a single thread).",
+              envvar="S2C_ASYNC", show_envvar=True, type=click.BOOL, default=False, is_flag=True)
+@click.option('--rate_limit', help="Maximum number of requests per second sent to the API (0 = unlimited).",
+              envvar="S2C_RATE_LIMIT", show_envvar=True,
+              type=click.FloatRange(min=0), default=RATE_LIMIT, show_default=True)
+@click.option('--retries', 'max_retries', help="Retries per request after HTTP 429 / 502 / 503 / 504 or connection "
+                                               "errors, with exponential backoff. 0 to disable.",
+              envvar="S2C_RETRIES", show_envvar=True,
+              type=click.IntRange(min=0), default=RETRY_MAX, show_default=True)
+@click.option('--timings', help="Print a JSON report of phase and HTTP request timings, status codes and payload sizes "
+                                "to StdErr on exit.",
+              type=click.BOOL, default=False, is_flag=True)
+@click.option('--timings_file', type=click.Path(dir_okay=False, writable=True),
+              help="Write the --timings report to this file instead of StdErr. Implies --timings.")
+@click.option('--profile', 'profile_file', type=click.Path(dir_okay=False, writable=True),
+              help="Run the command under cProfile and dump the stats to this file (see `python -m pstats`).")
+@click.pass_context
+def cli(ctx: click.Context, log_file, verbose: int, pool_size: int, use_async: bool, rate_limit: float,
+        max_retries: int, timings: bool, timings_file, profile_file):
   log_level = logging.ERROR
   if verbose >= 3:
     log_level = logging.DEBUG
@@ -30,9 +76,26 @@ def cli(log_file, verbose: int):
   if not os.path.isdir(CONFIG_PATH):
     os.mkdir(CONFIG_PATH)
 
+  if not profile_file is None:
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+    def _dump_profile():
+      profiler.disable()
+      profiler.dump_stats(profile_file)
+
+    ctx.call_on_close(_dump_profile)
+
+  if ctx.obj is None:
+    collector = Timings() if timings or not timings_file is None else None
+    if not collector is None:
+      ctx.call_on_close(lambda: collector.write(timings_file))
+    ctx.obj = Sen2CubeClient(pool_size=pool_size, use_async=use_async, timings=collector, rate_limit=rate_limit,
+                             max_retries=max_retries)
+    ctx.call_on_close(ctx.obj.close)
+
 @cli.command(help="Prints program version")
 def version():
   click.echo(f"{__version__}")
 
-cli.add_command(session_cli.session)
-cli.add_command(inference_cli.inference)
@@ -4,12 +4,13 @@ import logging
 from datetime import datetime
 
 import click
-from ..env import AUTH_CLIENT_ID, AUTH_TOKEN_URL, CONFIG_PATH_TOKENFILE
-
-from .oauth_util import fetch_token, get_user_info, load_token, refresh_token, save_token
+from ..client import Sen2CubeClient, client_config
+from ..env import AUTH_CLIENT_ID, AUTH_TOKEN_URL, AUTH_USER_INFO_URL, CONFIG_PATH_TOKENFILE
 
 logger = logging.getLogger(__name__)
 
+## oauth_util imports requests_oauthlib / oauthlib. It is imported inside the commands to keep `--help` fast.
+
 
 class SessionCommandConfig(object):
   def __init__(self):
@@ -37,6 +38,7 @@ def session(session_command_config, tokenfile):
               show_envvar=True)
 @session_command_config
 def login(session_command_config, username, password):
+  from .oauth_util import fetch_token, save_token
   click.echo(f"Trying to authenticate against {AUTH_TOKEN_URL} with client {AUTH_CLIENT_ID}")
   token = fetch_token(username, password, auth_token_url=AUTH_TOKEN_URL, auth_client_id=AUTH_CLIENT_ID)
   if not token is None:
@@ -48,19 +50,33 @@ def login(session_command_config, username, password):
 @session.command(help="Use saved refresh token to refresh session")
 @session_command_config
 def refresh(session_command_config):
-  token = load_token(session_command_config.tokenfile)
-  if token is None:
+  from .oauth_util import load_token, refresh_token, save_token, token_file_lock
+  tokenfile = session_command_config.tokenfile
+  if load_token(tokenfile) is None:
     click.echo("Could not load session token.")
-  else:
-    token = refresh_token(token, auth_token_url=AUTH_TOKEN_URL, auth_client_id=AUTH_CLIENT_ID)
-    if not token is None:
-      expires_at = datetime.fromtimestamp(token['expires_at'])
-      click.echo(f"Refresh successful. Session expires at {expires_at}")
-      save_token(session_command_config.tokenfile, token)
+    return
+  ## same lock as the auto refresh of Sen2CubeClient.load_token, so a running command does not refresh concurrently
+  try:
+    with token_file_lock(tokenfile):
+      # Another process might have refreshed (and rotated the refresh token) while we were waiting for the lock.
+      token = load_token(tokenfile)
+      if token is None:
+        click.echo("Could not load session token.")
+        return
+      token = refresh_token(token, auth_token_url=AUTH_TOKEN_URL, auth_client_id=AUTH_CLIENT_ID)
+      if not token is None:
+        save_token(tokenfile, token)
+  except TimeoutError as e:
+    raise click.ClickException(str(e))
+  if not token is None:
+    expires_at = datetime.fromtimestamp(token['expires_at'])
+    click.echo(f"Refresh successful. Session expires at {expires_at}")
 
 @session.command(help="Show info for current session")
+@client_config
 @session_command_config
-def info(session_command_config):
+def info(session_command_config, client: Sen2CubeClient):
+  from .oauth_util import get_cached_user_info, load_token
   token = load_token(session_command_config.tokenfile)
 
   if token is None:
@@ -75,7 +91,7 @@ def info(session_command_config):
         click.echo(f"Token expired on: {expires_at}")
         click.echo(f"Refresh until:    {refresh_until}")
     else:
-      user_info = get_user_info(token)
+      user_info = get_cached_user_info(token, session_command_config.tokenfile, client.http_session(AUTH_USER_INFO_URL))
       click.echo(f"Logged in as:  {user_info['preferred_username']}")
       click.echo(f"Expires at:    {expires_at}")
       click.echo(f"Refresh until: {refresh_until}")
@@ -1,15 +1,20 @@
+import base64
+import hashlib
 import json
 import logging
 import os
+import tempfile
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Final
+from typing import Final, Iterator, Optional
 
 from oauthlib.oauth2 import InvalidGrantError, LegacyApplicationClient, OAuth2Token, \
   UnauthorizedClientError
-from requests import Response
+from requests import Response, Session
 from requests_oauthlib import OAuth2Session
 
-from ..env import AUTH_CLIENT_ID, AUTH_USER_INFO_URL
+from ..env import AUTH_CLIENT_ID, AUTH_LOCK_TIMEOUT, AUTH_REFRESH_SKEW, AUTH_USER_INFO_URL
 
 logger = logging.getLogger(__name__)
 
@@ -95,30 +100,113 @@ def load_token(token_file_path: str) -> OAuth2Token:
 
 
 def save_token(token_file_path: str, token: OAuth2Token) -> None:
-  ## TODO(SR) make sure this file is set correctly to only be readable by current user
-  with open(token_file_path, 'w') as tokenfile:
-    json.dump(token, tokenfile)
+  """
+  Atomically write token to tokenfile. Readers will either see the old or the new token, never a partial file.
+  The tokenfile is only readable by the current user.
+  """
+  token_dir = os.path.dirname(os.path.abspath(token_file_path))
+  fd, tmp_path = tempfile.mkstemp(dir=token_dir, prefix='.token.', suffix='.tmp')
+  try:
+    with os.fdopen(fd, 'w') as tokenfile:
+      json.dump(token, tokenfile)
+      tokenfile.flush()
+      os.fsync(tokenfile.fileno())
+    os.chmod(tmp_path, 0o600)
+    os.replace(tmp_path, token_file_path)
+  except BaseException:
+    os.unlink(tmp_path)
+    raise
+
+
+@contextmanager
+def token_file_lock(token_file_path: str, timeout: int = AUTH_LOCK_TIMEOUT) -> Iterator[None]:
+  """
+  Exclusive inter-process lock for the tokenfile, held in a separate `.lock` file.
+
+  :param timeout: Seconds to wait for the lock before giving up with a TimeoutError.
+  """
+  lock_fd = os.open(f"{token_file_path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+  try:
+    deadline = time.monotonic() + timeout
+    while True:
+      try:
+        _lock_file(lock_fd)
+        break
+      except OSError:
+        if time.monotonic() > deadline:
+          raise TimeoutError(f"Could not lock tokenfile {token_file_path} within {timeout}s")
+        time.sleep(0.05)
+    try:
+      yield
+    finally:
+      _unlock_file(lock_fd)
+  finally:
+    os.close(lock_fd)
+
+
+if os.name == 'nt':
+  import msvcrt
+
+  def _lock_file(fd: int) -> None:
+    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+
+  def _unlock_file(fd: int) -> None:
+    os.lseek(fd, 0, os.SEEK_SET)
+    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+  import fcntl
+
+  def _lock_file(fd: int) -> None:
+    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+  def _unlock_file(fd: int) -> None:
+    fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def _expires_within(token: OAuth2Token, seconds: int) -> bool:
+  return time.time() + seconds >= token['expires_at']
 
 
 def load_or_refresh_token(token_file_path: str, auth_token_url: str, auth_client_id: str,
-                          save: bool = True) -> OAuth2Token:
+                          save: bool = True, refresh_skew: int = AUTH_REFRESH_SKEW) -> OAuth2Token:
+  """
+  Load token from tokenfile and refresh it if it expires within the next `refresh_skew` seconds.
+
+  Refreshing is coordinated between processes with a lock on the tokenfile: only one process refreshes, all others
+  wait for it and reuse the token it saved.
+
+  :return: OAuth2Token with session information or None if there is no valid session.
+  """
   token = load_token(token_file_path)
-  if token is not None and len(token) > 0:
-    if datetime.now() > datetime.fromtimestamp(token['expires_at']):
-      logger.info("Token expired. Trying refresh.")
-      token = refresh_token(token, auth_token_url, auth_client_id)
-      if save:
-        save_token(token_file_path, token)
+  if token is not None and len(token) > 0 and _expires_within(token, refresh_skew):
+    with token_file_lock(token_file_path):
+      # Another process might have refreshed the token while we were waiting for the lock.
+      token = load_token(token_file_path)
+      if token is not None and _expires_within(token, refresh_skew):
+        logger.info("Token expires soon. Trying refresh.")
+        refreshed_token = refresh_token(token, auth_token_url, auth_client_id)
+        if refreshed_token is not None:
+          if save:
+            save_token(token_file_path, refreshed_token)
+          token = refreshed_token
+        elif _expires_within(token, 0):
+          token = None
   return token
 
 
-def get_user_info(token: OAuth2Token) -> dict:
+def get_user_info(token: OAuth2Token, http_session: Session = None) -> dict:
   """
   Checks if token is still valid.
 
   :param token: OAuth2Token with session
+  :param http_session: Optional (pooled) requests Session to send the request with.
   :return: User Info
   """
+  if http_session is not None:
+    user_info: Response = http_session.get(AUTH_USER_INFO_URL,
+                                           headers={'Authorization': f"{token['token_type']} {token['access_token']}"})
+    return user_info.json() if user_info.ok else None
+
   client: Final[LegacyApplicationClient] = LegacyApplicationClient(client_id=AUTH_CLIENT_ID)
   with OAuth2Session(client=client, token=token) as oauth_session:
     user_info: Response = oauth_session.get(AUTH_USER_INFO_URL)
@@ -127,3 +215,67 @@ def get_user_info(token: OAuth2Token) -> dict:
       return user_info_json
     else:
       return None
+
+
+def _jwt_claims(access_token: str) -> Optional[dict]:
+  """
+  Decodes the claims of a JWT access token without verifying it. The API verifies the token on every request, this
+  is only used to read the identity locally.
+
+  :return: Claims or None if the token is not a JWT.
+  """
+  try:
+    payload = access_token.split('.')[1]
+    return json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+  except Exception:
+    logger.debug("Access token is not a JWT.")
+    return None
+
+
+def user_info_file_path(token_file_path: str) -> str:
+  """Path of the user info cache that belongs to a tokenfile."""
+  return f"{os.path.splitext(token_file_path)[0]}.userinfo.json"
+
+
+def _access_token_hash(token: OAuth2Token) -> str:
+  return hashlib.sha256(token['access_token'].encode()).hexdigest()
+
+
+def get_cached_user_info(token: OAuth2Token, token_file_path: str, http_session: Session = None) -> dict:
+  """
+  Get user info without asking the auth server whenever possible.
+
+  The identity is read from the claims of the access token. If the token does not carry `preferred_username`, a
+  cache next to the tokenfile is used, which is valid as long as the access token it was fetched for. Only if both
+  are missing or stale the user info endpoint is called and the cache is renewed.
+
+  :param token: OAuth2Token with session
+  :param token_file_path: Tokenfile the cache belongs to.
+  :param http_session: Optional (pooled) requests Session to send the request with.
+  :return: User Info
+  """
+  claims = _jwt_claims(token['access_token'])
+  if claims is not None and 'preferred_username' in claims:
+    logger.debug("Using user info from access token claims.")
+    return claims
+
+  cache_file_path = user_info_file_path(token_file_path)
+  if os.path.isfile(cache_file_path):
+    try:
+      with open(cache_file_path, 'r') as cache_file:
+        cache: dict = json.load(cache_file)
+      if cache.get('access_token_hash') == _access_token_hash(token) and time.time() < cache.get('expires_at', 0):
+        logger.debug(f"Using cached user info from {cache_file_path}")
+        return cache['user_info']
+    except (ValueError, KeyError):
+      logger.warning(f"User info cache was invalid: {cache_file_path}")
+
+  user_info = get_user_info(token, http_session)
+  if user_info is not None:
+    with open(os.open(cache_file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as cache_file:
+      json.dump({
+        'access_token_hash': _access_token_hash(token),
+        'expires_at': token['expires_at'],
+        'user_info': user_info,
+      }, cache_file)
+  return user_info
@@ -0,0 +1,107 @@
+# Sen2CLI interactive shell
+# Runs `inference` / `session` commands one after another in a single process, so the imports, the session token, the
+# user info and the pooled connections of the Sen2CubeClient are reused by all commands.
+import logging
+import shlex
+from typing import List
+
+import click
+
+from .client import Sen2CubeClient, client_config
+from .env import CONFIG_PATH_SHELL_HISTORY
+
+logger = logging.getLogger(__name__)
+
+## Commands of the top level group that can be run in the shell. Global options are taken from the shell invocation.
+SHELL_COMMANDS: List[str] = ['inference', 'session', 'version']
+EXIT_COMMANDS: List[str] = ['exit', 'quit']
+PROMPT: str = 'sen2cli> '
+
+
+def _load_history(history_file: str) -> bool:
+  """Enables line editing and the command history if readline is available (not on Windows)."""
+  try:
+    import readline
+  except ImportError:
+    return False
+  try:
+    readline.read_history_file(history_file)
+  except OSError:
+    pass
+  return True
+
+
+def _save_history(history_file: str) -> None:
+  import readline
+  try:
+    readline.write_history_file(history_file)
+  except OSError as e:
+    logger.warning(f"Could not write shell history to {history_file}. Reason: {e}")
+
+
+def run_line(client: Sen2CubeClient, line: str) -> int:
+  """
+  Runs one line of the shell as sen2cli command with the shared client.
+
+  :return: Exit code of the command.
+  """
+  from .sen2cli import cli
+  try:
+    args = shlex.split(line, comments=True)
+  except ValueError as e:
+    click.echo(f"Error: {e}", err=True)
+    return 2
+  if len(args) == 0:
+    return 0
+  if not args[0] in SHELL_COMMANDS:
+    click.echo(f"Unknown command '{args[0]}'. Available: {', '.join(SHELL_COMMANDS + EXIT_COMMANDS)}. "
+               f"Add --help to a command for its options.", err=True)
+    return 2
+  client.retry_policy.reset()
+  try:
+    ## standalone_mode=False returns the exit code of ctx.exit() instead of exiting the shell
+    result = cli.main(args, prog_name='sen2cli', standalone_mode=False, obj=client)
+    return result if isinstance(result, int) else 0
+  except click.ClickException as e:
+    e.show()
+    return e.exit_code
+  except click.Abort:
+    click.echo("Aborted!", err=True)
+    return 1
+  except KeyboardInterrupt:
+    click.echo("Interrupted.", err=True)
+    return 130
+
+
+@click.command(help="Interactive shell for `inference` and `session` commands. The session token, the user info and "
+                    "the HTTP connections are kept across commands. Commands can also be piped in, one per line.")
+@click.option('--history_file', help="Command history of the shell.", envvar="S2C_SHELL_HISTORY", show_envvar=True,
+              type=click.Path(dir_okay=False, writable=True), default=CONFIG_PATH_SHELL_HISTORY)
+@client_config
+@click.pass_context
+def shell(ctx: click.Context, client: Sen2CubeClient, history_file: str):
+  ## fetched once: every call wraps StdIn anew and lines read ahead by the previous wrapper would be lost
+  stdin = click.get_text_stream('stdin')
+  interactive = stdin.isatty()
+  with_history = interactive and _load_history(history_file)
+  exit_code = 0
+  try:
+    while True:
+      try:
+        ## input() uses readline for line editing and history if it is loaded
+        line = input(PROMPT) if interactive else stdin.readline()
+      except KeyboardInterrupt:
+        click.echo()
+        continue
+      except EOFError:
+        click.echo()
+        break
+      if not interactive and line == '':
+        break
+      if line.strip() in EXIT_COMMANDS:
+        break
+      exit_code = run_line(client, line)
+  finally:
+    if with_history:
+      _save_history(history_file)
+  ctx.exit(exit_code)
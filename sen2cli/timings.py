@@ -0,0 +1,148 @@
+# Timing instrumentation behind the global --timings option
+# Records the duration of the phases of a command (token refresh, userinfo, listing, committing, rendering) and of
+# every HTTP request, and writes them as one JSON report when the command exits.
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional
+
+if TYPE_CHECKING:
+  import aiohttp
+  import requests
+
+
+class Timings(object):
+  """Collects phase and HTTP request timings of one sen2cli invocation.
+
+  Phases can be nested. Every phase reports its total duration and its self time, i.e. the total minus the time spent
+  in nested phases. Phases are tracked per thread, so phases of worker threads do not nest into the main thread.
+  """
+
+  def __init__(self):
+    self.started = time.perf_counter()
+    self._lock = threading.Lock()
+    self._local = threading.local()
+    self._phases: Dict[str, Dict[str, float]] = {}
+    self._requests: List[Dict[str, Any]] = []
+
+  def _stack(self) -> List[List[float]]:
+    stack = getattr(self._local, 'stack', None)
+    if stack is None:
+      stack = self._local.stack = []
+    return stack
+
+  @contextmanager
+  def phase(self, name: str) -> Iterator[None]:
+    """Context manager that adds the time spent in its body to the phase `name`."""
+    stack = self._stack()
+    ## time spent in nested phases
+    frame = [0.0]
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      duration = time.perf_counter() - start
+      stack.pop()
+      if len(stack) > 0:
+        stack[-1][0] += duration
+      with self._lock:
+        phase = self._phases.setdefault(name, {'count': 0, 'total_s': 0.0, 'self_s': 0.0})
+        phase['count'] += 1
+        phase['total_s'] += duration
+        phase['self_s'] += duration - frame[0]
+
+  def timed_iter(self, name: str, iterable: Iterable) -> Iterator:
+    """Iterates over iterable and adds the time spent waiting for the next item to the phase `name`. Useful for lazy
+    iterators that fetch from the API while their items are written out."""
+    iterator = iter(iterable)
+    while True:
+      with self.phase(name):
+        try:
+          item = next(iterator)
+        except StopIteration:
+          return
+      yield item
+
+  def record_request(self, method: str, url: str, status: Optional[int], elapsed_s: float,
+                     bytes_sent: Optional[int], bytes_received: Optional[int]) -> None:
+    with self._lock:
+      self._requests.append({
+        'method': method,
+        'url': url,
+        'status': status,
+        'elapsed_s': elapsed_s,
+        'bytes_sent': bytes_sent,
+        'bytes_received': bytes_received,
+      })
+
+  def response_hook(self, response: 'requests.Response', *args, **kwargs) -> None:
+    """requests response hook. elapsed is the time until the response headers were parsed. The body of streamed
+    responses is not read, its size is taken from the Content-Length header."""
+    request = response.request
+    body = request.body
+    if kwargs.get('stream'):
+      length = response.headers.get('Content-Length')
+      bytes_received = None if length is None else int(length)
+    else:
+      bytes_received = len(response.content)
+    self.record_request(request.method, request.url, response.status_code, response.elapsed.total_seconds(),
+                        0 if body is None else len(body), bytes_received)
+
+  def trace_config(self) -> 'aiohttp.TraceConfig':
+    """aiohttp TraceConfig that records every request of an aiohttp.ClientSession."""
+    import aiohttp
+
+    async def on_request_start(session, context, params):
+      context.started = time.perf_counter()
+      context.bytes_sent = 0
+
+    async def on_request_chunk_sent(session, context, params):
+      context.bytes_sent += len(params.chunk)
+
+    async def on_request_end(session, context, params):
+      self.record_request(params.method, str(params.url), params.response.status,
+                          time.perf_counter() - context.started, context.bytes_sent, params.response.content_length)
+
+    async def on_request_exception(session, context, params):
+      self.record_request(params.method, str(params.url), None, time.perf_counter() - context.started,
+                          context.bytes_sent, None)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_chunk_sent.append(on_request_chunk_sent)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+  def report(self) -> dict:
+    """Machine readable summary of all recorded timings."""
+    with self._lock:
+      requests = list(self._requests)
+      phases = {name: dict(phase) for name, phase in self._phases.items()}
+    status_codes: Dict[str, int] = {}
+    for request in requests:
+      status_codes[str(request['status'])] = status_codes.get(str(request['status']), 0) + 1
+    return {
+      'command': sys.argv[1:],
+      'wall_s': time.perf_counter() - self.started,
+      'phases': phases,
+      'http': {
+        'requests': len(requests),
+        'elapsed_s': sum(request['elapsed_s'] for request in requests),
+        'bytes_sent': sum(request['bytes_sent'] or 0 for request in requests),
+        'bytes_received': sum(request['bytes_received'] or 0 for request in requests),
+        'status_codes': status_codes,
+      },
+      'requests': requests,
+    }
+
+  def write(self, path: Optional[str] = None) -> None:
+    """Writes the report as JSON to path or to StdErr if path is None."""
+    if path is None:
+      sys.stderr.write(json.dumps(self.report()) + '\n')
+    else:
+      with open(path, 'w') as report_file:
+        json.dump(self.report(), report_file, indent=2)
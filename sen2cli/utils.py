@@ -1,13 +1,18 @@
 # Sen2CLI utility functions
 import io
+import json
 import logging
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from csv import DictWriter
-from typing import Final, List, Union
-
-from jsonapi_client.resourceobject import ResourceObject
+from typing import TYPE_CHECKING, Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Deque, Final, Iterable, \
+  Iterator, List, Optional, Set, TextIO, Tuple, Union
 
 from .env import DEFAULT_DELIMITER
 
+if TYPE_CHECKING:
+  from jsonapi_client.resourceobject import ResourceObject
+
 logger = logging.getLogger(__name__)
 
 
@@ -36,26 +41,92 @@ def configure_logging(log_file: str = None, log_level: int = logging.WARNING) ->
       handlers=log_handlers
   )
 
-def _get_or_none(res: ResourceObject, field_name: str) -> any:
+def _get_or_none(res: 'ResourceObject', field_name: str) -> any:
   try:
     return res[field_name]
   except KeyError as e:
     logger.warning(f"Could not find '{field_name}' in Resource. Returning none.")
     return None
 
-def dict_from_resource(res: ResourceObject, columns: List[str]) -> dict:
+def dict_from_resource(res: 'ResourceObject', columns: List[str]) -> dict:
   resource_id = {'id': res.id}
   ret = {col: _get_or_none(res, col) for col in columns}
   return {**resource_id, **ret}
 
 
+def write_csv(rows: Iterable[dict], stream: TextIO, with_headers: bool = True, flush: bool = True) -> int:
+  """Writes rows as CSV to stream as they are produced by the iterable.
+
+  The header is taken from the keys of the first row. Nothing is written for an empty iterable.
+  Args:
+    rows (Iterable[dict]): rows to write. Can be a lazy iterable.
+    stream (TextIO): stream to write to.
+    with_headers (bool): write a header line before the first row.
+    flush (bool): flush the stream after every row.
+  Returns:
+    Number of rows written.
+  """
+  csv_writer = None
+  row_count = 0
+  for row in rows or []:
+    if csv_writer is None:
+      csv_writer = DictWriter(stream, fieldnames=row.keys(), delimiter=DEFAULT_DELIMITER)
+      if with_headers:
+        csv_writer.writeheader()
+    csv_writer.writerow(row)
+    row_count += 1
+    if flush:
+      stream.flush()
+  return row_count
+
+
+def write_ndjson(rows: Iterable[dict], stream: TextIO, flush: bool = True) -> int:
+  """Writes rows as newline delimited JSON to stream as they are produced by the iterable.
+  Args:
+    rows (Iterable[dict]): rows to write. Can be a lazy iterable.
+    stream (TextIO): stream to write to.
+    flush (bool): flush the stream after every row.
+  Returns:
+    Number of rows written.
+  """
+  row_count = 0
+  for row in rows or []:
+    stream.write(json.dumps(row, default=str))
+    stream.write('\n')
+    row_count += 1
+    if flush:
+      stream.flush()
+  return row_count
+
+
+def write_json(rows: Iterable[dict], stream: TextIO, flush: bool = True) -> int:
+  """Writes rows as one JSON array to stream as they are produced by the iterable.
+
+  Every row is written on its own line, so the output can be streamed and still is a single valid JSON document.
+  Args:
+    rows (Iterable[dict]): rows to write. Can be a lazy iterable.
+    stream (TextIO): stream to write to.
+    flush (bool): flush the stream after every row.
+  Returns:
+    Number of rows written.
+  """
+  row_count = 0
+  stream.write('[')
+  for row in rows or []:
+    stream.write(',\n' if row_count > 0 else '\n')
+    stream.write(json.dumps(row, default=str))
+    row_count += 1
+    if flush:
+      stream.flush()
+  stream.write('\n]\n' if row_count > 0 else ']\n')
+  stream.flush()
+  return row_count
+
+
 def csv_from_dictlist(list: List[dict], with_headers: bool = True) -> str:
   if not list is None and len(list) > 0:
     with io.StringIO() as csv_string:
-      csv_writer = DictWriter(csv_string, fieldnames=list[0].keys(), delimiter=DEFAULT_DELIMITER)
-      if with_headers:
-        csv_writer.writeheader()
-      csv_writer.writerows(list)
+      write_csv(list, csv_string, with_headers=with_headers, flush=False)
       return csv_string.getvalue()
 
 
@@ -85,3 +156,153 @@ def filter_string_from_parameter(column: str, value: Union[str, int, List, tuple
   else:
     logger.error(f"Type not supported: {type(value)}")
     return None
+
+
+def map_concurrent(func: Callable[[Any], Any],
+                   items: Iterable[Any],
+                   concurrency: int = 1,
+                   ordered: bool = True) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+  """Applies func to every item on a bounded thread pool.
+
+  At most `concurrency` calls are in flight at any time and items are only pulled from the iterable when a worker
+  becomes free, so arbitrarily large (lazy) iterables can be processed. Exceptions raised by func are caught and
+  returned per item instead of aborting the whole run.
+
+  Args:
+    func (Callable): Function to apply. Called with a single item.
+    items (Iterable): Items to process.
+    concurrency (int): Maximum number of parallel calls. 1 runs everything in the calling thread.
+    ordered (bool): If True, results are yielded in the order of `items`. Otherwise as soon as they complete.
+
+  Yields:
+    Tuple of (item, result, exception). Either result or exception is None.
+  """
+  if concurrency <= 1:
+    for item in items:
+      try:
+        yield item, func(item), None
+      except Exception as e:
+        yield item, None, e
+    return
+
+  def _result(item: Any, future: Future) -> Tuple[Any, Any, Optional[Exception]]:
+    error = future.exception()
+    return item, None if error is not None else future.result(), error
+
+  item_iter = iter(items)
+  with ThreadPoolExecutor(max_workers=concurrency) as executor:
+    if ordered:
+      in_flight: Deque[Tuple[Any, Future]] = deque()
+      for item in item_iter:
+        in_flight.append((item, executor.submit(func, item)))
+        if len(in_flight) >= concurrency:
+          yield _result(*in_flight.popleft())
+      while in_flight:
+        yield _result(*in_flight.popleft())
+    else:
+      pending: Set[Future] = set()
+      future_items = {}
+      exhausted = False
+      while not exhausted or pending:
+        while not exhausted and len(pending) < concurrency:
+          try:
+            item = next(item_iter)
+          except StopIteration:
+            exhausted = True
+            break
+          future = executor.submit(func, item)
+          future_items[future] = item
+          pending.add(future)
+        if pending:
+          done, pending = wait(pending, return_when=FIRST_COMPLETED)
+          for future in done:
+            yield _result(future_items.pop(future), future)
+
+
+async def map_concurrent_async(func: Callable[[Any], Awaitable[Any]],
+                               items: Union[Iterable[Any], AsyncIterable[Any]],
+                               concurrency: int = 1,
+                               ordered: bool = True) -> AsyncIterator[Tuple[Any, Any, Optional[Exception]]]:
+  """Asyncio version of map_concurrent. Awaits func for every item with at most `concurrency` calls in flight.
+
+  Args:
+    func (Callable): Coroutine function to apply. Called with a single item.
+    items (Iterable | AsyncIterable): Items to process.
+    concurrency (int): Maximum number of parallel calls.
+    ordered (bool): If True, results are yielded in the order of `items`. Otherwise as soon as they complete.
+
+  Yields:
+    Tuple of (item, result, exception). Either result or exception is None.
+  """
+  import asyncio
+
+  async def _run(item: Any) -> Tuple[Any, Any, Optional[Exception]]:
+    try:
+      return item, await func(item), None
+    except Exception as e:
+      return item, None, e
+
+  async def _aiter(iterable):
+    if hasattr(iterable, '__aiter__'):
+      async for item in iterable:
+        yield item
+    else:
+      for item in iterable:
+        yield item
+
+  in_flight: Deque[asyncio.Future] = deque()
+  pending: Set[asyncio.Future] = set()
+  async for item in _aiter(items):
+    task = asyncio.ensure_future(_run(item))
+    if ordered:
+      in_flight.append(task)
+      if len(in_flight) >= concurrency:
+        yield await in_flight.popleft()
+    else:
+      pending.add(task)
+      if len(pending) >= concurrency:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for finished in done:
+          yield finished.result()
+  while in_flight:
+    yield await in_flight.popleft()
+  while pending:
+    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    for finished in done:
+      yield finished.result()
+
+
+async def merge_sorted_async(iterators: List[AsyncIterator[Any]],
+                             key: Callable[[Any], Any] = None) -> AsyncIterator[Any]:
+  """Asyncio version of heapq.merge. Merges already sorted async iterators into one sorted async iterator.
+
+  Args:
+    iterators (List[AsyncIterator]): Async iterators, each sorted by key.
+    key (Callable): Key function like for sorted. None to compare the items themselves.
+
+  Yields:
+    Items of all iterators in key order.
+  """
+  import heapq
+
+  key = (lambda item: item) if key is None else key
+  heap: List[Tuple[Any, int, Any]] = []
+
+  async def _push(index: int) -> None:
+    try:
+      item = await iterators[index].__anext__()
+    except StopAsyncIteration:
+      return
+    heapq.heappush(heap, (key(item), index, item))
+
+  try:
+    for index in range(len(iterators)):
+      await _push(index)
+    while heap:
+      _, index, item = heapq.heappop(heap)
+      yield item
+      await _push(index)
+  finally:
+    for iterator in iterators:
+      if hasattr(iterator, 'aclose'):
+        await iterator.aclose()
@@ -25,7 +25,8 @@ REQUIRED = [
 
 # What packages are optional?
 EXTRAS = {
-  # 'fancy feature': ['django'],
+  # Arrow IPC / Parquet output (-f arrow / -f parquet)
+  'arrow': ['pyarrow>=6.0'],
 }
 
 SETUP_REQUIRED = [